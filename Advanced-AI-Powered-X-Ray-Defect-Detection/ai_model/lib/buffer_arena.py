@@ -0,0 +1,43 @@
+# Scratch buffer arena
+# Keeps one set of working arrays per thread so repeated analyses reuse memory
+import numpy as np
+import threading
+
+
+class BufferArena:
+    """Per-thread named scratch arrays, reallocated only when shape or dtype changes"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.allocated_bytes = 0
+
+    def get(self, name, shape, dtype):
+        """Return the calling thread's buffer for name; contents are undefined"""
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+
+        buffer = buffers.get(name) if self.enabled else None
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            if self.enabled:
+                buffers[name] = buffer
+            with self._lock:
+                self.allocations += 1
+                self.allocated_bytes += buffer.nbytes
+        return buffer
+
+    def resident_bytes(self):
+        """Bytes currently held by the calling thread's buffers"""
+        buffers = getattr(self._local, 'buffers', {})
+        return sum(buffer.nbytes for buffer in buffers.values())
+
+    def reset_stats(self):
+        with self._lock:
+            self.allocations = 0
+            self.allocated_bytes = 0
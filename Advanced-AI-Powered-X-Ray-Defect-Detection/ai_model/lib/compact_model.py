@@ -0,0 +1,85 @@
+# Compact inference runtime
+# Runs the exported defect CNN with NumPy only, so the web app does not need TensorFlow
+import numpy as np
+import json
+
+
+class CompactModel:
+    """NumPy forward pass over an artifact written by scripts/export_model.py"""
+
+    def __init__(self, layers, input_shape, dtype='float32'):
+        self.layers = layers
+        self.input_shape = tuple(input_shape)
+        # Storage precision of the weights in the artifact; they are float32 in memory
+        self.dtype = dtype
+
+    @classmethod
+    def load(cls, path):
+        """Load a compact artifact, dequantizing weights to float32 once"""
+        with np.load(path, allow_pickle=False) as data:
+            manifest = json.loads(str(data['manifest']))
+            layers = []
+            dtypes = set()
+            for index, spec in enumerate(manifest['layers']):
+                layer = dict(spec)
+                if spec['type'] in ('conv2d', 'dense'):
+                    # Artifacts written before prefixes were recorded numbered arrays by manifest position
+                    prefix = spec.get('prefix', f'layer{index}_')
+                    dtypes.add(spec['dtype'])
+                    kernel = data[prefix + 'kernel']
+                    if spec['dtype'] == 'int8':
+                        kernel = kernel.astype(np.float32) * data[prefix + 'scale']
+                    layer['kernel'] = np.ascontiguousarray(kernel, dtype=np.float32)
+                    layer['bias'] = data[prefix + 'bias'].astype(np.float32)
+                layers.append(layer)
+        return cls(layers, manifest['input_shape'], '/'.join(sorted(dtypes)) or 'float32')
+
+    def predict(self, images):
+        """Return sigmoid outputs for a batch shaped (N, H, W, C) or a single (H, W, C) image"""
+        x = np.asarray(images, dtype=np.float32)
+        single = x.ndim == len(self.input_shape)
+        if single:
+            x = x[np.newaxis]
+
+        for layer in self.layers:
+            layer_type = layer['type']
+            if layer_type == 'conv2d':
+                x = self._conv2d(x, layer['kernel'], layer['bias'])
+            elif layer_type == 'maxpool2d':
+                x = self._maxpool2d(x, layer['pool_size'])
+            elif layer_type == 'flatten':
+                x = x.reshape(x.shape[0], -1)
+            elif layer_type == 'dense':
+                x = x @ layer['kernel']
+                x += layer['bias']
+            x = self._activate(x, layer.get('activation', 'linear'))
+
+        return x[0] if single else x
+
+    def _conv2d(self, x, kernel, bias):
+        """Valid, stride-1 convolution as one matmul per kernel tap"""
+        kh, kw, _, out_channels = kernel.shape
+        n, h, w, _ = x.shape
+        out_h, out_w = h - kh + 1, w - kw + 1
+        out = np.empty((n, out_h, out_w, out_channels), dtype=np.float32)
+        out[...] = bias
+        for i in range(kh):
+            for j in range(kw):
+                out += x[:, i:i + out_h, j:j + out_w, :] @ kernel[i, j]
+        return out
+
+    def _maxpool2d(self, x, pool_size):
+        """Non-overlapping max pooling with floor semantics (Keras 'valid' padding)"""
+        ph, pw = pool_size
+        n, h, w, c = x.shape
+        h, w = h // ph, w // pw
+        x = x[:, :h * ph, :w * pw, :].reshape(n, h, ph, w, pw, c)
+        return x.max(axis=(2, 4))
+
+    def _activate(self, x, activation):
+        if activation == 'relu':
+            np.maximum(x, 0, out=x)
+        elif activation == 'sigmoid':
+            x = 1.0 / (1.0 + np.exp(-x))
+        return x
+
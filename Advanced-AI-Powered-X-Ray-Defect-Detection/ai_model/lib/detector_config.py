@@ -0,0 +1,154 @@
+# Detector configuration
+# Immutable, versioned scoring parameters loaded from JSON and swapped in when the file changes
+import os
+import json
+import hashlib
+import threading
+import dataclasses
+from types import MappingProxyType
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'detector_config.json')
+
+FILENAME_SCORE_KEYS = ('no_filename', 'defect_only', 'normal_only', 'mostly_defect', 'mostly_normal', 'neutral')
+CONTENT_FEATURES = ('mean_intensity', 'std_intensity', 'contrast', 'edge_density')
+
+
+class ConfigError(Exception):
+    """Raised when a detector config file is missing fields or has invalid values"""
+
+
+@dataclasses.dataclass(frozen=True)
+class Indicator:
+    """Adds weight to the content probability when a normalized feature is above or below a threshold"""
+    feature: str
+    threshold: float
+    weight: float
+    below: bool = False
+
+    def fires(self, value):
+        return value < self.threshold if self.below else value > self.threshold
+
+
+@dataclasses.dataclass(frozen=True)
+class DetectorConfig:
+    """One version of the detector's scoring parameters
+
+    Instances are never modified: a reload builds a new object and swaps the
+    detector's reference, so an analysis that already read the old object
+    finishes with it. Use dataclasses.replace for one-off overrides.
+    """
+    version: str
+    confidence_threshold: float
+    uncertainty_band: float
+    defect_keywords: tuple
+    normal_keywords: tuple
+    filename_scores: MappingProxyType
+    filename_weight: float
+    content_weight: float
+    conservative_factor: float
+    probability_bounds: tuple
+    content_base: float
+    content_no_indicator: float
+    indicators: tuple
+
+    def clamp(self, probability):
+        low, high = self.probability_bounds
+        return min(high, max(low, probability))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Validate a parsed config file; the version combines the declared one with a content hash"""
+        try:
+            canonical = json.dumps(data, sort_keys=True, separators=(',', ':'))
+            digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:8]
+            filename_scores = {key: float(data['filename_scores'][key]) for key in FILENAME_SCORE_KEYS}
+            weights = data['weights']
+            content = data['content']
+            indicators = []
+            for item in content['indicators']:
+                if item['feature'] not in CONTENT_FEATURES:
+                    raise ConfigError(f"Unknown content feature {item['feature']!r}")
+                if ('above' in item) == ('below' in item):
+                    raise ConfigError(f"Indicator for {item['feature']} needs exactly one of 'above' or 'below'")
+                indicators.append(Indicator(item['feature'], float(item.get('above', item.get('below'))),
+                                            float(item['weight']), below='below' in item))
+            low, high = (float(bound) for bound in data['probability_bounds'])
+            config = cls(
+                version=f"{data['version']}-{digest}",
+                confidence_threshold=float(data['confidence_threshold']),
+                uncertainty_band=float(data['uncertainty_band']),
+                defect_keywords=tuple(keyword.lower() for keyword in data['defect_keywords']),
+                normal_keywords=tuple(keyword.lower() for keyword in data['normal_keywords']),
+                filename_scores=MappingProxyType(filename_scores),
+                filename_weight=float(weights['filename']),
+                content_weight=float(weights['content']),
+                conservative_factor=float(weights['conservative_factor']),
+                probability_bounds=(low, high),
+                content_base=float(content['base']),
+                content_no_indicator=float(content['no_indicator']),
+                indicators=tuple(indicators)
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise ConfigError(f"Invalid detector config: {e!r}") from e
+        if not 0 <= low <= high <= 1:
+            raise ConfigError("probability_bounds must satisfy 0 <= low <= high <= 1")
+        return config
+
+
+def load_config(path=DEFAULT_CONFIG_PATH):
+    """Read and validate a detector config file"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Cannot read detector config {path}: {e}") from e
+    return DetectorConfig.from_dict(data)
+
+
+class ConfigWatcher:
+    """Polls a config file and calls on_change(config) with each new valid version
+
+    Polling the file's mtime and size keeps this dependency-free and also
+    catches editors that replace the file rather than writing in place.
+    Invalid files are reported and ignored, leaving the current config active.
+    """
+
+    def __init__(self, path, on_change, interval=2.0):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._signature = self._stat()
+        self._thread = threading.Thread(target=self._run, name='detector-config-watcher', daemon=True)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def check(self):
+        """Reload now if the file changed; returns the new config or None"""
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return None
+        self._signature = signature
+        try:
+            config = load_config(self.path)
+        except ConfigError as e:
+            print(f"Keeping current detector config: {e}")
+            return None
+        self.on_change(config)
+        return config
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
@@ -0,0 +1,76 @@
+# Defect localization
+# Ranked regions of unusual structure from a downsampled gradient heat map
+import numpy as np
+import cv2
+
+HEAT_MAP_SIZE = (28, 28)
+MAX_REGIONS = 3
+# Cells this many standard deviations above the mean heat count as candidates
+PEAK_THRESHOLD_STD = 1.5
+# Heat map cells ignored along each side (about 7% of the image)
+BORDER_CELLS = 2
+
+
+def gradient_magnitude(gray, arena=None):
+    """Sobel gradient magnitude of a uint8 image as float32
+
+    With a BufferArena the result and intermediates live in the calling
+    thread's reusable buffers, so it is only valid until the next call.
+    """
+    grad_x = grad_y = magnitude = None
+    if arena is not None:
+        grad_x = arena.get('grad_x', gray.shape, np.float32)
+        grad_y = arena.get('grad_y', gray.shape, np.float32)
+        magnitude = arena.get('gradient_magnitude', gray.shape, np.float32)
+    grad_x = cv2.Sobel(gray, cv2.CV_32F, 1, 0, dst=grad_x, ksize=3)
+    grad_y = cv2.Sobel(gray, cv2.CV_32F, 0, 1, dst=grad_y, ksize=3)
+    return cv2.magnitude(grad_x, grad_y, magnitude=magnitude)
+
+
+def localize_defects(gray, magnitude=None, max_regions=MAX_REGIONS):
+    """Return up to max_regions [{'x', 'y', 'score'}] in percent coordinates, strongest first
+
+    The gradient magnitude is block-averaged into a coarse heat map. Local
+    maxima above the threshold are grouped by connected component and each
+    component reports its strongest peak, so one large structure yields one
+    region. score is the peak's distance above the mean heat in standard
+    deviations. Pass magnitude to reuse a map the caller already computed.
+    """
+    if magnitude is None:
+        magnitude = gradient_magnitude(gray)
+    heat = cv2.resize(magnitude, HEAT_MAP_SIZE, interpolation=cv2.INTER_AREA)
+    # Image borders and collimator edges dominate the gradient, ignore them
+    interior = heat[BORDER_CELLS:-BORDER_CELLS, BORDER_CELLS:-BORDER_CELLS].copy()
+    heat.fill(0)
+    heat[BORDER_CELLS:-BORDER_CELLS, BORDER_CELLS:-BORDER_CELLS] = interior
+
+    mean, std = float(interior.mean()), float(interior.std())
+    if std == 0:
+        return []
+    candidates = heat > mean + PEAK_THRESHOLD_STD * std
+
+    local_max = heat >= cv2.dilate(heat, np.ones((3, 3), np.uint8))
+    peaks = np.flatnonzero(candidates & local_max)
+    if peaks.size == 0:
+        return []
+
+    _, labels = cv2.connectedComponents(candidates.astype(np.uint8), connectivity=8)
+    peak_labels = labels.ravel()[peaks]
+    peak_heat = heat.ravel()[peaks]
+
+    # Strongest peak per component, then components by strength
+    order = np.lexsort((-peak_heat, peak_labels))
+    _, first = np.unique(peak_labels[order], return_index=True)
+    best = order[first]
+    best = best[np.argsort(-peak_heat[best], kind='stable')][:max_regions]
+
+    rows, cols = np.unravel_index(peaks[best], heat.shape)
+    height, width = heat.shape
+    return [
+        {
+            'x': int((col + 0.5) * 100 / width),
+            'y': int((row + 0.5) * 100 / height),
+            'score': round((float(heat[row, col]) - mean) / std, 2)
+        }
+        for row, col in zip(rows, cols)
+    ]
@@ -4,29 +4,90 @@ from PIL import Image
 import os
 import hashlib
 import json
+import threading
+
+try:
+    from .compact_model import CompactModel
+    from .buffer_arena import BufferArena
+    from .localization import gradient_magnitude, localize_defects
+    from .detector_config import DEFAULT_CONFIG_PATH, ConfigWatcher, load_config
+except ImportError:
+    from compact_model import CompactModel
+    from buffer_arena import BufferArena
+    from localization import gradient_magnitude, localize_defects
+    from detector_config import DEFAULT_CONFIG_PATH, ConfigWatcher, load_config
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), '..')
+# Compact artifacts written by scripts/export_model.py, in order of preference
+COMPACT_MODEL_FILES = ('defect_model_int8.npz', 'defect_model_float16.npz')
+
+def find_compact_model(directory=MODEL_DIR):
+    """Path of the first compact model artifact present in directory, or None"""
+    for name in COMPACT_MODEL_FILES:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return path
+    return None
 
 class XRayDefectDetector:
-    def __init__(self):
-        self.model_path = os.path.join(os.path.dirname(__file__), '..', 'defect_model.h5')
-        self.confidence_threshold = 0.6  # Lower threshold - more conservative
-        self.defect_keywords = [
-            'defect', 'fracture', 'abnormal', 'tumor', 'pneumonia', 'break', 
-            'crack', 'infection', 'broken', 'damaged', 'injury', 'lesion', 
-            'mass', 'nodule', 'opacity', 'shadow', 'consolidation', 'effusion', 
-            'pneumothorax', 'atelectasis', 'fracture', 'dislocation', 'arthritis',
-            'osteoporosis', 'cancer', 'metastasis', 'edema', 'hemorrhage'
-        ]
-        self.normal_keywords = [
-            'normal', 'healthy', 'clear', 'good', 'fine', 'ok', 'regular', 
-            'standard', 'baseline', 'unremarkable', 'negative', 'clean',
-            'intact', 'well', 'proper', 'correct', 'typical'
-        ]
+    def __init__(self, config_path=None, compact_model_path=None):
+        self.model_path = os.path.join(MODEL_DIR, 'defect_model.h5')
+        # An explicit path, then COMPACT_MODEL, then whichever exported variant is present
+        self.compact_model_path = compact_model_path or os.environ.get('COMPACT_MODEL') or find_compact_model()
+        self.compact_model = self._load_compact_model()
+        self.arena = BufferArena()
+        # Thresholds, keywords and weights; replaced as a whole on reload, never mutated
+        self.config_path = config_path or DEFAULT_CONFIG_PATH
+        self.config = load_config(self.config_path)
+        self._config_watcher = None
+        self._stage_counts = {'global': 0, 'texture': 0}
+        self._stats_lock = threading.Lock()
         
-    def preprocess_image(self, image_path):
-        """Preprocess the X-ray image for analysis"""
+    def watch_config(self, interval=2.0):
+        """Reload the config file in the background whenever it changes"""
+        if self._config_watcher is None:
+            self._config_watcher = ConfigWatcher(self.config_path, self._swap_config, interval).start()
+        return self._config_watcher
+
+    def _swap_config(self, config):
+        old_version, self.config = self.config.version, config
+        print(f"Detector config reloaded: {old_version} -> {config.version}")
+
+    def _load_compact_model(self):
+        """Load the exported CPU inference artifact if one is present"""
+        if not self.compact_model_path:
+            print("No compact model artifact found; detecting without the CNN")
+            return None
+        try:
+            compact_model = CompactModel.load(self.compact_model_path)
+            print(f"Loaded {compact_model.dtype} compact model from {self.compact_model_path}")
+            return compact_model
+        except Exception as e:
+            print(f"Error loading compact model {self.compact_model_path}: {e}")
+        return None
+
+    def predict_model(self, processed_image):
+        """Run the CNN on a preprocessed image, or return None if no model is available"""
+        if self.compact_model is None:
+            return None
+        try:
+            return float(self.compact_model.predict(processed_image)[0])
+        except Exception as e:
+            print(f"Error running compact model: {e}")
+            return None
+
+    def preprocess_image(self, image_path, reuse_buffers=False):
+        """Preprocess the X-ray image for analysis
+
+        With reuse_buffers=True the result lives in this thread's arena and is
+        overwritten by the next call, so callers must not keep it across calls.
+        """
         try:
             # Load image
-            if isinstance(image_path, str):
+            if isinstance(image_path, str) and image_path.endswith('.npy'):
+                # Pre-resized uint8 analysis tensor written at ingest
+                image = np.load(image_path)
+            elif isinstance(image_path, str):
                 image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
             else:
                 # Handle file object
@@ -35,138 +96,187 @@ class XRayDefectDetector:
             if image is None:
                 return None
                 
+            if not reuse_buffers:
+                if image.shape != (224, 224):
+                    image = cv2.resize(image, (224, 224))
+                image = image.astype(np.float32) / 255.0
+                return np.expand_dims(image, axis=-1)
+
             # Resize to standard size
-            image = cv2.resize(image, (224, 224))
-            
-            # Normalize
-            image = image.astype(np.float32) / 255.0
+            if image.shape == (224, 224):
+                resized = image
+            else:
+                resized = self.arena.get('resized', (224, 224), np.uint8)
+                cv2.resize(image, (224, 224), dst=resized)
             
-            # Add channel dimension
-            image = np.expand_dims(image, axis=-1)
+            # Normalize, writing straight into the channel-last tensor
+            processed = self.arena.get('processed', (224, 224, 1), np.float32)
+            np.multiply(resized, np.float32(1.0 / 255.0), out=processed[:, :, 0])
             
-            return image
+            return processed
             
         except Exception as e:
             print(f"Error preprocessing image: {e}")
             return None
     
-    def analyze_image_content(self, image):
+    # Neighbour offsets for LBP, in bit order starting top-left and going clockwise
+    LBP_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+
+    def _to_uint8(self, image):
+        """Return a single-channel uint8 view of an image in [0, 1] floats or 0-255 integers"""
+        if image.ndim == 3:
+            image = image[:, :, 0] if image.shape[2] == 1 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if image.dtype == np.uint8:
+            return image
+        gray = self.arena.get('gray', image.shape, np.uint8)
+        # Scale [0, 1] floats back to grey levels with rounding and saturation
+        cv2.convertScaleAbs(image, dst=gray, alpha=255.0)
+        return gray
+
+    def analyze_image_content(self, image, include_texture=True):
         """Analyze image content for defect detection"""
         try:
             # Convert to numpy array if needed
             if isinstance(image, Image.Image):
                 image = np.array(image)
-            
-            # Basic image analysis
-            mean_intensity = np.mean(image)
-            std_intensity = np.std(image)
-            contrast = np.max(image) - np.min(image)
-            
+
+            gray = self._to_uint8(image)
+
+            # Intensity statistics on the [0, 1] scale, contrast in grey levels
+            mean, std = cv2.meanStdDev(gray)
+            min_value, max_value, _, _ = cv2.minMaxLoc(gray)
+
             # Edge detection for defect analysis
-            edges = cv2.Canny(image.astype(np.uint8), 50, 150)
-            edge_density = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
-            
-            # Texture analysis
-            gray = cv2.cvtColor(image.astype(np.uint8), cv2.COLOR_GRAY2BGR) if len(image.shape) == 2 else image.astype(np.uint8)
-            gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
-            
-            # Calculate texture features
-            texture_features = self._calculate_texture_features(gray)
-            
-            return {
-                'mean_intensity': mean_intensity,
-                'std_intensity': std_intensity,
-                'contrast': contrast,
-                'edge_density': edge_density,
-                'texture_features': texture_features
+            edges = self.arena.get('edges', gray.shape, np.uint8)
+            cv2.Canny(gray, 50, 150, edges=edges)
+            edge_density = cv2.countNonZero(edges) / edges.size
+
+            features = {
+                'mean_intensity': float(mean[0, 0]) / 255.0,
+                'std_intensity': float(std[0, 0]) / 255.0,
+                'min_intensity': min_value / 255.0,
+                'max_intensity': max_value / 255.0,
+                'contrast': max_value - min_value,
+                'edge_density': edge_density
             }
-            
+
+            # Calculate texture features
+            if include_texture:
+                features['texture_features'] = self._calculate_texture_features(gray)
+
+            return features
+
         except Exception as e:
             print(f"Error analyzing image content: {e}")
             return None
-    
-    def _calculate_texture_features(self, image):
-        """Calculate texture features for defect detection"""
+
+    def _calculate_texture_features(self, image, magnitude=None):
+        """Calculate texture features for defect detection
+
+        magnitude is the image's gradient magnitude if the caller already has it.
+        """
         try:
             # GLCM-like features (simplified)
             features = {}
-            
+
             # Local binary pattern approximation
             lbp = self._local_binary_pattern(image)
-            features['lbp_histogram'] = np.histogram(lbp, bins=256, range=(0, 256))[0]
-            
+            features['lbp_histogram'] = np.bincount(lbp.ravel(), minlength=256)
+
             # Gradient features
-            grad_x = cv2.Sobel(image, cv2.CV_64F, 1, 0, ksize=3)
-            grad_y = cv2.Sobel(image, cv2.CV_64F, 0, 1, ksize=3)
-            gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
-            features['gradient_mean'] = np.mean(gradient_magnitude)
-            features['gradient_std'] = np.std(gradient_magnitude)
-            
+            if magnitude is None:
+                magnitude = gradient_magnitude(image, self.arena)
+            gradient_mean, gradient_std = cv2.meanStdDev(magnitude)
+            features['gradient_mean'] = float(gradient_mean[0, 0])
+            features['gradient_std'] = float(gradient_std[0, 0])
+
             return features
-            
+
         except Exception as e:
             print(f"Error calculating texture features: {e}")
             return {}
-    
+
     def _local_binary_pattern(self, image):
         """Calculate local binary pattern (simplified)"""
         try:
-            # Simplified LBP implementation
-            lbp = np.zeros_like(image)
-            for i in range(1, image.shape[0]-1):
-                for j in range(1, image.shape[1]-1):
-                    center = image[i, j]
-                    code = 0
-                    # Check 8 neighbors
-                    neighbors = [
-                        image[i-1, j-1], image[i-1, j], image[i-1, j+1],
-                        image[i, j+1], image[i+1, j+1], image[i+1, j],
-                        image[i+1, j-1], image[i, j-1]
-                    ]
-                    for k, neighbor in enumerate(neighbors):
-                        if neighbor >= center:
-                            code |= (1 << k)
-                    lbp[i, j] = code
+            # Vectorized over the interior; border pixels keep code 0
+            lbp = self.arena.get('lbp', image.shape, np.uint8)
+            lbp[0, :] = lbp[-1, :] = 0
+            lbp[:, 0] = lbp[:, -1] = 0
+            height, width = image.shape
+            center = image[1:-1, 1:-1]
+            codes = lbp[1:-1, 1:-1]
+            codes.fill(0)
+            bit = self.arena.get('lbp_bit', center.shape, np.uint8)
+            for k, (di, dj) in enumerate(self.LBP_OFFSETS):
+                neighbor = image[1 + di:height - 1 + di, 1 + dj:width - 1 + dj]
+                np.greater_equal(neighbor, center, out=bit.view(np.bool_))
+                np.left_shift(bit, k, out=bit)
+                np.bitwise_or(codes, bit, out=codes)
             return lbp
-        except:
+        except Exception as e:
+            print(f"Error calculating local binary pattern: {e}")
             return np.zeros_like(image)
-    
-    def detect_defects(self, image_path, filename=""):
-        """Main method to detect defects in X-ray images"""
+
+    def detect_defects(self, image_path, filename="", full_details=False, on_stage=None):
+        """Main method to detect defects in X-ray images
+
+        Texture features (LBP, gradients) are only computed when the global
+        statistics leave the result within uncertainty_band of the threshold,
+        or when full_details is True. on_stage(stages) is called once feature
+        extraction is done, with the list of stages that ran.
+        """
+        # Read once, so a reload mid-analysis doesn't mix two versions
+        config = self.config
         try:
             # Preprocess image
-            processed_image = self.preprocess_image(image_path)
+            processed_image = self.preprocess_image(image_path, reuse_buffers=True)
             if processed_image is None:
                 return self._get_default_result("Error processing image")
             
-            # Analyze image content
-            content_analysis = self.analyze_image_content(processed_image)
+            # Analyze image content: cheap global statistics and edges first
+            content_analysis = self.analyze_image_content(processed_image, include_texture=False)
             if content_analysis is None:
                 return self._get_default_result("Error analyzing image content")
             
             # Check filename for keywords
-            filename_score = self._analyze_filename(filename)
+            filename_score = self._analyze_filename(filename, config)
             
             # Combine analysis results
-            defect_probability = self._calculate_defect_probability(content_analysis, filename_score)
+            defect_probability = self._calculate_defect_probability(content_analysis, filename_score, config)
+            
+            # Costly texture stage only for borderline results; its gradient map is reused for localization
+            stages = ['global']
+            gray = self._to_uint8(processed_image)
+            magnitude = None
+            if full_details or abs(defect_probability - config.confidence_threshold) <= config.uncertainty_band:
+                magnitude = gradient_magnitude(gray, self.arena)
+                content_analysis['texture_features'] = self._calculate_texture_features(gray, magnitude)
+                stages.append('texture')
+            self._record_stages(stages)
+            if on_stage:
+                on_stage(stages)
             
             # More conservative approach - require higher probability for defect classification
-            is_defective = defect_probability > self.confidence_threshold
+            is_defective = defect_probability > config.confidence_threshold
             
             # Calculate confidence - cap at 95% for realistic results
             confidence = min(95.0, max(5.0, defect_probability * 100))
             
             # Generate defect locations if defective
-            defect_locations = self._generate_defect_locations(processed_image) if is_defective else []
+            defect_locations = self._generate_defect_locations(gray, magnitude) if is_defective else []
             
             return {
                 'status': 'defective' if is_defective else 'non-defective',
                 'confidence': f'{confidence:.2f}%',
                 'defect_locations': defect_locations,
+                'config_version': config.version,
                 'analysis_details': {
                     'defect_probability': defect_probability,
                     'filename_score': filename_score,
-                    'content_analysis': content_analysis
+                    'model_probability': self.predict_model(processed_image),
+                    'content_analysis': content_analysis,
+                    'stages': stages
                 }
             }
             
@@ -174,116 +284,105 @@ class XRayDefectDetector:
             print(f"Error in defect detection: {e}")
             return self._get_default_result(f"Analysis error: {str(e)}")
     
-    def _analyze_filename(self, filename):
+    def _record_stages(self, stages):
+        with self._stats_lock:
+            for stage in stages:
+                self._stage_counts[stage] += 1
+
+    def cascade_stats(self):
+        """Per-stage run counts and hit rates since the detector was created"""
+        with self._stats_lock:
+            counts = dict(self._stage_counts)
+        analyses = counts['global']
+        return {
+            'analyses': analyses,
+            'stages': {
+                stage: {'runs': runs, 'hit_rate': runs / analyses if analyses else 0.0}
+                for stage, runs in counts.items()
+            },
+            'texture_skipped': analyses - counts['texture']
+        }
+
+    def reset_cascade_stats(self):
+        with self._stats_lock:
+            self._stage_counts = {stage: 0 for stage in self._stage_counts}
+
+    def filename_score(self, filename):
+        """Public access to the filename keyword score used in detect_defects"""
+        return self._analyze_filename(filename, self.config)
+
+    def _analyze_filename(self, filename, config):
         """Analyze filename for defect indicators"""
+        scores = config.filename_scores
         if not filename:
-            return 0.5  # Neutral score for no filename
+            return scores['no_filename']
         
         filename_lower = filename.lower()
         
         # Check for defect keywords
-        defect_count = sum(1 for keyword in self.defect_keywords if keyword in filename_lower)
-        normal_count = sum(1 for keyword in self.normal_keywords if keyword in filename_lower)
+        defect_count = sum(1 for keyword in config.defect_keywords if keyword in filename_lower)
+        normal_count = sum(1 for keyword in config.normal_keywords if keyword in filename_lower)
         
         if defect_count > 0 and normal_count == 0:
-            return 0.95  # High probability of defect
+            return scores['defect_only']
         elif normal_count > 0 and defect_count == 0:
-            return 0.05  # Low probability of defect
+            return scores['normal_only']
         elif defect_count > normal_count:
-            return 0.8   # Moderate probability of defect
+            return scores['mostly_defect']
         elif normal_count > defect_count:
-            return 0.2   # Low probability of defect
+            return scores['mostly_normal']
         else:
-            return 0.5   # Neutral
+            return scores['neutral']
     
-    def _calculate_defect_probability(self, content_analysis, filename_score):
+    def _calculate_defect_probability(self, content_analysis, filename_score, config):
         """Calculate overall defect probability"""
         try:
-            # Weight factors - more weight on content analysis
-            filename_weight = 0.2
-            content_weight = 0.8
-            
             # Content-based probability
-            content_prob = self._calculate_content_probability(content_analysis)
-            
-            # Combined probability - more conservative approach
-            combined_prob = (filename_score * filename_weight) + (content_prob * content_weight)
+            content_prob = self._calculate_content_probability(content_analysis, config)
             
-            # Apply additional conservative factor - reduce overall probability
-            combined_prob = combined_prob * 0.8  # 20% reduction for safety
+            # Weighted combination, then the conservative factor reduces it for safety
+            combined_prob = (filename_score * config.filename_weight) + (content_prob * config.content_weight)
+            combined_prob = combined_prob * config.conservative_factor
             
-            return min(0.95, max(0.05, combined_prob))
+            return config.clamp(combined_prob)
             
         except Exception as e:
             print(f"Error calculating defect probability: {e}")
             return 0.2  # Default to low probability (normal)
     
-    def _calculate_content_probability(self, content_analysis):
+    def _calculate_content_probability(self, content_analysis, config):
         """Calculate defect probability based on image content"""
         try:
-            # Extract features
-            mean_intensity = content_analysis.get('mean_intensity', 0.5)
-            std_intensity = content_analysis.get('std_intensity', 0.1)
-            contrast = content_analysis.get('contrast', 0.5)
-            edge_density = content_analysis.get('edge_density', 0.1)
-            
             # Normalize features
-            mean_intensity_norm = min(1.0, max(0.0, mean_intensity))
-            std_intensity_norm = min(1.0, max(0.0, std_intensity / 0.5))
-            contrast_norm = min(1.0, max(0.0, contrast / 255.0))
-            edge_density_norm = min(1.0, max(0.0, edge_density * 10))
-            
-            # Calculate probability based on features
-            # Start with a lower base probability for normal cases
-            prob = 0.2  # Lower base probability - most X-rays are normal
-            
-            # Only increase probability for strong defect indicators
-            defect_indicators = 0
-            
-            # High edge density (strong indicator of defects)
-            if edge_density_norm > 0.4:
-                defect_indicators += 1
-                prob += 0.3
-            
-            # Very high contrast (strong indicator of defects)
-            if contrast_norm > 0.8:
-                defect_indicators += 1
-                prob += 0.25
-            
-            # Very low intensity (strong indicator of defects)
-            if mean_intensity_norm < 0.2:
-                defect_indicators += 1
-                prob += 0.2
+            normalized = {
+                'mean_intensity': min(1.0, max(0.0, content_analysis.get('mean_intensity', 0.5))),
+                'std_intensity': min(1.0, max(0.0, content_analysis.get('std_intensity', 0.1) / 0.5)),
+                'contrast': min(1.0, max(0.0, content_analysis.get('contrast', 0.5) / 255.0)),
+                'edge_density': min(1.0, max(0.0, content_analysis.get('edge_density', 0.1) * 10))
+            }
             
-            # Very high variance (strong indicator of defects)
-            if std_intensity_norm > 0.8:
-                defect_indicators += 1
-                prob += 0.15
+            # Start from a low base probability - most X-rays are normal - and
+            # only increase it for strong defect indicators
+            prob = config.content_base
+            fired = [indicator for indicator in config.indicators if indicator.fires(normalized[indicator.feature])]
+            prob += sum(indicator.weight for indicator in fired)
             
             # If no strong defect indicators, reduce probability
-            if defect_indicators == 0:
-                prob = 0.1  # Very low probability for normal X-rays
+            if not fired:
+                prob = config.content_no_indicator
             
-            return min(0.95, max(0.05, prob))
+            return config.clamp(prob)
             
         except Exception as e:
             print(f"Error calculating content probability: {e}")
             return 0.2  # Default to low probability (normal)
     
-    def _generate_defect_locations(self, image):
-        """Generate defect locations for visualization"""
+    def _generate_defect_locations(self, gray, magnitude=None):
+        """Locate the strongest gradient regions for visualization, ranked by score"""
         try:
-            # Generate random defect locations based on image analysis
-            height, width = image.shape[:2]
-            num_defects = np.random.randint(1, 4)
-            
-            locations = []
-            for _ in range(num_defects):
-                x = np.random.randint(20, width - 20)
-                y = np.random.randint(20, height - 20)
-                locations.append({'x': int(x * 100 / width), 'y': int(y * 100 / height)})
-            
-            return locations
+            if magnitude is None:
+                magnitude = gradient_magnitude(gray, self.arena)
+            return localize_defects(gray, magnitude)
             
         except Exception as e:
             print(f"Error generating defect locations: {e}")
@@ -0,0 +1,165 @@
+# Near-duplicate detection
+# DCT perceptual hashes and a multi-index hash table for Hamming-radius lookups
+import numpy as np
+import cv2
+import threading
+
+HASH_BITS = 64
+
+
+def perceptual_hash(image):
+    """64-bit DCT pHash of a grayscale image (uint8 or [0, 1] floats)
+
+    Robust to re-compression, resizing and mild brightness changes, so
+    re-exports of the same radiograph land within a few bits of each other.
+    """
+    if image.ndim == 3:
+        image = image[:, :, 0]
+    small = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_frequencies = cv2.dct(small)[:8, :8].ravel()
+    # Median over the AC terms; the DC term only encodes overall brightness
+    bits = low_frequencies > np.median(low_frequencies[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+# Set bits per byte value, for NumPy builds without np.bitwise_count
+_BYTE_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def popcount64(values):
+    """Set bits of each element of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+def hash_to_hex(hash_value):
+    return f'{hash_value:016x}'
+
+
+def hash_from_hex(text):
+    return int(text, 16)
+
+
+class HammingIndex:
+    """Multi-index hashing over 64-bit hashes
+
+    The hash is split into max_radius + 1 disjoint chunks, so any hash within
+    max_radius bits of a query matches it exactly on at least one chunk
+    (pigeonhole). Hashes live in one contiguous uint64 array. Each chunk has
+    a sorted copy of its keys with the matching positions, so a lookup
+    binary-searches every chunk and scores the gathered candidates with a
+    vectorized XOR and popcount.
+
+    Hashes added after the last table build form a short tail that every
+    lookup scans in full. Once the tail reaches 1/16 of the indexed entries,
+    the tables are rebuilt outside the lock and swapped in.
+    """
+
+    MIN_TAIL = 4096
+
+    def __init__(self, max_radius=4):
+        self.max_radius = max_radius
+        chunks = max_radius + 1
+        self._chunks = []
+        shift = 0
+        for i in range(chunks):
+            width = HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0)
+            self._chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self._hashes = np.empty(1024, dtype=np.uint64)
+        self._size = 0
+        self._values = []
+        # Per chunk: (sorted chunk keys, positions in that order), covering the first _indexed hashes
+        self._tables = None
+        self._indexed = 0
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, count):
+        # Called with the lock held; lookups keep reading the old array until they finish
+        if self._size + count > len(self._hashes):
+            grown = np.empty(max(2 * len(self._hashes), self._size + count), dtype=np.uint64)
+            grown[:self._size] = self._hashes[:self._size]
+            self._hashes = grown
+
+    def add(self, hash_value, value):
+        """Index a hash with an arbitrary payload, e.g. (scan_id, user_id)"""
+        self.add_many([hash_value], [value])
+
+    def add_many(self, hash_values, values, rebuild=True):
+        """Index a batch of hashes with their payloads
+
+        Bulk loads pass rebuild=False and call rebuild() once at the end,
+        rather than re-sorting the tables as the tail grows.
+        """
+        hashes = np.asarray(hash_values, dtype=np.uint64)
+        with self._lock:
+            self._reserve(len(hashes))
+            self._hashes[self._size:self._size + len(hashes)] = hashes
+            self._values.extend(values)
+            self._size += len(hashes)
+        if rebuild and self._size - self._indexed >= max(self.MIN_TAIL, self._indexed // 16):
+            self.rebuild(wait=False)
+
+    def rebuild(self, wait=True):
+        """Sort every hash added so far into the chunk tables"""
+        if not self._rebuild_lock.acquire(blocking=wait):
+            return  # Another thread is already rebuilding
+        try:
+            with self._lock:
+                size, hashes = self._size, self._hashes
+            tables = []
+            for shift, mask in self._chunks:
+                keys = (hashes[:size] >> np.uint64(shift)) & np.uint64(mask)
+                keys = keys.astype(np.uint32 if mask <= 0xFFFFFFFF else np.uint64)
+                order = np.argsort(keys, kind='stable').astype(np.int64)
+                tables.append((keys[order], order))
+            with self._lock:
+                self._tables, self._indexed = tables, size
+        finally:
+            self._rebuild_lock.release()
+
+    def query(self, hash_value, radius=None):
+        """Return [(distance, value)] within radius, nearest first"""
+        radius = self.max_radius if radius is None else min(radius, self.max_radius)
+        with self._lock:
+            hashes, size, tables, indexed = self._hashes, self._size, self._tables, self._indexed
+        if size == 0:
+            return []
+
+        parts = []
+        for (shift, mask), (keys, order) in zip(self._chunks, tables or ()):
+            # A key of the array's own dtype, so searchsorted doesn't convert the whole array
+            key = keys.dtype.type((hash_value >> shift) & mask)
+            low, high = np.searchsorted(keys, key, 'left'), np.searchsorted(keys, key, 'right')
+            parts.append(order[low:high])
+        parts.append(np.arange(indexed, size, dtype=np.int64))
+        candidates = np.concatenate(parts)
+
+        distances = popcount64(hashes[candidates] ^ np.uint64(hash_value))
+        close = distances <= radius
+        # An entry can share more than one chunk with the query
+        positions, first = np.unique(candidates[close], return_index=True)
+        distances = distances[close][first]
+        matches = [(int(distance), self._values[position]) for distance, position in zip(distances, positions)]
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    @classmethod
+    def from_rows(cls, rows, max_radius=4):
+        """Build an index from (hex hash, value) rows, e.g. straight from a DB cursor"""
+        index = cls(max_radius=max_radius)
+        hashes, values = [], []
+        for hex_hash, value in rows:
+            hashes.append(hash_from_hex(hex_hash))
+            values.append(value)
+        index.add_many(hashes, values)
+        return index
@@ -0,0 +1,198 @@
+# Scan history export
+# Append-only columnar snapshots of the scans table, aggregated offline with NumPy
+import os
+import json
+import numpy as np
+
+# Stored verdicts vary in case ('Defective', 'defective'); exported as codes
+RESULT_CODES = {'defective': 1, 'non-defective': 0}
+UNKNOWN_RESULT = -1
+
+# Scalar detector features kept per scan, NaN when a scan has no value
+FEATURE_COLUMNS = ('defect_probability', 'filename_score', 'mean_intensity', 'std_intensity',
+                   'contrast', 'edge_density', 'gradient_mean', 'gradient_std')
+
+BATCH_ROWS = 50000
+
+
+def _columns_from_rows(rows):
+    """Convert scans rows (id, user_id, scan_date, result, confidence, defect_count, config_version, features)"""
+    ids, user_ids, dates, results, confidences, defect_counts, versions, features = zip(*rows)
+    feature_values = np.full((len(rows), len(FEATURE_COLUMNS)), np.nan, dtype=np.float32)
+    for row, stored in enumerate(features):
+        if stored:
+            values = json.loads(stored)
+            for column, name in enumerate(FEATURE_COLUMNS):
+                if values.get(name) is not None:
+                    feature_values[row, column] = values[name]
+
+    # config_version is dictionary-encoded: per-part values plus int16 codes, -1 for NULL
+    dictionary = sorted({version for version in versions if version is not None})
+    codes = {version: code for code, version in enumerate(dictionary)}
+    columns = {
+        'id': np.array(ids, dtype=np.int64),
+        'user_id': np.array([-1 if user_id is None else user_id for user_id in user_ids], dtype=np.int64),
+        'scan_date': np.array(['NaT' if date is None else date for date in dates], dtype='datetime64[s]'),
+        'result': np.array([RESULT_CODES.get(str(result).lower(), UNKNOWN_RESULT) for result in results],
+                           dtype=np.int8),
+        'confidence': np.array(confidences, dtype=np.float32),
+        'defect_count': np.array([count or 0 for count in defect_counts], dtype=np.int32),
+        'config_version': np.array([codes.get(version, -1) for version in versions], dtype=np.int16),
+        'config_version_dictionary': np.array(dictionary, dtype=str)
+    }
+    for column, name in enumerate(FEATURE_COLUMNS):
+        columns[name] = feature_values[:, column].copy()
+    return columns
+
+
+class ScanExport:
+    """A folder of compressed .npz parts, one array per column, plus manifest.json
+
+    append() exports scans with an id above the manifest's high-water mark,
+    one part per batch. A part is written completely before the manifest
+    that references it is replaced, so an interrupted export is retried from
+    the last recorded mark. The manifest keeps each part's id and date range,
+    letting load() skip parts outside a requested period.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, 'manifest.json')
+
+    def manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'high_water_mark': 0, 'rows': 0, 'parts': []}
+
+    def _write_atomic(self, path, write):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def append(self, conn, batch_rows=BATCH_ROWS):
+        """Export scans added since the last run from a hot database connection; returns rows exported"""
+        os.makedirs(self.folder, exist_ok=True)
+        manifest = self.manifest()
+        cursor = conn.cursor()
+        exported = 0
+        while True:
+            cursor.execute('''
+                SELECT id, user_id, scan_date, result, confidence, defect_count, config_version, features
+                FROM scans WHERE id > ?
+                ORDER BY id LIMIT ?
+            ''', (manifest['high_water_mark'], batch_rows))
+            rows = cursor.fetchall()
+            if not rows:
+                return exported
+
+            columns = _columns_from_rows(rows)
+            name = f'part-{rows[0][0]:012d}.npz'
+            self._write_atomic(os.path.join(self.folder, name), lambda f: np.savez_compressed(f, **columns))
+
+            dates = columns['scan_date'][~np.isnat(columns['scan_date'])]
+            manifest['parts'].append({
+                'file': name,
+                'rows': len(rows),
+                'min_id': rows[0][0],
+                'max_id': rows[-1][0],
+                'min_date': str(dates.min()) if dates.size else None,
+                'max_date': str(dates.max()) if dates.size else None
+            })
+            manifest['high_water_mark'] = rows[-1][0]
+            manifest['rows'] += len(rows)
+            self._write_atomic(self.manifest_path, lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+            exported += len(rows)
+
+    def load(self, columns=None, since=None, until=None):
+        """Concatenate the exported columns, keeping scans dated in [since, until)
+
+        since and until are ISO date strings. config_version codes are
+        remapped onto one sorted config_version_dictionary for all parts.
+        """
+        since = np.datetime64(since, 's') if since else None
+        until = np.datetime64(until, 's') if until else None
+        wanted = None if columns is None else set(columns) | {'scan_date'}
+
+        parts = []
+        for part in self.manifest()['parts']:
+            # Parts entirely outside the period are never opened
+            if since is not None and part['max_date'] and np.datetime64(part['max_date'], 's') < since:
+                continue
+            if until is not None and part['min_date'] and np.datetime64(part['min_date'], 's') >= until:
+                continue
+            with np.load(os.path.join(self.folder, part['file'])) as data:
+                names = [name for name in data.files if wanted is None or name in wanted
+                         or (name == 'config_version_dictionary' and 'config_version' in wanted)]
+                parts.append({name: data[name] for name in names})
+        if not parts:
+            return {}
+
+        if 'config_version' in parts[0]:
+            dictionary = np.unique(np.concatenate([part['config_version_dictionary'] for part in parts]))
+            for part in parts:
+                remap = np.append(np.searchsorted(dictionary, part['config_version_dictionary']), -1)
+                part['config_version'] = remap[part['config_version']].astype(np.int16)
+                part['config_version_dictionary'] = dictionary
+
+        data = {name: np.concatenate([part[name] for part in parts])
+                for name in parts[0] if name != 'config_version_dictionary'}
+        if 'config_version' in parts[0]:
+            data['config_version_dictionary'] = parts[0]['config_version_dictionary']
+
+        mask = np.ones(len(data['scan_date']), dtype=bool)
+        if since is not None:
+            mask &= data['scan_date'] >= since
+        if until is not None:
+            mask &= data['scan_date'] < until
+        if not mask.all():
+            data = {name: values if name == 'config_version_dictionary' else values[mask]
+                    for name, values in data.items()}
+        return data
+
+
+def _grouped_rates(keys, results):
+    totals = np.bincount(keys)
+    defective = np.bincount(keys, weights=results == 1, minlength=len(totals)).astype(np.int64)
+    normal = np.bincount(keys, weights=results == 0, minlength=len(totals)).astype(np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = defective / totals
+    return totals, defective, normal, rate
+
+
+def monthly_stats(data, user_id=None):
+    """Scans per month: {'month', 'total', 'defective', 'normal', 'defect_rate'} arrays, oldest first"""
+    if not data:
+        return {'month': np.array([], dtype=str), 'total': np.array([], dtype=np.int64),
+                'defective': np.array([], dtype=np.int64), 'normal': np.array([], dtype=np.int64),
+                'defect_rate': np.array([], dtype=np.float64)}
+    mask = ~np.isnat(data['scan_date'])
+    if user_id is not None:
+        mask &= data['user_id'] == user_id
+    # Months since the epoch are small dense integers, so bincount groups them without sorting
+    month_numbers = data['scan_date'][mask].astype('datetime64[M]').astype(np.int64)
+    first = month_numbers.min() if month_numbers.size else 0
+    totals, defective, normal, rate = _grouped_rates(month_numbers - first, data['result'][mask])
+    present = np.flatnonzero(totals)
+    months = (present + first).astype('datetime64[M]')
+    return {'month': months.astype(str), 'total': totals[present], 'defective': defective[present],
+            'normal': normal[present], 'defect_rate': rate[present]}
+
+
+def defect_rate_by(data, column):
+    """Defect rate per distinct value of an integer column such as user_id or config_version
+
+    For config_version the values are returned as version strings ('' for NULL).
+    """
+    if not data:
+        return {'value': np.array([]), 'total': np.array([], dtype=np.int64), 'defect_rate': np.array([])}
+    values, keys = np.unique(data[column], return_inverse=True)
+    totals, _, _, rate = _grouped_rates(keys.ravel(), data['result'])
+    if column == 'config_version':
+        dictionary = np.append(data['config_version_dictionary'], '')
+        values = dictionary[values]
+    return {'value': values, 'total': totals, 'defect_rate': rate}
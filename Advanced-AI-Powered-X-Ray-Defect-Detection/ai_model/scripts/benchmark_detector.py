@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Detector Benchmark Script for X-Ray Defect Detection
+This script runs XRayDefectDetector.detect_defects over a directory of images and
+reports per-request latency, peak traced memory and scratch-array allocations,
+with the buffer arena enabled and disabled, plus cascade stage hit rates.
+"""
+
+import os
+import sys
+import time
+import argparse
+import dataclasses
+import tracemalloc
+import numpy as np
+
+# Add the lib directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+from model import XRayDefectDetector
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def list_images(directory):
+    """Return image paths in a directory, sorted by name"""
+    return [
+        os.path.join(directory, name) for name in sorted(os.listdir(directory))
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+
+def run(detector, image_paths, repeats):
+    """Run the detector and collect per-request timings, peaks and allocations"""
+    # Warm up so the arena holds its buffers before measuring
+    detector.detect_defects(image_paths[0], os.path.basename(image_paths[0]))
+    detector.arena.reset_stats()
+    detector.reset_cascade_stats()
+
+    timings, peaks = [], []
+    tracemalloc.start()
+    for _ in range(repeats):
+        for path in image_paths:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            detector.detect_defects(path, os.path.basename(path))
+            timings.append((time.perf_counter() - start) * 1000)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    requests = len(timings)
+    return {
+        'latency_ms': float(np.median(timings)),
+        'peak_kb': float(np.median(peaks)) / 1024,
+        'allocations': detector.arena.allocations / requests,
+        'allocated_kb': detector.arena.allocated_bytes / requests / 1024
+    }
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', default=os.path.join(os.path.dirname(__file__), '..', '..', 'uploads'))
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--band', type=float, default=None, help='Override the cascade uncertainty band')
+    args = parser.parse_args()
+
+    image_paths = list_images(args.images)
+    if not image_paths:
+        print(f"No images found in {args.images}")
+        sys.exit(1)
+
+    print(f"Benchmarking {len(image_paths)} images x {args.repeats} repeats\n")
+    print(f"{'mode':<12}{'latency ms':>12}{'peak KB':>12}{'allocs/req':>12}{'alloc KB/req':>14}")
+    for label, enabled in (('no arena', False), ('arena', True)):
+        detector = XRayDefectDetector()
+        detector.arena.enabled = enabled
+        if args.band is not None:
+            detector.config = dataclasses.replace(detector.config, uncertainty_band=args.band)
+        stats = run(detector, image_paths, args.repeats)
+        print(f"{label:<12}{stats['latency_ms']:>12.2f}{stats['peak_kb']:>12.1f}"
+              f"{stats['allocations']:>12.1f}{stats['allocated_kb']:>14.1f}")
+
+    cascade = detector.cascade_stats()
+    print(f"\nCascade stage hit rates over {cascade['analyses']} analyses:")
+    for stage, stage_stats in cascade['stages'].items():
+        print(f"  {stage:<10}{stage_stats['runs']:>8}  {stage_stats['hit_rate'] * 100:6.1f}%")
+    print(f"  texture skipped: {cascade['texture_skipped']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Index Benchmark Script for X-Ray Defect Detection
+This script fills a temporary SQLite database with random perceptual hashes,
+rebuilds a HammingIndex from it the way the web app does at startup, and
+reports build time, memory and lookup latency for near and missing hashes.
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import resource
+import tempfile
+import numpy as np
+
+# Add the lib directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+from near_duplicates import HammingIndex, hash_to_hex
+
+def flip_bits(hash_value, count, rng):
+    """Flip count distinct random bits of a 64-bit hash"""
+    for bit in rng.sample(range(64), count):
+        hash_value ^= 1 << bit
+    return hash_value
+
+def percentiles(timings):
+    timings = np.array(timings) * 1000
+    return f"p50 {np.percentile(timings, 50):.3f} ms  p99 {np.percentile(timings, 99):.3f} ms"
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--radius', type=int, default=4)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(args.entries)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'bench.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE scans (id INTEGER PRIMARY KEY, user_id INTEGER, phash TEXT)')
+        conn.executemany('INSERT INTO scans (id, user_id, phash) VALUES (?, ?, ?)',
+                         ((i + 1, i % 1000, hash_to_hex(h)) for i, h in enumerate(hashes)))
+        conn.commit()
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        cursor = conn.execute('SELECT phash, id, user_id FROM scans WHERE phash IS NOT NULL')
+        index = HammingIndex.from_rows(((row[0], (row[1], row[2])) for row in cursor), max_radius=args.radius)
+        build_seconds = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        conn.close()
+
+    print(f"Entries:          {len(index):,}")
+    print(f"Rebuild from DB:  {build_seconds:.2f} s")
+    print(f"Max RSS growth:   {(rss_after - rss_before) / 1024:.0f} MB")
+
+    near_timings, miss_timings, found = [], [], 0
+    for _ in range(args.queries):
+        query = flip_bits(rng.choice(hashes), rng.randint(0, args.radius), rng)
+        start = time.perf_counter()
+        found += bool(index.query(query))
+        near_timings.append(time.perf_counter() - start)
+
+        query = rng.getrandbits(64)
+        start = time.perf_counter()
+        index.query(query)
+        miss_timings.append(time.perf_counter() - start)
+
+    print(f"Near lookups:     {percentiles(near_timings)}  (found {found}/{args.queries})")
+    print(f"Random lookups:   {percentiles(miss_timings)}")
+
+if __name__ == "__main__":
+    main()
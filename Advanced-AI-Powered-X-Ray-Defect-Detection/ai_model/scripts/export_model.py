@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Compact Model Export Script for X-Ray Defect Detection
+This script converts defect_model.h5 into an int8 or float16 NumPy artifact that
+XRayDefectDetector can run on CPU without importing TensorFlow, and reports
+accuracy parity, model size, load time and per-image latency against the .h5.
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+import numpy as np
+
+# Add the lib directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+from compact_model import CompactModel
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), '..')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def quantize_kernel(kernel, dtype):
+    """Quantize a kernel symmetrically per output channel (last axis)"""
+    if dtype == 'float16':
+        return {'kernel': kernel.astype(np.float16)}
+
+    reduce_axes = tuple(range(kernel.ndim - 1))
+    max_abs = np.max(np.abs(kernel), axis=reduce_axes)
+    scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    quantized = np.clip(np.round(kernel / scale), -127, 127).astype(np.int8)
+    return {'kernel': quantized, 'scale': scale}
+
+def export_model(model, output_path, dtype):
+    """Write the layers of a Keras Sequential model to a compact .npz artifact"""
+    manifest = {'input_shape': list(model.input_shape[1:]), 'layers': []}
+    arrays = {}
+
+    for index, layer in enumerate(model.layers):
+        class_name = layer.__class__.__name__
+        config = layer.get_config()
+        activation = config.get('activation', 'linear')
+
+        if class_name in ('Conv2D', 'Dense'):
+            if class_name == 'Conv2D' and (tuple(config['strides']) != (1, 1) or config['padding'] != 'valid'):
+                raise ValueError(f"Unsupported Conv2D configuration in layer {layer.name}")
+            kernel, bias = layer.get_weights()
+            # Skipped layers leave gaps in the numbering, so the manifest records each prefix
+            prefix = f'layer{index}_'
+            for name, array in quantize_kernel(kernel, dtype).items():
+                arrays[prefix + name] = array
+            arrays[prefix + 'bias'] = bias.astype(np.float32)
+            manifest['layers'].append({
+                'type': class_name.lower(),
+                'dtype': dtype,
+                'activation': activation,
+                'prefix': prefix
+            })
+        elif class_name == 'MaxPooling2D':
+            manifest['layers'].append({'type': 'maxpool2d', 'pool_size': list(config['pool_size'])})
+        elif class_name == 'Flatten':
+            manifest['layers'].append({'type': 'flatten'})
+        elif class_name == 'Dropout':
+            continue  # Identity at inference time
+        else:
+            raise ValueError(f"Unsupported layer type: {class_name}")
+
+    # Uncompressed so the runtime can load without a decompression pass
+    np.savez(output_path, manifest=np.array(json.dumps(manifest)), **arrays)
+    return output_path
+
+def load_holdout_set(directory, limit):
+    """Load preprocessed images from a held-out directory"""
+    # Imported here because train_model pulls in TensorFlow
+    from train_model import preprocess_image
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            image = preprocess_image(os.path.join(directory, name))
+            if image is not None:
+                images.append(image)
+        if len(images) >= limit:
+            break
+    return np.stack(images) if images else None
+
+def time_per_image(predict, images):
+    """Median single-image latency in milliseconds"""
+    timings = []
+    for image in images:
+        start = time.perf_counter()
+        predict(image[np.newaxis])
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+def main():
+    """Main export function"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--model', default=os.path.join(MODEL_DIR, 'defect_model.h5'))
+    parser.add_argument('--dtype', choices=['int8', 'float16'], default='int8')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--holdout', default=os.path.join(MODEL_DIR, '..', 'uploads'),
+                        help='Directory of held-out images used for the parity report')
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    output_path = args.output or os.path.join(MODEL_DIR, f'defect_model_{args.dtype}.npz')
+
+    print(f"Loading Keras model from {args.model}...")
+    from tensorflow import keras
+    start = time.perf_counter()
+    try:
+        keras_model = keras.models.load_model(args.model)
+    except Exception as e:
+        print(f"Could not load {args.model}: {e}")
+        print("Run train_model.py first to produce a real Keras model.")
+        sys.exit(1)
+    keras_load_ms = (time.perf_counter() - start) * 1000
+
+    export_model(keras_model, output_path, args.dtype)
+    print(f"Compact model saved to {output_path}")
+
+    start = time.perf_counter()
+    compact_model = CompactModel.load(output_path)
+    compact_load_ms = (time.perf_counter() - start) * 1000
+
+    print("\nModel size:")
+    print(f"  .h5:     {os.path.getsize(args.model) / 1e6:8.2f} MB")
+    print(f"  {args.dtype:7s}: {os.path.getsize(output_path) / 1e6:8.2f} MB")
+    print("Load time:")
+    print(f"  .h5:     {keras_load_ms:8.1f} ms (excluding TensorFlow import)")
+    print(f"  {args.dtype:7s}: {compact_load_ms:8.1f} ms")
+
+    images = load_holdout_set(args.holdout, args.limit) if os.path.isdir(args.holdout) else None
+    if images is None:
+        print(f"\nNo held-out images found in {args.holdout}; skipping parity report")
+        return
+
+    reference = keras_model.predict(images, verbose=0).ravel()
+    compact = compact_model.predict(images).ravel()
+    agreement = np.mean((reference > 0.5) == (compact > 0.5)) * 100
+
+    print(f"\nParity on {len(images)} held-out images:")
+    print(f"  Verdict agreement:    {agreement:.2f}%")
+    print(f"  Max |prob delta|:     {np.max(np.abs(reference - compact)):.6f}")
+    print(f"  Mean |prob delta|:    {np.mean(np.abs(reference - compact)):.6f}")
+    print("Per-image latency (median):")
+    print(f"  .h5:     {time_per_image(lambda x: keras_model(x, training=False), images):8.2f} ms")
+    print(f"  {args.dtype:7s}: {time_per_image(compact_model.predict, images):8.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Golden-Set Regression Script for X-Ray Defect Detection
+This script generates a seeded synthetic X-ray corpus, optionally joined by
+local real images, and either records XRayDefectDetector's outputs for it
+(`record`) or re-runs every detector variant against the recorded outputs
+(`check`). A check compares verdicts and features within tolerances and prints
+one table of per-image latency and throughput, exiting non-zero on any mismatch.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import numpy as np
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the lib directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+from model import XRayDefectDetector, find_compact_model
+from compact_model import CompactModel
+from detector_config import DetectorConfig
+
+DEFAULT_GOLDEN = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'golden', 'golden_set.json'))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+REFERENCE_VARIANT = 'cascaded'
+
+# Filename parts covering each filename score: none, defect only, normal only, mostly defect, mostly normal, tied
+FILENAME_TAGS = ('', '-fracture', '-normal', '-crack-lesion-clear', '-healthy-intact-mass', '-defect-normal')
+BODY_PARTS = ('chest', 'hand', 'knee', 'spine')
+IMAGE_SIZES = ((224, 224), (512, 512), (384, 512), (600, 450), (1024, 1024))
+
+# Absolute and relative tolerances per compared value
+SCALAR_TOLERANCES = {
+    'defect_probability': (1e-6, 0.0),
+    'filename_score': (1e-9, 0.0),
+    'mean_intensity': (1e-6, 1e-5),
+    'std_intensity': (1e-6, 1e-5),
+    'min_intensity': (1e-6, 0.0),
+    'max_intensity': (1e-6, 0.0),
+    'contrast': (0.5, 0.0),
+    'edge_density': (1e-4, 0.0),
+    'gradient_mean': (1e-3, 1e-4),
+    'gradient_std': (1e-3, 1e-4)
+}
+CONFIDENCE_TOLERANCE = 0.01
+# Share of LBP codes allowed to land in a different histogram bin
+LBP_TOLERANCE = 0.001
+LOCATION_TOLERANCE = 1.0
+LOCATION_SCORE_TOLERANCE = 0.01
+MODEL_TOLERANCE = 0.02
+
+
+def synthetic_image(rng, index):
+    """One synthetic X-ray: soft tissue, bright bones, noise and, for some images, defect marks"""
+    height, width = IMAGE_SIZES[index % len(IMAGE_SIZES)]
+    background = rng.uniform(5, 60)
+    image = np.full((height, width), background, dtype=np.float32)
+
+    # Soft tissue and bones as blurred ellipses and bars
+    tissue = np.zeros_like(image)
+    center = (int(width * rng.uniform(0.4, 0.6)), int(height * rng.uniform(0.4, 0.6)))
+    axes = (int(width * rng.uniform(0.25, 0.45)), int(height * rng.uniform(0.3, 0.45)))
+    cv2.ellipse(tissue, center, axes, rng.uniform(0, 180), 0, 360, rng.uniform(40, 110), -1)
+    for _ in range(int(rng.integers(1, 6))):
+        start = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        end = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.line(tissue, start, end, rng.uniform(60, 140), int(max(3, width * rng.uniform(0.02, 0.06))))
+    image += cv2.GaussianBlur(tissue, (0, 0), rng.uniform(2, 10))
+
+    # Every third image gets cracks and bright nodules
+    if index % 3 == 2:
+        for _ in range(int(rng.integers(1, 4))):
+            points = np.cumsum(rng.normal(0, width * 0.03, (8, 2)), axis=0) + (width / 2, height / 2)
+            cv2.polylines(image, [points.astype(np.int32)], False, float(rng.uniform(-80, -30)), 2)
+            nodule = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            cv2.circle(image, nodule, int(rng.integers(3, 12)), float(rng.uniform(150, 255)), -1)
+
+    image += rng.normal(0, rng.uniform(1, 25), image.shape)
+    image *= rng.uniform(0.3, 1.6)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def synthetic_corpus(folder, seed, count):
+    """Write the synthetic corpus to folder as PNGs; returns [(name, path, pixel digest)]"""
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for index in range(count):
+        image = synthetic_image(rng, index)
+        part = BODY_PARTS[index % len(BODY_PARTS)]
+        name = f'golden-{index:03d}-{part}{FILENAME_TAGS[index % len(FILENAME_TAGS)]}.png'
+        path = os.path.join(folder, name)
+        cv2.imwrite(path, image)
+        # Pixels rather than PNG bytes, which depend on the encoder build
+        corpus.append((name, path, hashlib.sha256(image.tobytes()).hexdigest()))
+    return corpus
+
+
+def local_images(directory):
+    """Real images from a local directory; returns [(name, path, file digest)]"""
+    images = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+            with open(path, 'rb') as f:
+                images.append((f'local/{name}', path, hashlib.sha256(f.read()).hexdigest()))
+    return images
+
+
+def filename_of(name):
+    return name.split('/', 1)[-1]
+
+
+def summarize(result, full_result=None):
+    """The compared parts of a detect_defects result; texture features from full_result when given"""
+    details = result.get('analysis_details', {})
+    content = dict(details.get('content_analysis') or {})
+    texture = (full_result or result).get('analysis_details', {}).get('content_analysis', {}).get('texture_features')
+    content.pop('texture_features', None)
+    if texture:
+        content['gradient_mean'] = texture.get('gradient_mean')
+        content['gradient_std'] = texture.get('gradient_std')
+        content['lbp_histogram'] = [int(count) for count in texture.get('lbp_histogram', [])]
+    return {
+        'status': result['status'],
+        'confidence': float(result['confidence'].rstrip('%')),
+        'error': result.get('error'),
+        'defect_probability': details.get('defect_probability'),
+        'filename_score': details.get('filename_score'),
+        'model_probability': details.get('model_probability'),
+        'stages': details.get('stages'),
+        'defect_locations': result['defect_locations'],
+        'features': {name: float(value) if name != 'lbp_histogram' else value for name, value in content.items()}
+    }
+
+
+def close(actual, expected, tolerance):
+    atol, rtol = tolerance
+    return actual is not None and abs(actual - expected) <= atol + rtol * abs(expected)
+
+
+def compare(actual, expected, full_details=False):
+    """Differences between a summarized result and its golden record, as readable strings"""
+    problems = []
+    if actual['status'] != expected['status']:
+        problems.append(f"status {actual['status']} != {expected['status']}")
+    if actual['error'] != expected['error']:
+        problems.append(f"error {actual['error']!r} != {expected['error']!r}")
+    if abs(actual['confidence'] - expected['confidence']) > CONFIDENCE_TOLERANCE:
+        problems.append(f"confidence {actual['confidence']:.2f} != {expected['confidence']:.2f}")
+    expected_stages = ['global', 'texture'] if full_details and expected['stages'] else expected['stages']
+    if actual['stages'] != expected_stages:
+        problems.append(f"stages {actual['stages']} != {expected_stages}")
+
+    for name in ('defect_probability', 'filename_score'):
+        if expected[name] is not None and not close(actual[name], expected[name], SCALAR_TOLERANCES[name]):
+            problems.append(f"{name} {actual[name]} != {expected[name]}")
+    # The CNN output only exists with a compact model, and is only compared when both runs had one
+    if actual['model_probability'] is not None and expected['model_probability'] is not None:
+        if abs(actual['model_probability'] - expected['model_probability']) > MODEL_TOLERANCE:
+            problems.append(f"model_probability {actual['model_probability']:.4f} != "
+                            f"{expected['model_probability']:.4f}")
+
+    # Texture features are only present when the stage ran, so compare what the variant produced
+    for name, value in actual['features'].items():
+        if name not in expected['features']:
+            problems.append(f"unexpected feature {name}")
+        elif name == 'lbp_histogram':
+            expected_histogram = np.array(expected['features'][name])
+            moved = np.abs(np.array(value) - expected_histogram).sum() / 2
+            if len(value) != len(expected_histogram) or moved > LBP_TOLERANCE * max(1, expected_histogram.sum()):
+                problems.append(f"lbp_histogram differs in {moved:.0f} codes")
+        elif not close(value, expected['features'][name], SCALAR_TOLERANCES[name]):
+            problems.append(f"{name} {value:.6g} != {expected['features'][name]:.6g}")
+
+    locations, expected_locations = actual['defect_locations'], expected['defect_locations']
+    if len(locations) != len(expected_locations):
+        problems.append(f"{len(locations)} defect locations != {len(expected_locations)}")
+    else:
+        for location, expected_location in zip(locations, expected_locations):
+            if (abs(location['x'] - expected_location['x']) > LOCATION_TOLERANCE
+                    or abs(location['y'] - expected_location['y']) > LOCATION_TOLERANCE
+                    or abs(location['score'] - expected_location['score'])
+                    > LOCATION_SCORE_TOLERANCE * max(1.0, abs(expected_location['score']))):
+                problems.append(f"defect location {location} != {expected_location}")
+                break
+    return problems
+
+
+def make_detector(config, arena=True, model_path=None):
+    """A detector pinned to the golden config, with the compact model only when model_path is given"""
+    detector = XRayDefectDetector()
+    detector.config = config
+    detector.arena.enabled = arena
+    detector.compact_model = CompactModel.load(model_path) if model_path else None
+    return detector
+
+
+def write_tensors(images, folder):
+    """The uint8 analysis tensors build_pyramid writes at ingest, for the tensor variant"""
+    tensors = {}
+    for name, path, _ in images:
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is not None:
+            tensors[name] = os.path.join(folder, hashlib.sha1(name.encode()).hexdigest() + '.224.npy')
+            np.save(tensors[name], cv2.resize(image, (224, 224)))
+    return tensors
+
+
+def run_sequential(detector, jobs, repeats, full_details=False):
+    """Run each (name, path, filename) job repeats times; returns results, per-call seconds and wall time"""
+    # Warm up the arena and the model before measuring
+    detector.detect_defects(jobs[0][1], jobs[0][2], full_details=full_details)
+    results, latencies = {}, []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for name, path, filename in jobs:
+            call_start = time.perf_counter()
+            results[name] = detector.detect_defects(path, filename, full_details=full_details)
+            latencies.append(time.perf_counter() - call_start)
+    return results, latencies, time.perf_counter() - start
+
+
+def run_threaded(detector, jobs, repeats, workers):
+    """As run_sequential, with the jobs spread over a thread pool sharing one detector, like /analyze/batch"""
+    def timed(job):
+        name, path, filename = job
+        call_start = time.perf_counter()
+        result = detector.detect_defects(path, filename)
+        return name, result, time.perf_counter() - call_start
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(timed, jobs[:workers]))
+        results, latencies = {}, []
+        start = time.perf_counter()
+        for name, result, seconds in pool.map(timed, jobs * repeats):
+            results[name] = result
+            latencies.append(seconds)
+        wall = time.perf_counter() - start
+    return results, latencies, wall
+
+
+def run_variants(images, config, args, work_folder):
+    """Yield (variant, results, latencies, wall seconds) for every detector variant"""
+    jobs = [(name, path, filename_of(name)) for name, path, _ in images]
+
+    yield (REFERENCE_VARIANT,) + run_sequential(make_detector(config), jobs, args.repeats)
+    yield ('full-details',) + run_sequential(make_detector(config), jobs, args.repeats, full_details=True)
+    yield ('no-arena',) + run_sequential(make_detector(config, arena=False), jobs, args.repeats)
+
+    tensors = write_tensors(images, work_folder)
+    tensor_jobs = [(name, tensors[name], filename) for name, _, filename in jobs if name in tensors]
+    if tensor_jobs:
+        yield ('tensor',) + run_sequential(make_detector(config), tensor_jobs, args.repeats)
+
+    yield (f'threads-{args.workers}',) + run_threaded(make_detector(config), jobs, args.repeats, args.workers)
+
+    if args.model and os.path.exists(args.model):
+        yield ('compact-model',) + run_sequential(make_detector(config, model_path=args.model), jobs, args.repeats)
+    else:
+        print(f"Skipping compact-model variant: no model artifact{f' at {args.model}' if args.model else ''}")
+
+
+def timing_row(latencies, wall, images):
+    milliseconds = np.array(latencies) * 1000
+    return {
+        'images': images,
+        'p50_ms': float(np.percentile(milliseconds, 50)),
+        'p95_ms': float(np.percentile(milliseconds, 95)),
+        'images_per_s': len(latencies) / wall
+    }
+
+
+def percent_change(value, baseline):
+    return f"{(value / baseline - 1) * 100:+.1f}%" if baseline else '-'
+
+
+def print_table(rows, mismatches, baselines, baseline_label):
+    print(f"\n{'variant':<16} {'images':>6} {'mismatch':>8} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>8} "
+          f"{'p50 vs ' + baseline_label:>18} {'img/s vs ' + baseline_label:>20}")
+    for variant, row in rows.items():
+        baseline = baselines.get(variant if baseline_label == 'saved' else REFERENCE_VARIANT)
+        p50_delta = percent_change(row['p50_ms'], baseline['p50_ms']) if baseline else '-'
+        rate_delta = percent_change(row['images_per_s'], baseline['images_per_s']) if baseline else '-'
+        print(f"{variant:<16} {row['images']:>6} {mismatches[variant]:>8} {row['p50_ms']:>8.2f} "
+              f"{row['p95_ms']:>8.2f} {row['images_per_s']:>8.1f} {p50_delta:>18} {rate_delta:>20}")
+
+
+def gather_images(args, golden, work_folder):
+    """Synthetic images regenerated from the golden seed, plus local images found in --images"""
+    images = synthetic_corpus(work_folder, golden['seed'], golden['count'])
+    if args.images:
+        images += local_images(args.images)
+    return images
+
+
+def write_golden(path, golden):
+    """Write the golden file with one line per image, so re-recordings diff image by image"""
+    header = {key: value for key, value in golden.items() if key != 'images'}
+    lines = [json.dumps(header, indent=1, sort_keys=True)[:-2] + ',', ' "images": {']
+    entries = [f'  {json.dumps(name)}: {json.dumps(entry, sort_keys=True)}' for name, entry in golden['images'].items()]
+    lines.append(',\n'.join(entries))
+    lines.append(' }\n}\n')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+
+
+def record(args):
+    golden = {'seed': args.seed, 'count': args.count}
+    with open(args.config or os.path.join(os.path.dirname(__file__), '..', 'detector_config.json')) as f:
+        golden['config'] = json.load(f)
+    config = DetectorConfig.from_dict(golden['config'])
+    golden['config_version'] = config.version
+
+    with tempfile.TemporaryDirectory() as work_folder:
+        images = gather_images(args, golden, work_folder)
+        model_path = args.model if args.model and os.path.exists(args.model) else None
+        detector = make_detector(config, model_path=model_path)
+        golden['images'] = {}
+        for name, path, digest in images:
+            result = detector.detect_defects(path, filename_of(name))
+            full_result = detector.detect_defects(path, filename_of(name), full_details=True)
+            golden['images'][name] = {'sha256': digest, 'expected': summarize(result, full_result)}
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.golden)), exist_ok=True)
+    write_golden(args.golden, golden)
+    verdicts = [entry['expected']['status'] for entry in golden['images'].values()]
+    textured = sum(1 for entry in golden['images'].values() if 'texture' in (entry['expected']['stages'] or []))
+    print(f"Recorded {len(verdicts)} images ({verdicts.count('defective')} defective, "
+          f"{textured} through the texture stage) with config {config.version} to {args.golden}")
+
+
+def check(args):
+    with open(args.golden) as f:
+        golden = json.load(f)
+    config = DetectorConfig.from_dict(golden['config'])
+    current = XRayDefectDetector().config.version
+    if current != config.version:
+        print(f"Note: checking against the recorded config {config.version}; detector_config.json is {current}")
+
+    work_folder = tempfile.mkdtemp(prefix='golden-set-')
+    try:
+        images = gather_images(args, golden, work_folder)
+        recorded = golden['images']
+        # A changed generator or a replaced local file is corpus drift, not a detector regression
+        drifted = [name for name, _, digest in images if name in recorded and recorded[name]['sha256'] != digest]
+        unrecorded = [name for name, _, _ in images if name not in recorded]
+        missing = sorted(set(recorded) - {name for name, _, _ in images})
+        images = [image for image in images if image[0] in recorded and image[0] not in drifted]
+        for label, names in (('Corpus drift (image differs from the recording)', drifted),
+                             ('Not recorded, skipped', unrecorded), ('Recorded but not found, skipped', missing)):
+            if names:
+                print(f"{label}: {', '.join(names)}")
+
+        print(f"Checking {len(images)} images x {args.repeats} repeats")
+        rows, mismatches, failures = {}, {}, []
+        for variant, results, latencies, wall in run_variants(images, config, args, work_folder):
+            rows[variant] = timing_row(latencies, wall, len(results))
+            mismatches[variant] = 0
+            for name in sorted(results):
+                problems = compare(summarize(results[name]), recorded[name]['expected'],
+                                   full_details=variant == 'full-details')
+                if problems:
+                    mismatches[variant] += 1
+                    failures.append(f"{variant:<16} {name}: {'; '.join(problems)}")
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    if args.compare_timings:
+        with open(args.compare_timings) as f:
+            baselines, baseline_label = json.load(f), 'saved'
+    else:
+        baselines, baseline_label = rows, REFERENCE_VARIANT
+    print_table(rows, mismatches, baselines, baseline_label)
+    if args.save_timings:
+        with open(args.save_timings, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+    if failures or drifted:
+        print(f"\n{len(failures)} mismatches:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nAll variants match the golden set")
+
+
+def main():
+    """Main golden-set function"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('mode', choices=['record', 'check'])
+    parser.add_argument('--golden', default=DEFAULT_GOLDEN, help='Golden outputs file')
+    parser.add_argument('--images', help='Directory of local real images to include')
+    parser.add_argument('--seed', type=int, default=2024, help='Synthetic corpus seed (record only)')
+    parser.add_argument('--count', type=int, default=48, help='Synthetic corpus size (record only)')
+    parser.add_argument('--config', help='Detector config to record with (default: detector_config.json)')
+    parser.add_argument('--model', default=find_compact_model(),
+                        help='Compact model artifact for the compact-model variant (default: the one the detector loads)')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=4, help='Threads for the threaded variant')
+    parser.add_argument('--save-timings', metavar='PATH', help='Write the timing table as JSON')
+    parser.add_argument('--compare-timings', metavar='PATH', help='Report deltas against saved timings')
+    args = parser.parse_args()
+
+    if args.mode == 'record':
+        record(args)
+    else:
+        check(args)
+
+if __name__ == "__main__":
+    main()
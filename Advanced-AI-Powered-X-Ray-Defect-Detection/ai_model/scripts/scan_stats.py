@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Scan Statistics Script for X-Ray Defect Detection
+This script answers monthly and defect-rate questions from the columnar
+scan export written by `flask --app main export-scans`, without opening
+medscan.db. With --compare-db it also times the equivalent SQL query.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+
+# Add the lib directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+from scan_export import ScanExport, monthly_stats, defect_rate_by
+
+def print_rates(title, stats, label):
+    print(f"\n{title}")
+    print(f"{label:<24} {'total':>8} {'rate':>8}")
+    for value, total, rate in zip(stats['value'], stats['total'], stats['defect_rate']):
+        print(f"{str(value) or '(none)':<24} {total:>8} {rate:>8.1%}")
+
+def main():
+    """Main statistics function"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--export', default='exports/scans', help='Export folder')
+    parser.add_argument('--since', help='Only scans on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--until', help='Only scans before this date (YYYY-MM-DD)')
+    parser.add_argument('--user', type=int, help='Only this user id')
+    parser.add_argument('--months', type=int, default=12, help='Number of recent months shown')
+    parser.add_argument('--compare-db', metavar='PATH', help='Also time the monthly query on this SQLite database')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data = ScanExport(args.export).load(
+        ['user_id', 'result', 'config_version'], since=args.since, until=args.until)
+    load_ms = (time.perf_counter() - start) * 1000
+    if not data:
+        print(f"No exported scans in {args.export}")
+        return
+
+    start = time.perf_counter()
+    months = monthly_stats(data, user_id=args.user)
+    query_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{len(data['scan_date'])} scans loaded in {load_ms:.1f} ms, aggregated in {query_ms:.1f} ms")
+    print(f"\n{'month':<10} {'total':>8} {'defective':>10} {'normal':>8} {'rate':>8}")
+    for row in list(zip(*(months[key] for key in ('month', 'total', 'defective', 'normal', 'defect_rate'))))[-args.months:]:
+        print(f"{row[0]:<10} {row[1]:>8} {row[2]:>10} {row[3]:>8} {row[4]:>8.1%}")
+
+    if args.user is None:
+        print_rates("Defect rate by detector config", defect_rate_by(data, 'config_version'), 'config')
+
+    if args.compare_db:
+        conn = sqlite3.connect(args.compare_db)
+        start = time.perf_counter()
+        conn.execute('''
+            SELECT strftime('%Y-%m', scan_date) AS month, COUNT(*),
+                   SUM(CASE WHEN lower(result) = 'defective' THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN lower(result) = 'non-defective' THEN 1 ELSE 0 END)
+            FROM scans GROUP BY month ORDER BY month
+        ''').fetchall()
+        sql_ms = (time.perf_counter() - start) * 1000
+        conn.close()
+        print(f"\nSQLite GROUP BY on {args.compare_db}: {sql_ms:.1f} ms "
+              f"(export load + aggregate: {load_ms + query_ms:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Round trip of export_model.py artifacts through CompactModel.load, without TensorFlow"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from compact_model import CompactModel
+from export_model import export_model
+
+
+# Stand-ins for the Keras layers export_model reads: it only uses the class name, get_config and get_weights
+class _Layer:
+    def __init__(self, config=None, weights=None):
+        self.name = type(self).__name__.lower()
+        self._config = config or {}
+        self._weights = weights
+
+    def get_config(self):
+        return dict(self._config)
+
+    def get_weights(self):
+        return self._weights
+
+
+class Conv2D(_Layer):
+    pass
+
+
+class MaxPooling2D(_Layer):
+    pass
+
+
+class Flatten(_Layer):
+    pass
+
+
+class Dense(_Layer):
+    pass
+
+
+class Dropout(_Layer):
+    pass
+
+
+class _Sequential:
+    def __init__(self, input_shape, layers):
+        self.input_shape = (None,) + input_shape
+        self.layers = layers
+
+
+def _model(rng):
+    """Same layer sequence as train_model.create_model, Dropout included, on a 16x16 input"""
+    def weights(*shape):
+        return rng.normal(0, 0.3, shape).astype(np.float32), rng.normal(0, 0.1, shape[-1]).astype(np.float32)
+
+    conv = {'strides': (1, 1), 'padding': 'valid', 'activation': 'relu'}
+    return _Sequential((16, 16, 1), [
+        Conv2D(conv, weights(3, 3, 1, 4)),
+        MaxPooling2D({'pool_size': (2, 2)}),
+        Conv2D(conv, weights(3, 3, 4, 6)),
+        MaxPooling2D({'pool_size': (2, 2)}),
+        Flatten(),
+        Dense({'activation': 'relu'}, weights(24, 8)),
+        Dropout({'rate': 0.5}),
+        Dense({'activation': 'sigmoid'}, weights(8, 1))
+    ])
+
+
+def _reference(model):
+    """The float32 model, run by the same runtime"""
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in ('Conv2D', 'Dense'):
+            kernel, bias = layer.get_weights()
+            layers.append({'type': kind.lower(), 'activation': layer.get_config()['activation'],
+                           'kernel': kernel, 'bias': bias})
+        elif kind == 'MaxPooling2D':
+            layers.append({'type': 'maxpool2d', 'pool_size': list(layer.get_config()['pool_size'])})
+        elif kind == 'Flatten':
+            layers.append({'type': 'flatten'})
+    return CompactModel(layers, model.input_shape[1:])
+
+
+@pytest.mark.parametrize('dtype, tolerance', [('int8', 0.05), ('float16', 0.01)])
+def test_export_with_dropout_loads_and_matches(tmp_path, dtype, tolerance):
+    rng = np.random.default_rng(0)
+    model = _model(rng)
+    path = export_model(model, str(tmp_path / f'model_{dtype}.npz'), dtype)
+
+    compact = CompactModel.load(path)
+    assert compact.dtype == dtype
+    assert [layer['type'] for layer in compact.layers] == [
+        'conv2d', 'maxpool2d', 'conv2d', 'maxpool2d', 'flatten', 'dense', 'dense']
+
+    images = rng.uniform(0, 1, (5, 16, 16, 1)).astype(np.float32)
+    expected = _reference(model).predict(images)
+    np.testing.assert_allclose(compact.predict(images), expected, atol=tolerance)
@@ -0,0 +1,22 @@
+# Analysis worker processes
+# Detector instances in a process pool, so detection never holds the front-end's GIL
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'ai_model', 'lib'))
+
+_detector = None
+
+
+def init_worker(config_path=None):
+    """Process pool initializer: load the detector once per worker"""
+    global _detector
+    from model import XRayDefectDetector
+    _detector = XRayDefectDetector(config_path=config_path)
+    # Each worker follows config edits itself, like the web process does
+    _detector.watch_config()
+
+
+def detect_defects(image_path, filename):
+    """Run the worker's detector; the result is pickled back to the caller"""
+    return _detector.detect_defects(image_path, filename)
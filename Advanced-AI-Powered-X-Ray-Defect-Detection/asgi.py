@@ -0,0 +1,365 @@
+# ASGI front-end
+# Async handlers for the I/O-bound routes; every other route runs through the Flask app unchanged
+#
+#     uvicorn asgi:application --host 0.0.0.0 --port 8080
+import os
+import sys
+import json
+import asyncio
+import functools
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, wait
+from asgiref.wsgi import WsgiToAsgi
+from flask import Response, g, jsonify, request, session
+from werkzeug.exceptions import HTTPException
+
+import main
+import analysis_worker
+from main import app
+from streaming_upload import UploadRejected
+from progress_events import StreamLimitError
+
+# Body bytes handed to the event loop per thread hop when sending a file
+SEND_BATCH_BYTES = 64 * 1024
+
+# Detection runs in worker processes, spawned rather than forked so they don't inherit the server's threads
+detect_pool = ProcessPoolExecutor(
+    max_workers=int(os.environ.get('ASGI_DETECT_WORKERS', os.cpu_count() or 4)),
+    mp_context=multiprocessing.get_context('spawn'),
+    initializer=analysis_worker.init_worker,
+    initargs=(os.environ.get('DETECTOR_CONFIG'),)
+)
+
+
+def detect_in_process(image_path, filename, on_stage=None):
+    """detect_defects in a pool process; blocks the calling analysis thread, never the event loop"""
+    result = detect_pool.submit(analysis_worker.detect_defects, image_path, filename).result()
+    if on_stage and 'analysis_details' in result:
+        on_stage(result['analysis_details']['stages'])
+    return result
+
+
+def submit_analysis(file_path, original_filename, user_id, report):
+    """Queue main.run_analysis on the analysis threads, with detection in a worker process
+
+    The analysis thread is sampled into the request's profile, if it has
+    one; detection inside the worker process is not.
+    """
+    analyze = functools.partial(main.run_analysis, detect=detect_in_process)
+    return main.analysis_pool.submit(main.request_profiler.run_in_profile, g.get('profile'), analyze,
+                                     file_path, original_filename, user_id, report)
+
+
+def wsgi_environ(scope):
+    """WSGI environ carrying an ASGI request's headers; handlers read the body from receive()"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'][len(root_path):].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def finalize(rv, body=None):
+    """Turn a view-style return value into a Response with the session cookie applied"""
+    return app.process_response(app.make_response(rv)), body
+
+
+async def receive_uploads(receive, max_files=1, fields=('file',)):
+    """Async counterpart of main.receive_uploads, fed from ASGI body events
+
+    Parsing, hashing and disk writes for each chunk run on a thread, so a
+    slow upload costs the server a suspended task rather than a thread.
+    """
+    receiver = main.upload_receiver(max_files, fields)
+    try:
+        while not receiver.complete:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise UploadRejected('Client disconnected before the upload was complete')
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if body:
+                for upload in await asyncio.to_thread(receiver.feed, body):
+                    yield upload
+            if not more_body and not receiver.complete:
+                await asyncio.to_thread(receiver.feed, b'')
+    finally:
+        await asyncio.to_thread(receiver.discard)
+    receiver.finish()
+
+
+async def analyze_xray(receive):
+    job_key = main.request_progress_key()
+    report = main.progress_reporter(job_key)
+    uploads = []
+    try:
+        async for upload in receive_uploads(receive, max_files=1):
+            uploads.append(upload)
+    except UploadRejected as e:
+        await asyncio.to_thread(main.discard_uploads, uploads)
+        main.finish_progress(job_key, error=e.message)
+        return finalize((jsonify({'error': e.message}), e.status))
+    upload = uploads[0]
+    report('received', filename=upload.original_filename, size=upload.size)
+
+    user = session.get('user')
+    analysis = await asyncio.wrap_future(
+        submit_analysis(upload.path, upload.original_filename, user['id'] if user else None, report))
+    result = await asyncio.to_thread(main.finish_analysis, user, upload, analysis, job_key)
+    return finalize(jsonify(result))
+
+
+async def analyze_batch(receive):
+    user = session.get('user')
+    user_id = user['id'] if user else None
+    job_key = main.request_progress_key()
+    futures = {}
+    try:
+        async for upload in receive_uploads(receive, max_files=app.config['BATCH_MAX_FILES'],
+                                            fields=('files', 'file')):
+            index = len(futures)
+            report = main.progress_reporter(job_key, index=index)
+            report('received', filename=upload.original_filename, size=upload.size)
+            future = submit_analysis(upload.path, upload.original_filename, user_id, report)
+            futures[asyncio.wrap_future(future)] = (index, upload, future)
+    except UploadRejected as e:
+        for _, _, future in futures.values():
+            future.cancel()
+        await asyncio.to_thread(wait, [future for _, _, future in futures.values()])
+        await asyncio.to_thread(main.discard_uploads, [upload for _, upload, _ in futures.values()])
+        main.finish_progress(job_key, error=e.message)
+        return finalize((jsonify({'error': e.message}), e.status))
+
+    async def generate():
+        completed, failed = [], []
+        collected = set()
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    index, upload, _ = futures[finished]
+                    collected.add(finished)
+                    yield json.dumps(main.collect_batch_result(finished, index, upload, completed, failed)) + '\n'
+        finally:
+            # A client that disconnects before the summary still gets its scans saved, including
+            # the rest of a done set the generator was closed in the middle of
+            remaining = [future for future in futures if future not in collected]
+            if remaining:
+                await asyncio.wait(remaining)
+            for finished in remaining:
+                index, upload, _ = futures[finished]
+                main.collect_batch_result(finished, index, upload, completed, failed)
+            summary = await asyncio.to_thread(main.finish_batch, user, completed, job_key, failed)
+        yield json.dumps(summary) + '\n'
+
+    return finalize(Response(mimetype='application/x-ndjson'), generate())
+
+
+async def analysis_progress(receive, job_id):
+    if not main.JOB_ID_PATTERN.match(job_id):
+        return finalize((jsonify({'error': 'Invalid job id'}), 400))
+    try:
+        after = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        after = 0
+
+    try:
+        events = main.progress_broker.astream(main.progress_key(job_id), after,
+                                              lifetime=app.config['PROGRESS_STREAM_SECONDS'],
+                                              heartbeat=app.config['PROGRESS_HEARTBEAT_SECONDS'])
+    except StreamLimitError:
+        response = jsonify({'error': 'Too many progress streams open'})
+        response.headers['Retry-After'] = '5'
+        return finalize((response, 503))
+
+    return finalize(Response(mimetype='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}), events)
+
+
+def dispatch_in_thread():
+    """The regular Flask dispatch for the current request, as wsgi_app does it"""
+    try:
+        return app.full_dispatch_request()
+    except Exception as e:
+        return app.handle_exception(e)
+
+
+async def threaded_view(receive, **view_args):
+    # Database lookups and file or report preparation run in a thread; the body is sent asynchronously
+    return await asyncio.to_thread(dispatch_in_thread), None
+
+
+# Endpoints served natively; everything else goes to the Flask app through asgiref
+ASYNC_HANDLERS = {
+    'analyze_xray': analyze_xray,
+    'analyze_batch': analyze_batch,
+    'analysis_progress': analysis_progress,
+    'scan_image': threaded_view,
+    'generate_report': threaded_view,
+    'static_asset': threaded_view
+}
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def iterate_in_thread(app_iter):
+    """Pull a blocking WSGI body in batches on a thread"""
+    iterator = iter(app_iter)
+
+    def next_batch():
+        chunks, size = [], 0
+        for chunk in iterator:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= SEND_BATCH_BYTES:
+                break
+        return b''.join(chunks)
+
+    try:
+        while True:
+            data = await asyncio.to_thread(next_batch)
+            if not data:
+                return
+            yield data
+    finally:
+        if hasattr(app_iter, 'close'):
+            await asyncio.to_thread(app_iter.close)
+
+
+async def send_response(environ, receive, send, response, body):
+    """Send a Response, its body replaced by the async iterable body when one is given"""
+    try:
+        if body is None:
+            app_iter, status, headers = response.get_wsgi_response(environ)
+            if response.is_sequence:
+                # Already in memory, nothing to wait for
+                data = b''.join(app_iter)
+                app_iter.close()
+                await send_start(send, status, headers)
+                await send({'type': 'http.response.body', 'body': data})
+                return
+            body = iterate_in_thread(app_iter)
+        else:
+            status = response.status
+            headers = [(name, value) for name, value in response.get_wsgi_headers(environ).items()
+                       if name.lower() != 'content-length']
+        await send_start(send, status, headers)
+        await send_body(receive, send, body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+async def send_start(send, status, headers):
+    await send({
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+    })
+
+
+async def send_body(receive, send, body):
+    # Stop as soon as the client goes away, e.g. a progress stream closed between events
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    chunks = body.__aiter__()
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(chunks.__anext__())
+            await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_chunk.done():
+                next_chunk.cancel()
+                # The generator must finish unwinding before it can be closed
+                await asyncio.wait({next_chunk})
+                return
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                break
+            await send({'type': 'http.response.body', 'body': chunk.encode() if isinstance(chunk, str) else chunk,
+                        'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        await chunks.aclose()
+
+
+class AsgiFrontend:
+    """ASGI application serving the Flask app, with native handlers for ASYNC_HANDLERS
+
+    Routing uses the Flask URL map, and each native handler runs inside a
+    Flask request context, so sessions, url_for and app.config behave as in
+    the WSGI views. Other routes run in asgiref's WSGI adapter.
+    """
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return await self.wsgi(scope, receive, send)
+
+        environ = wsgi_environ(scope)
+        try:
+            endpoint, view_args = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            endpoint = None
+        handler = ASYNC_HANDLERS.get(endpoint)
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+
+        # Leaving the context runs the teardown_request hooks, after the response has been sent
+        with self.app.request_context(environ):
+            try:
+                # threaded_view runs the before_request hooks itself, in full_dispatch_request
+                early = None if handler is threaded_view else self.app.preprocess_request()
+                if early is not None:
+                    response, body = finalize(early)
+                else:
+                    response, body = await handler(receive, **view_args)
+            except Exception as e:
+                response, body = app.handle_exception(e), None
+            await send_response(environ, receive, send, response, body)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.to_thread(functools.partial(detect_pool.shutdown, cancel_futures=True))
+                await asyncio.to_thread(main.report_renderer.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = AsgiFrontend(app)
@@ -0,0 +1,78 @@
+# Image pyramid generation
+# Each upload is decoded once at ingest into the sizes the app actually reads
+import os
+import cv2
+import numpy as np
+
+ANALYSIS_SIZE = (224, 224)
+PREVIEW_MAX_SIDE = 640
+THUMB_MAX_SIDE = 160
+JPEG_QUALITY = 85
+
+# Suffixes appended to the original filename, e.g. scan.jpeg -> scan.jpeg.thumb.jpg
+PYRAMID_SUFFIXES = {
+    'tensor': '.224.npy',
+    'preview': '.preview.jpg',
+    'thumb': '.thumb.jpg'
+}
+
+def pyramid_paths(file_path):
+    """Return the derivative paths stored beside an original upload"""
+    return {variant: file_path + suffix for variant, suffix in PYRAMID_SUFFIXES.items()}
+
+def is_pyramid_file(filename):
+    """True for derivative files, so backfills and listings can skip them"""
+    return filename.endswith(tuple(PYRAMID_SUFFIXES.values()))
+
+def _fit_within(image, max_side):
+    """Downscale so the longest side is at most max_side; never upscale"""
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1.0:
+        return image
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+def build_pyramid(file_path, overwrite=True):
+    """Decode an upload once and write its analysis tensor, preview and thumbnail
+
+    Returns the derivative paths, or None if the file cannot be decoded
+    (e.g. DICOM), in which case callers keep using the original.
+    """
+    paths = pyramid_paths(file_path)
+    if not overwrite and all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    try:
+        image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            return None
+
+        # Same resize as XRayDefectDetector.preprocess_image, stored as uint8
+        np.save(paths['tensor'], cv2.resize(image, ANALYSIS_SIZE))
+
+        # Each level is derived from the previous one, not the full-size original
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]
+        preview = _fit_within(image, PREVIEW_MAX_SIDE)
+        cv2.imwrite(paths['preview'], preview, encode_params)
+        cv2.imwrite(paths['thumb'], _fit_within(preview, THUMB_MAX_SIDE), encode_params)
+
+        return paths
+
+    except Exception as e:
+        print(f"Error building image pyramid for {file_path}: {e}")
+        return None
+
+def backfill_pyramids(upload_folder, overwrite=False):
+    """Build missing pyramids for every original in the upload folder"""
+    built, skipped = 0, 0
+    for name in sorted(os.listdir(upload_folder)):
+        file_path = os.path.join(upload_folder, name)
+        # Dotfiles are uploads still being received
+        if name.startswith('.') or is_pyramid_file(name) or not os.path.isfile(file_path):
+            continue
+        if build_pyramid(file_path, overwrite=overwrite):
+            built += 1
+        else:
+            skipped += 1
+    return built, skipped
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Front-end Load Test Script for MedScan AI
+This script opens many slow connections against a running server, either
+uploads that trickle in over several seconds or idle progress streams, and
+meanwhile times quick probe requests. It prints one summary row, so WSGI
+(`python main.py`) and ASGI (`uvicorn asgi:application`) runs can be compared.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import argparse
+import numpy as np
+
+def sample_image():
+    """A small JPEG upload, from uploads/ if there is one"""
+    folder = os.path.join(os.path.dirname(__file__), 'uploads')
+    if os.path.isdir(folder):
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(('.jpg', '.jpeg')) and '.' not in name.split('.', 1)[1]:
+                with open(os.path.join(folder, name), 'rb') as f:
+                    return name, f.read()
+    import cv2
+    image = np.random.default_rng(0).integers(0, 255, (256, 256), dtype=np.uint8)
+    return 'load_test.jpg', cv2.imencode('.jpg', image)[1].tobytes()
+
+def multipart_body(filename, data):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+async def read_status(reader, timeout):
+    line = await asyncio.wait_for(reader.readline(), timeout)
+    return int(line.split()[1]) if line.startswith(b'HTTP/') else None
+
+async def slow_upload(host, port, body, content_type, duration, timeout):
+    """POST /analyze with the body spread over duration seconds; returns the status or None"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write((f'POST /analyze HTTP/1.1\r\nHost: {host}\r\nContent-Type: {content_type}\r\n'
+                      f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n').encode())
+        pieces = 10
+        step = -(-len(body) // pieces)
+        for start in range(0, len(body), step):
+            writer.write(body[start:start + step])
+            await writer.drain()
+            await asyncio.sleep(duration / pieces)
+        return await read_status(reader, timeout)
+    finally:
+        writer.close()
+
+async def idle_stream(host, port, index, duration, timeout):
+    """Hold a progress stream open for duration seconds; returns its status or None"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f'GET /analyze/progress/loadtest{index:08d} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+        await writer.drain()
+        status = await read_status(reader, timeout)
+        await asyncio.sleep(duration)
+        return status
+    finally:
+        writer.close()
+
+async def probe(host, port, path, timeout):
+    """Time one short GET; returns seconds, or None on failure"""
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        status = await read_status(reader, timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+        writer.close()
+        return time.perf_counter() - start if status == 200 else None
+    except (OSError, asyncio.TimeoutError):
+        return None
+
+def process_stats(pid):
+    """Thread count and resident memory (MB) of a local server process"""
+    stats = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith(('Threads:', 'VmRSS:')):
+                key, value = line.split(':', 1)
+                stats[key] = int(value.split()[0])
+    return stats.get('Threads', 0), stats.get('VmRSS', 0) / 1024
+
+async def run(args):
+    filename, data = sample_image()
+    body, content_type = multipart_body(filename, data)
+
+    if args.scenario == 'uploads':
+        clients = [slow_upload(args.host, args.port, body, content_type, args.duration, args.timeout)
+                   for _ in range(args.clients)]
+    else:
+        clients = [idle_stream(args.host, args.port, index, args.duration, args.timeout)
+                   for index in range(args.clients)]
+    load = asyncio.gather(*(asyncio.wait_for(client, args.duration + args.timeout) for client in clients),
+                          return_exceptions=True)
+
+    # Probe and sample the server while the slow clients are connected
+    latencies, peak_threads, peak_rss = [], 0, 0.0
+    await asyncio.sleep(min(1.0, args.duration / 4))
+    deadline = time.monotonic() + args.duration / 2
+    while time.monotonic() < deadline:
+        latencies.append(await probe(args.host, args.port, args.probe_path, args.timeout))
+        if args.pid:
+            threads, rss = process_stats(args.pid)
+            peak_threads, peak_rss = max(peak_threads, threads), max(peak_rss, rss)
+        await asyncio.sleep(0.1)
+
+    results = await load
+    ok = sum(1 for result in results if result == 200)
+    rejected = sum(1 for result in results if isinstance(result, int) and result != 200)
+    failed = len(results) - ok - rejected
+    answered = np.array([latency for latency in latencies if latency is not None]) * 1000
+
+    print(f"{'label':<10} {'scenario':<8} {'clients':>7} {'ok':>6} {'non-200':>8} {'failed':>7} "
+          f"{'probes':>7} {'p50 ms':>8} {'p99 ms':>8} {'threads':>8} {'RSS MB':>7}")
+    print(f"{args.label:<10} {args.scenario:<8} {args.clients:>7} {ok:>6} {rejected:>8} {failed:>7} "
+          f"{len(answered):>3}/{len(latencies):<3} "
+          f"{np.percentile(answered, 50) if answered.size else float('nan'):>8.1f} "
+          f"{np.percentile(answered, 99) if answered.size else float('nan'):>8.1f} "
+          f"{peak_threads or '-':>8} {peak_rss or float('nan'):>7.0f}")
+
+def main():
+    """Main load test function"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--scenario', choices=['uploads', 'streams'], default='uploads')
+    parser.add_argument('--clients', type=int, default=200, help='Concurrent slow connections')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds each slow connection lasts')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--probe-path', default='/', help='Quick request timed during the load')
+    parser.add_argument('--pid', type=int, help='Server process to sample for threads and memory')
+    parser.add_argument('--label', default='server')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
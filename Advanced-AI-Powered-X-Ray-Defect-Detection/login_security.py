@@ -0,0 +1,88 @@
+# Login security helpers
+# Rate limiting and bounded password hashing so login bursts cannot starve other routes
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusyError(Exception):
+    """Raised when the hashing pool is saturated or a hash times out, and a login should be retried later"""
+
+
+class TokenBucketLimiter:
+    """In-memory token buckets keyed by account or client address"""
+
+    def __init__(self, capacity, refill_per_second, max_keys=100000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key, cost=1):
+        """Take cost tokens for key; returns (allowed, seconds until enough have refilled)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+
+            # Oldest-touched buckets are the first to have refilled anyway
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        retry_after = 0 if allowed else (cost - tokens) / self.refill_per_second
+        return allowed, retry_after
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a small worker pool with a cap on queued work"""
+
+    def __init__(self, method, max_workers=2, max_pending=8, timeout=10):
+        # Werkzeug expands short names (scrypt -> scrypt:32768:8:1), so compare against the expanded form
+        self.method = generate_password_hash('', method).split('$', 1)[0]
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusyError("Too many logins in progress")
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the hash itself finishes, even if this caller stops waiting for it
+        future.add_done_callback(lambda done: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HashingBusyError("Password hashing timed out")
+
+    def hash(self, password):
+        """Hash a password with the configured method"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def needs_rehash(self, password_hash):
+        """True if a stored hash was made with different parameters than the current policy"""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def verify(self, password_hash, password):
+        """Check a password; returns (valid, replacement hash or None)
+
+        When the stored hash predates the current policy, a fresh hash is
+        returned so the caller can store it.
+        """
+        valid = self._run(check_password_hash, password_hash, password)
+        if valid and self.needs_rehash(password_hash):
+            try:
+                return True, self.hash(password)
+            except HashingBusyError:
+                return True, None  # Upgraded on a later login instead
+        return valid, None
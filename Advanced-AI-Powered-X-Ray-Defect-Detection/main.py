@@ -1,16 +1,11 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_file
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_file, Response, stream_with_context, g
 import os
 import sys
-from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import secrets
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
+import time
+import types
 from io import BytesIO
 import base64
 import smtplib
@@ -19,13 +14,44 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 import threading
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+import click
+from image_pyramid import build_pyramid, backfill_pyramids, pyramid_paths
+from login_security import TokenBucketLimiter, PasswordHasher, HashingBusyError
+from streaming_upload import MultipartReceiver, iter_uploads, UploadRejected
+from progress_events import ProgressBroker, StreamLimitError
+from request_profiler import RequestProfiler
+from static_assets import AssetManifest, FragmentCacheExtension
+from scan_archive import ScanArchive
+from report_renderer import ReportRenderer, report_payload
+import numpy as np
+import cv2
 
 # Add AI model to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'ai_model', 'lib'))
+from near_duplicates import HammingIndex, perceptual_hash, hash_to_hex, hash_from_hex
+from localization import localize_defects
+from scan_export import ScanExport, FEATURE_COLUMNS
+
+if __name__ == '__main__':
+    # `python main.py` serves from the importable module under an empty __main__: spawned pool
+    # workers re-import __main__ when they start, and this file would set up a whole server in each
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    import main
+    # The debug server picks up edited assets and templates instead of caching them
+    main.assets.auto_reload = True
+    main.app.jinja_env.fragment_cache_enabled = False
+    main.app.run(debug=True, host='0.0.0.0', port=8080)
+    sys.exit()
+
 try:
     from model import XRayDefectDetector
-    ai_detector = XRayDefectDetector()
-    print("AI model loaded successfully")
+    ai_detector = XRayDefectDetector(config_path=os.environ.get('DETECTOR_CONFIG'))
+    # Edits to the detector config take effect without a restart
+    ai_detector.watch_config()
+    print(f"AI model loaded successfully (config {ai_detector.config.version})")
 except ImportError as e:
     print(f"Warning: AI model not found, using fallback detection: {e}")
     ai_detector = None
@@ -35,15 +61,100 @@ app.config['UPLOAD_FOLDER'] = 'uploads/'
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'dcm', 'dicom'}
 app.secret_key = secrets.token_hex(16)
 
+# Fingerprinted, precompressed static files and {% cache %} for markup shared by every visitor
+app.jinja_env.add_extension(FragmentCacheExtension)
+assets = AssetManifest(app.static_folder)
+app.jinja_env.globals['asset_url'] = assets.url
+app.jinja_env.fragment_cache_version = assets.version
+
+# Upload limits: Werkzeug rejects larger declared bodies before the view runs,
+# and the per-user quota is a byte token bucket refilled over an hour
+app.config['UPLOAD_MAX_FILE_BYTES'] = 32 * 1024 * 1024
+app.config['BATCH_MAX_FILES'] = 50
+app.config['MAX_CONTENT_LENGTH'] = 256 * 1024 * 1024
+app.config['UPLOAD_USER_QUOTA_BYTES'] = 512 * 1024 * 1024
+
+# Scans within this many pHash bits of an earlier scan by the same user are near-duplicates
+app.config['NEAR_DUPLICATE_RADIUS'] = 4
+
+# Progress streams: concurrent listener cap, seconds before a stream reconnects, keepalive interval
+app.config['PROGRESS_MAX_STREAMS'] = int(os.environ.get('PROGRESS_MAX_STREAMS', 64))
+app.config['PROGRESS_STREAM_SECONDS'] = 60
+app.config['PROGRESS_HEARTBEAT_SECONDS'] = 15
+
+# Request profiling: fraction of requests sampled (0 disables it); admins can also send X-Profile: 1
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_INTERVAL_SECONDS'] = float(os.environ.get('PROFILE_INTERVAL_SECONDS', 0.005))
+app.config['PROFILE_FOLDER'] = 'profiles/'
+
+# Scans older than this many days are moved to monthly archive partitions by `flask archive-scans`
+app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+app.config['ARCHIVE_FOLDER'] = 'archive/'
+
+# Columnar scan history for offline reporting, appended by `flask export-scans`
+app.config['EXPORT_FOLDER'] = 'exports/scans/'
+
+# PDF reports are rendered by worker processes after each analysis; a download waits this long for a queued one
+app.config['REPORT_FOLDER'] = 'reports/'
+app.config['REPORT_WORKERS'] = int(os.environ.get('REPORT_WORKERS', 1))
+app.config['REPORT_WAIT_SECONDS'] = 10
+
+# Multipart framing allowance per file on top of the file bytes themselves
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Password hashing policy; stored hashes made with other parameters are upgraded on login
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+app.config['LOGIN_HASH_WORKERS'] = int(os.environ.get('LOGIN_HASH_WORKERS', 2))
+app.config['LOGIN_MAX_PENDING'] = int(os.environ.get('LOGIN_MAX_PENDING', 8))
+
+# Login attempt token buckets: (burst capacity, tokens refilled per second)
+app.config['LOGIN_ACCOUNT_LIMIT'] = (5, 1 / 30)
+app.config['LOGIN_IP_LIMIT'] = (20, 1 / 3)
+
 # Email configuration (you should set these as environment variables in production)
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 EMAIL_USER = "your-email@gmail.com"  # Replace with your email
 EMAIL_PASSWORD = "your-app-password"  # Replace with your app password
 
+password_hasher = PasswordHasher(
+    app.config['PASSWORD_HASH_METHOD'],
+    max_workers=app.config['LOGIN_HASH_WORKERS'],
+    max_pending=app.config['LOGIN_MAX_PENDING']
+)
+account_login_limiter = TokenBucketLimiter(*app.config['LOGIN_ACCOUNT_LIMIT'])
+ip_login_limiter = TokenBucketLimiter(*app.config['LOGIN_IP_LIMIT'])
+upload_byte_limiter = TokenBucketLimiter(
+    app.config['UPLOAD_USER_QUOTA_BYTES'],
+    app.config['UPLOAD_USER_QUOTA_BYTES'] / 3600
+)
+
+progress_broker = ProgressBroker(max_streams=app.config['PROGRESS_MAX_STREAMS'])
+
+request_profiler = RequestProfiler(
+    app.config['PROFILE_FOLDER'],
+    sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+    interval=app.config['PROFILE_INTERVAL_SECONDS']
+)
+
+scan_archive = ScanArchive(app.config['ARCHIVE_FOLDER'])
+
+report_renderer = ReportRenderer(app.config['REPORT_FOLDER'], max_workers=app.config['REPORT_WORKERS'])
+
+# Detection releases the GIL inside OpenCV/NumPy, so threads analyze in parallel
+analysis_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix='analysis')
+
 # Create upload directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+def add_column_if_missing(cursor, table, column, definition):
+    """Add a column to an existing table; returns True if it was added"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column in [row[1] for row in cursor.fetchall()]:
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
 # Initialize database
 def init_db():
     conn = sqlite3.connect('medscan.db')
@@ -77,11 +188,97 @@ def init_db():
         )
     ''')
     
+    # Per-user scan counter, maintained by triggers instead of a JOIN per listing
+    if add_column_if_missing(cursor, 'users', 'scan_count', 'INTEGER DEFAULT 0'):
+        cursor.execute('''
+            UPDATE users SET scan_count = (SELECT COUNT(*) FROM scans WHERE scans.user_id = users.id)
+        ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS scans_count_insert AFTER INSERT ON scans
+        BEGIN
+            UPDATE users SET scan_count = scan_count + 1 WHERE id = NEW.user_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS scans_count_delete AFTER DELETE ON scans
+        BEGIN
+            UPDATE users SET scan_count = scan_count - 1 WHERE id = OLD.user_id;
+        END
+    ''')
+    
+    # SHA-256 of the uploaded bytes, computed while streaming the upload to disk
+    add_column_if_missing(cursor, 'scans', 'file_sha256', 'TEXT')
+    
+    # Perceptual hash (16 hex digits) and JSON defect locations, so near-duplicates can reuse results
+    add_column_if_missing(cursor, 'scans', 'phash', 'TEXT')
+    add_column_if_missing(cursor, 'scans', 'defect_locations', 'TEXT')
+    
+    # Detector config version the result was produced with
+    add_column_if_missing(cursor, 'scans', 'config_version', 'TEXT')
+    
+    # Scalar detector features as JSON, exported for offline analytics
+    add_column_if_missing(cursor, 'scans', 'features', 'TEXT')
+    
+    # Measured decode and analysis time, shown in the PDF report
+    add_column_if_missing(cursor, 'scans', 'processing_seconds', 'REAL')
+    
+    # Routing and statistics rows for scans moved to an archive partition, see scan_archive.py
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_scans (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            scan_date TIMESTAMP,
+            result TEXT NOT NULL,
+            month TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_archived_scans_user ON archived_scans (user_id, scan_date)')
+    
+    # Keyset pagination indexes
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_created ON users (created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scans_date ON scans (scan_date, id)')
+    
     conn.commit()
     conn.close()
 
 init_db()
 
+# Filled from stored hashes by a background thread; lookups report no duplicate until it is ready
+duplicate_index = HammingIndex(max_radius=app.config['NEAR_DUPLICATE_RADIUS'])
+duplicate_index_ready = threading.Event()
+DUPLICATE_INDEX_BATCH_ROWS = 50000
+
+def load_duplicate_index(up_to_id):
+    """Add stored scan hashes up to up_to_id to the near-duplicate index
+
+    Scans saved by this process after startup have higher ids and are added
+    by index_scan, so none is indexed twice.
+    """
+    try:
+        conn = sqlite3.connect('medscan.db')
+        cursor = conn.cursor()
+        cursor.execute('SELECT phash, id, user_id FROM scans WHERE phash IS NOT NULL AND id <= ?', (up_to_id,))
+        while True:
+            rows = cursor.fetchmany(DUPLICATE_INDEX_BATCH_ROWS)
+            if not rows:
+                break
+            duplicate_index.add_many([hash_from_hex(row[0]) for row in rows], [(row[1], row[2]) for row in rows],
+                                     rebuild=False)
+        conn.close()
+        duplicate_index.rebuild()
+        duplicate_index_ready.set()
+        print(f"Near-duplicate index loaded with {len(duplicate_index)} scans")
+    except Exception as e:
+        print(f"Error loading near-duplicate index: {e}")
+
+def start_duplicate_index_load():
+    conn = sqlite3.connect('medscan.db')
+    up_to_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM scans').fetchone()[0]
+    conn.close()
+    threading.Thread(target=load_duplicate_index, args=(up_to_id,), name='duplicate-index', daemon=True).start()
+
+start_duplicate_index_load()
+
 def send_email_notification(user_email, username, scan_result, confidence, filename):
     """Send email notification for scan results"""
     try:
@@ -161,22 +358,71 @@ Advanced X-Ray Analysis System
             """
         
         msg.attach(MIMEText(body, 'plain'))
+        return deliver_email(msg, user_email)
         
-        # Send email
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_USER, user_email, text)
-        server.quit()
+    except Exception as e:
+        print(f"Failed to send email to {user_email}: {str(e)}")
+        return False
+
+def send_batch_email_notification(user_email, username, results):
+    """Send one summary email for a batch of scan results"""
+    try:
+        defective = [r for r in results if r['status'].lower() == 'defective']
         
-        print(f"Email notification sent to {user_email}")
-        return True
+        msg = MIMEMultipart()
+        msg['From'] = EMAIL_USER
+        msg['To'] = user_email
+        msg['Subject'] = f"MedScan AI - {len(results)} X-Ray Analyses Complete: {len(defective)} Defective"
+        
+        lines = '\n'.join(f"• {r['filename']}: {r['status'].upper()} ({r['confidence']})" for r in results)
+        body = f"""
+Dear {username},
+
+Your batch of {len(results)} X-ray analyses has been completed.
+
+📋 ANALYSIS RESULTS:
+{lines}
+
+• Defective: {len(defective)}
+• Non-defective: {len(results) - len(defective)}
+• Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+🔗 NEXT STEPS:
+• Log into your MedScan AI dashboard to view detailed results
+• Download the PDF report for each scan
+• Consult a qualified healthcare professional about any defective results
+
+⚕️ MEDICAL DISCLAIMER:
+This AI analysis is a diagnostic aid and should not replace professional 
+medical judgment. Always consult with qualified healthcare professionals 
+for medical advice.
+
+Access your detailed reports: http://localhost:8080/dashboard
+
+Best regards,
+MedScan AI Team
+Advanced X-Ray Analysis System
+        """
+        
+        msg.attach(MIMEText(body, 'plain'))
+        return deliver_email(msg, user_email)
         
     except Exception as e:
         print(f"Failed to send email to {user_email}: {str(e)}")
         return False
 
+def deliver_email(msg, user_email):
+    """Send a prepared message over SMTP"""
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+    server.starttls()
+    server.login(EMAIL_USER, EMAIL_PASSWORD)
+    text = msg.as_string()
+    server.sendmail(EMAIL_USER, user_email, text)
+    server.quit()
+    
+    print(f"Email notification sent to {user_email}")
+    return True
+
 def send_email_async(user_email, username, scan_result, confidence, filename):
     """Send email notification asynchronously"""
     thread = threading.Thread(
@@ -186,11 +432,152 @@ def send_email_async(user_email, username, scan_result, confidence, filename):
     thread.daemon = True
     thread.start()
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+def send_batch_email_async(user_email, username, results):
+    """Send a batch summary email asynchronously"""
+    thread = threading.Thread(
+        target=send_batch_email_notification,
+        args=(user_email, username, results)
+    )
+    thread.daemon = True
+    thread.start()
+
+def encode_cursor(sort_value, row_id):
+    """Encode the last row's (sort value, id) as an opaque page cursor"""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+def decode_cursor(cursor_value):
+    """Decode a page cursor; returns None if it is missing or malformed"""
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor_value.encode()))
+        return str(sort_value), int(row_id)
+    except Exception:
+        return None
+
+def keyset_page(cursor, query, sort_column, id_column, after=None, limit=50):
+    """Fetch one page ordered by (sort_column, id_column) DESC, starting after a cursor
+
+    The query must select the sort column and id as its first two columns and
+    must not have its own WHERE or ORDER BY clause.
+    """
+    params = ()
+    if after:
+        query += f' WHERE ({sort_column}, {id_column}) < (?, ?)'
+        params = after
+    query += f' ORDER BY {sort_column} DESC, {id_column} DESC LIMIT ?'
+    cursor.execute(query, params + (limit + 1,))
+    rows = cursor.fetchall()
+    next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def stream_ndjson(query, serialize, batch_size=500):
+    """Stream every row of a query as NDJSON, holding one batch in memory at a time"""
+    def generate():
+        conn = sqlite3.connect('medscan.db')
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield ''.join(json.dumps(serialize(row)) + '\n' for row in rows)
+        finally:
+            conn.close()
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def page_limit(default=50, maximum=500):
+    """Read the ?limit= query parameter, clamped to a sane range"""
+    return min(maximum, max(1, request.args.get('limit', default, type=int)))
+
+def upload_receiver(max_files=1, fields=('file',)):
+    """A MultipartReceiver for the current request, charging the sender's byte quota
+
+    Raises UploadRejected straight away when the declared size is over a limit.
+    """
+    max_request_bytes = min(
+        app.config['MAX_CONTENT_LENGTH'],
+        max_files * (app.config['UPLOAD_MAX_FILE_BYTES'] + MULTIPART_OVERHEAD_BYTES)
+    )
+    if request.content_length and request.content_length > max_request_bytes:
+        raise UploadRejected('Upload exceeds the maximum request size', 413)
+    
+    quota_key = f"user:{session['user']['id']}" if 'user' in session else f"ip:{request.remote_addr}"
+    
+    def charge(byte_count):
+        allowed, retry_after = upload_byte_limiter.allow(quota_key, byte_count)
+        if not allowed:
+            raise UploadRejected(f'Upload quota exceeded, try again in {int(retry_after) + 1} seconds', 429)
+    
+    # A declared length is charged up front so an over-quota upload is refused unread
+    if request.content_length:
+        charge(request.content_length)
+    
+    return MultipartReceiver(
+        request.content_type,
+        app.config['UPLOAD_FOLDER'],
+        max_request_bytes,
+        max_file_bytes=app.config['UPLOAD_MAX_FILE_BYTES'],
+        allowed_extensions=app.config['ALLOWED_EXTENSIONS'],
+        fields=fields,
+        max_files=max_files,
+        on_chunk=None if request.content_length else charge
+    )
+
+def receive_uploads(max_files=1, fields=('file',)):
+    """Stream the request's file parts to disk
+
+    Yields UploadedFile records; raises UploadRejected on any limit or format error.
+    """
+    return iter_uploads(request.stream, upload_receiver(max_files, fields))
+
+def get_pyramid(filename):
+    """Return an upload's derivative paths, building them on first use"""
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    paths = pyramid_paths(file_path)
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+    if os.path.exists(file_path):
+        return build_pyramid(file_path)
+    return None
+
+def find_scan(cursor, scan_id, user_id):
+    """Return (scan row, archive month) for one of a user's scans; month is None while the scan is hot"""
+    cursor.execute('SELECT * FROM scans WHERE id = ? AND user_id = ?', (scan_id, user_id))
+    scan = cursor.fetchone()
+    if scan:
+        return scan, None
+    cursor.execute('SELECT month FROM archived_scans WHERE id = ? AND user_id = ?', (scan_id, user_id))
+    archived = cursor.fetchone()
+    if not archived:
+        return None, None
+    return scan_archive.fetch_scans(archived[0], [scan_id]).get(scan_id), archived[0]
+
+def recent_archived_scans(cursor, user_id, limit):
+    """A user's newest archived scan rows, newest first"""
+    cursor.execute('''
+        SELECT id, month FROM archived_scans
+        WHERE user_id = ?
+        ORDER BY scan_date DESC, id DESC
+        LIMIT ?
+    ''', (user_id, limit))
+    routes = cursor.fetchall()
+    by_month = {}
+    for scan_id, month in routes:
+        by_month.setdefault(month, []).append(scan_id)
+    rows = {}
+    for month, scan_ids in by_month.items():
+        rows.update(scan_archive.fetch_scans(month, scan_ids))
+    return [rows[scan_id] for scan_id, _ in routes if scan_id in rows]
+
+def scan_derivative(filename, month, variant):
+    """A scan's thumb or preview: a path while hot, a BytesIO once archived, None if it has none"""
+    if month is None:
+        paths = get_pyramid(filename)
+        return paths[variant] if paths else None
+    data = scan_archive.read_file(month, pyramid_paths(filename)[variant])
+    return BytesIO(data) if data is not None else None
 
-def fallback_detection(filename):
+def fallback_detection(filename, image_path=None):
     """Fallback detection method when AI model is not available"""
     try:
         # Check filename for defect indicators
@@ -239,14 +626,10 @@ def fallback_detection(filename):
             result_status = 'non-defective'
             confidence = 85.0
         
-        # Generate defect locations if defective
+        # Locate defects in the image itself if defective
         defect_locations = []
-        if result_status == 'defective':
-            defect_locations = [
-                {'x': 30, 'y': 40},
-                {'x': 70, 'y': 60},
-                {'x': 50, 'y': 25}
-            ]
+        if result_status == 'defective' and image_path:
+            defect_locations = fallback_locations(image_path)
         
         return result_status, confidence, defect_locations
         
@@ -254,6 +637,267 @@ def fallback_detection(filename):
         print(f"Fallback detection error: {e}")
         return 'non-defective', 50.0, []
 
+def fallback_locations(image_path):
+    """Gradient-based defect locations for an analysis tensor or image file"""
+    try:
+        if image_path.endswith('.npy'):
+            gray = np.load(image_path)
+        else:
+            gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        return localize_defects(gray) if gray is not None else []
+    except Exception as e:
+        print(f"Error locating defects in {image_path}: {e}")
+        return []
+
+def analysis_hash(pyramid):
+    """pHash of the stored analysis tensor, or None when the upload could not be decoded"""
+    if not pyramid:
+        return None
+    try:
+        return perceptual_hash(np.load(pyramid['tensor']))
+    except Exception as e:
+        print(f"Error hashing analysis tensor: {e}")
+        return None
+
+def find_near_duplicate(phash, user_id, original_filename):
+    """Find the user's nearest earlier scan of the same image
+
+    Returns the nearest match and, when a stored result can stand in for a new
+    analysis, the nearest such result instead. A result is only reused when it
+    was produced with the current detector config and both filenames get the
+    same keyword score.
+    """
+    if phash is None or user_id is None or not duplicate_index_ready.is_set():
+        return None
+    # Nearest first, newest first among equally near scans
+    matches = sorted(((distance, -scan_id) for distance, (scan_id, owner_id) in duplicate_index.query(phash)
+                      if owner_id == user_id))
+    if not matches:
+        return None
+    
+    conn = sqlite3.connect('medscan.db')
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT id, original_filename, result, confidence, defect_locations, config_version
+        FROM scans WHERE id IN ({', '.join('?' * len(matches))})
+    ''', [-negative_id for _, negative_id in matches])
+    rows = {row[0]: row for row in cursor.fetchall()}
+    conn.close()
+    
+    config = ai_detector.config if ai_detector else None
+    nearest = None
+    for distance, negative_id in matches:
+        row = rows.get(-negative_id)
+        if not row:
+            continue
+        match = {'scan_id': row[0], 'distance': distance, 'result': None}
+        same_inputs = config is not None and row[5] == config.version and \
+            ai_detector.filename_score(row[1]) == ai_detector.filename_score(original_filename)
+        if same_inputs and row[4] is not None:
+            match['result'] = (row[2], row[3], json.loads(row[4]), row[5])
+            return match
+        nearest = nearest or match
+    return nearest
+
+def run_analysis(file_path, original_filename, user_id=None, progress=None, detect=None):
+    """Analyze a saved upload, reusing the result of a near-duplicate earlier scan if possible
+
+    progress(stage, **data) is called as the upload is decoded, its features
+    extracted and the result scored. detect replaces ai_detector.detect_defects,
+    e.g. to run detection in another process.
+    """
+    progress = progress or (lambda stage, **data: None)
+    start = time.perf_counter()
+    
+    # Decode once into the analysis tensor and UI previews
+    pyramid = build_pyramid(file_path)
+    analysis_path = pyramid['tensor'] if pyramid else file_path
+    phash = analysis_hash(pyramid)
+    progress('decoded')
+    
+    near_duplicate = find_near_duplicate(phash, user_id, original_filename)
+    features = None
+    if near_duplicate and near_duplicate['result']:
+        result_status, confidence, defect_locations, config_version = near_duplicate['result']
+        print(f"Reusing result of near-duplicate scan {near_duplicate['scan_id']}")
+    # Use AI model for detection if available, otherwise use fallback
+    elif ai_detector:
+        try:
+            # Use the AI model for detection
+            result = (detect or ai_detector.detect_defects)(
+                analysis_path, original_filename, on_stage=lambda stages: progress('features', stages=stages))
+            result_status = result['status']
+            # Force result to be 'Defective' or 'Non-Defective'
+            if str(result_status).strip().lower() == 'defective':
+                result_status = 'Defective'
+            else:
+                result_status = 'Non-Defective'
+            confidence = 99.99
+            defect_locations = result.get('defect_locations', [])
+            config_version = result.get('config_version')
+            features = scan_features(result)
+            print(f"AI Model Result: {result_status} with {confidence}% confidence")
+        except Exception as e:
+            print(f"AI model error: {e}, using fallback detection")
+            # Fallback to filename-based detection
+            result_status, _, defect_locations = fallback_detection(original_filename, analysis_path)
+            if str(result_status).strip().lower() == 'defective':
+                result_status = 'Defective'
+            else:
+                result_status = 'Non-Defective'
+            confidence = 99.99
+            config_version = None
+    else:
+        # Use fallback detection
+        result_status, _, defect_locations = fallback_detection(original_filename, analysis_path)
+        if str(result_status).strip().lower() == 'defective':
+            result_status = 'Defective'
+        else:
+            result_status = 'Non-Defective'
+        confidence = 99.99
+        config_version = None
+    
+    progress('scored', status=result_status, defect_count=len(defect_locations),
+             reused=bool(near_duplicate and near_duplicate['result']))
+    return {
+        'status': result_status,
+        'confidence': confidence,
+        'defect_locations': defect_locations,
+        'pyramid': pyramid,
+        'phash': phash,
+        'near_duplicate': near_duplicate,
+        'config_version': config_version,
+        'features': features,
+        'seconds': time.perf_counter() - start
+    }
+
+def scan_features(result):
+    """Scalar features of a detector result that are stored with the scan"""
+    details = result.get('analysis_details', {})
+    values = dict(details.get('content_analysis') or {})
+    values.update(values.pop('texture_features', None) or {})
+    values.update(details)
+    return {name: float(values[name]) for name in FEATURE_COLUMNS if values.get(name) is not None}
+
+JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+def progress_key(job_id):
+    """Scope a client-chosen job id to the current user or anonymous session"""
+    if 'user' in session:
+        owner = f"user:{session['user']['id']}"
+    else:
+        owner = f"session:{session.setdefault('progress_token', secrets.token_hex(16))}"
+    return f'{owner}:{job_id}'
+
+def request_progress_key():
+    """Progress key for the job id sent as ?job=, or None if the client isn't listening"""
+    job_id = request.args.get('job', '')
+    return progress_key(job_id) if JOB_ID_PATTERN.match(job_id) else None
+
+def progress_reporter(key, **fields):
+    """Return progress(stage, **data) publishing to a job's stream; a no-op without a job"""
+    def report(stage, **data):
+        if key is not None:
+            progress_broker.publish(key, 'progress', dict(fields, stage=stage, **data))
+    return report
+
+def finish_progress(key, **data):
+    """Send the final event that closes a job's streams"""
+    if key is not None:
+        progress_broker.publish(key, 'done', data)
+
+def save_scan(cursor, user_id, upload, analysis):
+    """Insert a scan row; returns the new scan id"""
+    cursor.execute('''
+        INSERT INTO scans (user_id, filename, original_filename, result, confidence, defect_count,
+                           file_sha256, phash, defect_locations, config_version, features, processing_seconds)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, upload.filename, upload.original_filename, analysis['status'], analysis['confidence'],
+          len(analysis['defect_locations']), upload.sha256,
+          hash_to_hex(analysis['phash']) if analysis['phash'] is not None else None,
+          json.dumps(analysis['defect_locations']), analysis['config_version'],
+          json.dumps(analysis['features']) if analysis['features'] else None, analysis['seconds']))
+    return cursor.lastrowid
+
+def scan_processing_seconds(scan):
+    """processing_seconds of a SELECT * scans row; it is the column after features"""
+    return scan[14] if len(scan) > 14 else None
+
+def queue_report(cursor, scan_id, user, analysis):
+    """Have the report workers render a just-saved scan's PDF, so its download is a file send"""
+    cursor.execute('SELECT * FROM scans WHERE id = ?', (scan_id,))
+    scan = cursor.fetchone()
+    preview = analysis['pyramid']['preview'] if analysis['pyramid'] else None
+    report_renderer.submit(report_payload(scan, user['username'], user['email'], analysis['seconds'], preview))
+
+def index_scan(scan_id, user_id, analysis):
+    """Make a committed scan findable as a near-duplicate"""
+    if analysis['phash'] is not None:
+        duplicate_index.add(analysis['phash'], (scan_id, user_id))
+
+def analysis_response(analysis, scan_id=None):
+    """Common JSON fields describing one analysis"""
+    result = {
+        'status': analysis['status'],
+        'confidence': f"{analysis['confidence']}%",
+        'defect_locations': analysis['defect_locations']
+    }
+    if analysis['config_version']:
+        result['config_version'] = analysis['config_version']
+    if analysis['near_duplicate']:
+        result['near_duplicate_of'] = analysis['near_duplicate']['scan_id']
+        result['near_duplicate_distance'] = analysis['near_duplicate']['distance']
+        result['result_reused'] = analysis['near_duplicate']['result'] is not None
+    if scan_id is not None:
+        result['scan_id'] = scan_id
+        if analysis['pyramid']:
+            result['preview_url'] = url_for('scan_image', scan_id=scan_id, variant='preview')
+    return result
+
+@app.route('/assets/<path:url_path>')
+def static_asset(url_path):
+    """Serve a fingerprinted static file, precompressed when the client accepts it"""
+    asset = assets.lookup(url_path)
+    if asset is None:
+        return jsonify({'error': 'Asset not found'}), 404
+    
+    encoding = request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in asset.variants]) or 'identity'
+    response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # The URL changes with the content, so it never needs revalidating
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.set_etag(f'{asset.etag}-{encoding}')
+    return response.make_conditional(request)
+
+def is_admin():
+    return 'user' in session and session['user'].get('username') == 'admin'
+
+@app.before_request
+def start_request_profile():
+    requested = request.headers.get('X-Profile') == '1' and is_admin()
+    if request_profiler.should_profile(requested):
+        g.profile = request_profiler.start(request.endpoint or 'unknown')
+
+@app.after_request
+def defer_request_profile(response):
+    # Generated bodies such as /analyze/batch run after the view, so keep sampling until they close
+    if 'profile' in g and response.is_streamed and not response.direct_passthrough:
+        profile = g.pop('profile')
+        response.call_on_close(lambda: request_profiler.finish(profile))
+    return response
+
+@app.teardown_request
+def finish_request_profile(exc):
+    profile = g.pop('profile', None)
+    if profile:
+        request_profiler.finish(profile)
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': 'Upload exceeds the maximum request size'}), 413
+
 @app.route('/')
 def index():
     return render_template('index.html', user=session.get('user'))
@@ -278,7 +922,11 @@ def register():
             return jsonify({'error': 'Username or email already exists'}), 400
         
         # Create new user
-        password_hash = generate_password_hash(password)
+        try:
+            password_hash = password_hasher.hash(password)
+        except HashingBusyError:
+            conn.close()
+            return jsonify({'error': 'Server busy, please try again shortly'}), 503
         cursor.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
                       (username, email, password_hash))
         user_id = cursor.lastrowid
@@ -301,14 +949,34 @@ def login():
         if not username or not password:
             return jsonify({'error': 'Username and password are required'}), 400
         
+        # Rate limit per client address and per account before doing any hashing
+        for limiter, key in ((ip_login_limiter, request.remote_addr),
+                             (account_login_limiter, username.strip().lower())):
+            allowed, retry_after = limiter.allow(key)
+            if not allowed:
+                response = jsonify({'error': 'Too many login attempts, please try again later'})
+                response.headers['Retry-After'] = str(int(retry_after) + 1)
+                return response, 429
+        
         # Check user credentials
         conn = sqlite3.connect('medscan.db')
         cursor = conn.cursor()
         cursor.execute('SELECT id, username, email, password_hash FROM users WHERE username = ? OR email = ?', (username, username))
         user = cursor.fetchone()
+        
+        valid = False
+        if user:
+            try:
+                valid, new_hash = password_hasher.verify(user[3], password)
+            except HashingBusyError:
+                conn.close()
+                return jsonify({'error': 'Server busy, please try again shortly'}), 503
+            if new_hash:
+                cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user[0]))
+                conn.commit()
         conn.close()
         
-        if user and check_password_hash(user[3], password):
+        if valid:
             session['user'] = {'id': user[0], 'username': user[1], 'email': user[2]}
             return jsonify({'success': True, 'message': 'Login successful'})
         else:
@@ -322,6 +990,16 @@ def logout():
     flash('You have been logged out successfully.')
     return redirect(url_for('index'))
 
+# Results of hot and archived scans; archived_scans keeps the columns statistics need
+USER_SCAN_RESULTS = '''
+    (SELECT result FROM scans WHERE user_id = ?
+     UNION ALL SELECT result FROM archived_scans WHERE user_id = ?)
+'''
+ALL_SCAN_RESULTS = '''
+    (SELECT scan_date, result FROM scans
+     UNION ALL SELECT scan_date, result FROM archived_scans)
+'''
+
 @app.route('/dashboard')
 def dashboard():
     if 'user' not in session:
@@ -339,15 +1017,18 @@ def dashboard():
         LIMIT 10
     ''', (user_id,))
     recent_scans = cursor.fetchall()
+    if len(recent_scans) < 10:
+        # Everything archived is older than the hot scans
+        recent_scans += recent_archived_scans(cursor, user_id, 10 - len(recent_scans))
     
-    # Get scan statistics
-    cursor.execute('SELECT COUNT(*) FROM scans WHERE user_id = ?', (user_id,))
+    # Get scan statistics, including archived scans
+    cursor.execute(f'SELECT COUNT(*) FROM {USER_SCAN_RESULTS}', (user_id, user_id))
     total_scans = cursor.fetchone()[0]
     
-    cursor.execute('SELECT COUNT(*) FROM scans WHERE user_id = ? AND result = "defective"', (user_id,))
+    cursor.execute(f'SELECT COUNT(*) FROM {USER_SCAN_RESULTS} WHERE result = "defective"', (user_id, user_id))
     defective_scans = cursor.fetchone()[0]
     
-    cursor.execute('SELECT COUNT(*) FROM scans WHERE user_id = ? AND result = "non-defective"', (user_id,))
+    cursor.execute(f'SELECT COUNT(*) FROM {USER_SCAN_RESULTS} WHERE result = "non-defective"', (user_id, user_id))
     normal_scans = cursor.fetchone()[0]
     
     conn.close()
@@ -363,257 +1044,228 @@ def dashboard():
 
 @app.route('/analyze', methods=['POST'])
 def analyze_xray():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
+    job_key = request_progress_key()
+    report = progress_reporter(job_key)
     
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
+    # Parse the body incrementally; the file is hashed, sniffed and written as it arrives
+    uploads = []
+    try:
+        for upload in receive_uploads(max_files=1):
+            uploads.append(upload)
+    except UploadRejected as e:
+        # e.g. a second file part, after the first was already written
+        discard_uploads(uploads)
+        finish_progress(job_key, error=e.message)
+        return jsonify({'error': e.message}), e.status
+    upload = uploads[0]
+    report('received', filename=upload.original_filename, size=upload.size)
     
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        original_filename = file.filename
-        
-        # Add timestamp to filename to avoid conflicts
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-        filename = timestamp + filename
-        
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        # Use AI model for detection if available, otherwise use fallback
-        if ai_detector:
-            try:
-                # Use the AI model for detection
-                result = ai_detector.detect_defects(file_path, original_filename)
-                result_status = result['status']
-                # Force result to be 'Defective' or 'Non-Defective'
-                if str(result_status).strip().lower() == 'defective':
-                    result_status = 'Defective'
-                else:
-                    result_status = 'Non-Defective'
-                confidence = 99.99
-                defect_locations = result.get('defect_locations', [])
-                print(f"AI Model Result: {result_status} with {confidence}% confidence")
-            except Exception as e:
-                print(f"AI model error: {e}, using fallback detection")
-                # Fallback to filename-based detection
-                result_status, _, defect_locations = fallback_detection(original_filename)
-                if str(result_status).strip().lower() == 'defective':
-                    result_status = 'Defective'
-                else:
-                    result_status = 'Non-Defective'
-                confidence = 99.99
-        else:
-            # Use fallback detection
-            result_status, _, defect_locations = fallback_detection(original_filename)
-            if str(result_status).strip().lower() == 'defective':
-                result_status = 'Defective'
-            else:
-                result_status = 'Non-Defective'
-            confidence = 99.99
+    user = session.get('user')
+    analysis = run_analysis(upload.path, upload.original_filename, user['id'] if user else None, report)
+    return jsonify(finish_analysis(user, upload, analysis, job_key))
+
+def finish_analysis(user, upload, analysis, job_key):
+    """Save a single analysis for a logged-in user and build the /analyze response"""
+    # Save scan to database if user is logged in
+    scan_id = None
+    if user:
+        conn = sqlite3.connect('medscan.db')
+        cursor = conn.cursor()
+        scan_id = save_scan(cursor, user['id'], upload, analysis)
+        conn.commit()
+        queue_report(cursor, scan_id, user, analysis)
+        conn.close()
+        index_scan(scan_id, user['id'], analysis)
+        progress_reporter(job_key)('saved', scan_id=scan_id)
         
-        # Save scan to database if user is logged in
-        if 'user' in session:
-            user_id = session['user']['id']
-            conn = sqlite3.connect('medscan.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO scans (user_id, filename, original_filename, result, confidence, defect_count)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, filename, original_filename, result_status, confidence, len(defect_locations)))
-            conn.commit()
-            conn.close()
-            
-            # Send email notification asynchronously
-            user_email = session['user']['email']
-            username = session['user']['username']
-            send_email_async(user_email, username, result_status, confidence, original_filename)
+        # Send email notification asynchronously
+        send_email_async(user['email'], user['username'], analysis['status'], analysis['confidence'],
+                         upload.original_filename)
+    
+    result = analysis_response(analysis, scan_id)
+    result['scan_saved'] = user is not None
+    finish_progress(job_key, status=analysis['status'], scan_id=scan_id)
+    return result
+
+def discard_uploads(uploads):
+    """Remove received files and any derivatives built for them"""
+    for upload in uploads:
+        for path in [upload.path] + list(pyramid_paths(upload.path).values()):
+            if os.path.exists(path):
+                os.remove(path)
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    # Each file is queued for analysis as soon as it is on disk, while later ones still arrive
+    user = session.get('user')
+    user_id = user['id'] if user else None
+    job_key = request_progress_key()
+    futures = {}
+    try:
+        for upload in receive_uploads(max_files=app.config['BATCH_MAX_FILES'], fields=('files', 'file')):
+            index = len(futures)
+            report = progress_reporter(job_key, index=index)
+            report('received', filename=upload.original_filename, size=upload.size)
+            # Sampled into this request's profile, if it has one, while the analysis runs
+            future = analysis_pool.submit(request_profiler.run_in_profile, g.get('profile'), run_analysis,
+                                          upload.path, upload.original_filename, user_id, report)
+            futures[future] = (index, upload)
+    except UploadRejected as e:
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        discard_uploads(upload for _, upload in futures.values())
+        finish_progress(job_key, error=e.message)
+        return jsonify({'error': e.message}), e.status
+    
+    def generate():
+        # One NDJSON line per file in completion order, then a summary line
+        completed, failed = [], []
+        remaining = as_completed(futures)
+        try:
+            for future in remaining:
+                yield json.dumps(collect_batch_result(future, *futures[future], completed, failed)) + '\n'
+        finally:
+            # A client that disconnects before the summary still gets its scans saved
+            for future in remaining:
+                collect_batch_result(future, *futures[future], completed, failed)
+            summary = finish_batch(user, completed, job_key, failed)
+        yield json.dumps(summary) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def batch_result_line(index, upload, analysis):
+    """NDJSON object for one finished file of a batch"""
+    line = analysis_response(analysis)
+    line.update({'type': 'result', 'index': index, 'filename': upload.original_filename})
+    return line
+
+def collect_batch_result(future, index, upload, completed, failed):
+    """Record a finished batch future in completed or failed; returns its NDJSON line"""
+    try:
+        analysis = future.result()
+    except Exception as e:
+        print(f"Error analyzing {upload.original_filename}: {e}")
+        failed.append((index, upload))
+        return {'type': 'error', 'index': index, 'filename': upload.original_filename, 'error': 'Analysis failed'}
+    completed.append((index, upload, analysis))
+    return batch_result_line(index, upload, analysis)
+
+def finish_batch(user, completed, job_key, failed=()):
+    """Save a batch's (index, upload, analysis) results and build its summary line
+
+    Files whose analysis failed, as (index, upload), are removed and counted.
+    """
+    completed.sort(key=lambda item: item[0])
+    discard_uploads(upload for _, upload in failed)
+    summary = {
+        'type': 'summary',
+        'total': len(completed),
+        'defective': sum(1 for _, _, analysis in completed if analysis['status'] == 'Defective'),
+        'failed': len(failed),
+        'scan_saved': user is not None
+    }
+    
+    # Save all scans in a single transaction and send one summary email
+    if user:
+        conn = sqlite3.connect('medscan.db')
+        cursor = conn.cursor()
+        scan_ids = [save_scan(cursor, user['id'], upload, analysis) for _, upload, analysis in completed]
+        conn.commit()
+        for (_, _, analysis), scan_id in zip(completed, scan_ids):
+            queue_report(cursor, scan_id, user, analysis)
+        conn.close()
         
-        result = {
-            'status': result_status,
-            'confidence': f'{confidence}%',
-            'defect_locations': defect_locations,
-            'scan_saved': 'user' in session
-        }
+        summary['scans'] = []
+        progress_reporter(job_key)('saved', scan_ids=scan_ids)
+        for (index, _, analysis), scan_id in zip(completed, scan_ids):
+            index_scan(scan_id, user['id'], analysis)
+            scan = {'index': index, 'scan_id': scan_id}
+            if analysis['pyramid']:
+                scan['preview_url'] = url_for('scan_image', scan_id=scan_id, variant='preview')
+            summary['scans'].append(scan)
         
-        return jsonify(result)
+        send_batch_email_async(user['email'], user['username'], [
+            {'filename': upload.original_filename, 'status': analysis['status'],
+             'confidence': f"{analysis['confidence']}%"}
+            for _, upload, analysis in completed
+        ])
     
-    return jsonify({'error': 'Invalid file type'}), 400
+    finish_progress(job_key, total=summary['total'], defective=summary['defective'], failed=summary['failed'])
+    return summary
 
-@app.route('/generate_report/<int:scan_id>')
-def generate_report(scan_id):
+@app.route('/analyze/progress/<job_id>')
+def analysis_progress(job_id):
+    """Server-sent events for the analysis or batch posted with ?job=<job_id>"""
+    if not JOB_ID_PATTERN.match(job_id):
+        return jsonify({'error': 'Invalid job id'}), 400
+    try:
+        after = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        after = 0
+    
+    try:
+        events = progress_broker.stream(progress_key(job_id), after,
+                                        lifetime=app.config['PROGRESS_STREAM_SECONDS'],
+                                        heartbeat=app.config['PROGRESS_HEARTBEAT_SECONDS'])
+    except StreamLimitError:
+        response = jsonify({'error': 'Too many progress streams open'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/scan_image/<int:scan_id>/<variant>')
+def scan_image(scan_id, variant):
     if 'user' not in session:
         return redirect(url_for('login'))
+    if variant not in ('thumb', 'preview'):
+        return jsonify({'error': 'Unknown image variant'}), 404
     
-    user_id = session['user']['id']
     conn = sqlite3.connect('medscan.db')
     cursor = conn.cursor()
-    
-    # Get scan details
-    cursor.execute('''
-        SELECT * FROM scans 
-        WHERE id = ? AND user_id = ?
-    ''', (scan_id, user_id))
-    scan = cursor.fetchone()
+    scan, month = find_scan(cursor, scan_id, session['user']['id'])
+    conn.close()
     
     if not scan:
-        conn.close()
         return jsonify({'error': 'Scan not found'}), 404
     
-    # Get user details
-    cursor.execute('SELECT username, email FROM users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
-    conn.close()
+    image = scan_derivative(scan[2], month, variant)
+    if image is None:
+        return jsonify({'error': 'Preview not available'}), 404
     
-    # Generate PDF report
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    story = []
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        textColor=colors.HexColor('#00b4d8'),
-        alignment=1  # Center alignment
-    )
-    
-    header_style = ParagraphStyle(
-        'CustomHeader',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=12,
-        textColor=colors.HexColor('#64ffda')
-    )
-    
-    # Title
-    story.append(Paragraph("MedScan AI - X-Ray Analysis Report", title_style))
-    story.append(Spacer(1, 20))
-    
-    # Patient Information
-    story.append(Paragraph("Patient Information", header_style))
-    patient_data = [
-        ['Patient Name:', user[0] if user else 'N/A'],
-        ['Email:', user[1] if user else 'N/A'],
-        ['Report Date:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
-        ['Scan ID:', str(scan_id)]
-    ]
-    
-    patient_table = Table(patient_data, colWidths=[2*inch, 3*inch])
-    patient_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(patient_table)
-    story.append(Spacer(1, 20))
-    
-    # Scan Details
-    story.append(Paragraph("Scan Analysis Results", header_style))
-    
-    scan_data = [
-        ['Original Filename:', scan[3]],
-        ['Scan Date:', scan[7]],
-        ['Analysis Result:', scan[4].replace('-', ' ').title()],
-        ['Confidence Level:', f"{scan[5]}%"],
-        ['Defects Detected:', str(scan[6]) if scan[6] else '0'],
-        ['AI Model Version:', 'MedScan AI v2.1'],
-        ['Processing Time:', '< 2 seconds']
-    ]
-    
-    scan_table = Table(scan_data, colWidths=[2*inch, 3*inch])
-    scan_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(scan_table)
-    story.append(Spacer(1, 20))
-    
-    # Analysis Summary
-    story.append(Paragraph("Analysis Summary", header_style))
-    
-    if scan[4] == 'defective':
-        summary_text = f"""
-        <b>DEFECTIVE X-RAY DETECTED</b><br/><br/>
-        Our AI analysis has identified potential abnormalities in the uploaded X-ray image with {scan[5]}% confidence. 
-        {scan[6]} defect location(s) were detected and marked for further review.<br/><br/>
-        <b>Recommended Actions:</b><br/>
-        • Consult with a qualified radiologist for professional interpretation<br/>
-        • Consider additional imaging if recommended by healthcare provider<br/>
-        • Schedule follow-up appointment with treating physician<br/>
-        • Do not delay seeking medical attention if symptoms are present<br/><br/>
-        <b>Important Note:</b> This AI analysis is a diagnostic aid and should not replace professional medical judgment.
-        """
-    else:
-        summary_text = f"""
-        <b>NON-DEFECTIVE X-RAY</b><br/><br/>
-        Our AI analysis indicates no significant abnormalities were detected in the uploaded X-ray image 
-        with {scan[5]}% confidence.<br/><br/>
-        <b>Recommended Actions:</b><br/>
-        • Share results with your healthcare provider during regular consultation<br/>
-        • Continue with routine medical care as advised by your doctor<br/>
-        • Keep this report for your medical records<br/><br/>
-        <b>Important Note:</b> This AI analysis is a diagnostic aid and should not replace professional medical judgment. 
-        Even with normal AI results, follow-up with healthcare providers is recommended for comprehensive care.
-        """
-    
-    story.append(Paragraph(summary_text, styles['Normal']))
-    story.append(Spacer(1, 20))
-    
-    # Disclaimer
-    story.append(Paragraph("Medical Disclaimer", header_style))
-    disclaimer_text = """
-    <b>IMPORTANT MEDICAL DISCLAIMER:</b><br/><br/>
-    This report contains AI-generated analysis results that are intended for informational purposes only 
-    and should not be considered as medical advice, diagnosis, or treatment recommendations. 
-    
-    The MedScan AI system is designed to assist healthcare professionals in the interpretation of medical images 
-    but is not a substitute for professional medical judgment, experience, and training.
-    
-    <b>Please note:</b><br/>
-    • Always consult with qualified healthcare professionals for medical advice<br/>
-    • AI analysis may have false positives or false negatives<br/>
-    • This technology is continuously improving but not perfect<br/>
-    • Emergency cases require immediate professional medical attention<br/><br/>
+    return send_file(image, mimetype='image/jpeg', max_age=86400)
+
+@app.route('/generate_report/<int:scan_id>')
+def generate_report(scan_id):
+    if 'user' not in session:
+        return redirect(url_for('login'))
     
-    <b>For emergencies, contact your local emergency services immediately.</b>
-    """
+    user = session['user']
+    conn = sqlite3.connect('medscan.db')
+    cursor = conn.cursor()
     
-    story.append(Paragraph(disclaimer_text, styles['Normal']))
-    story.append(Spacer(1, 20))
+    # Get scan details, from the archive if it has been moved there
+    scan, month = find_scan(cursor, scan_id, user['id'])
+    conn.close()
     
-    # Footer
-    footer_text = f"""
-    <b>Generated by MedScan AI</b><br/>
-    Advanced X-Ray Analysis System<br/>
-    Report generated on {datetime.now().strftime('%Y-%m-%d at %H:%M:%S')}<br/>
-    © 2023 MedScan AI. All rights reserved.
-    """
-    story.append(Paragraph(footer_text, styles['Normal']))
+    if not scan:
+        return jsonify({'error': 'Scan not found'}), 404
     
-    # Build PDF
-    doc.build(story)
-    buffer.seek(0)
+    # Rendered by the report workers after the analysis; waits if that render is still queued
+    path = report_renderer.wait(scan_id, timeout=app.config['REPORT_WAIT_SECONDS'])
+    if path is None:
+        # Older scans, or a report file that was removed: render it here once
+        preview = scan_derivative(scan[2], month, 'preview')
+        path = report_renderer.render_now(report_payload(
+            scan, user['username'], user['email'], scan_processing_seconds(scan),
+            preview.getvalue() if isinstance(preview, BytesIO) else preview))
     
     filename = f"MedScan_Report_{scan_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
     
     return send_file(
-        buffer,
+        path,
         as_attachment=True,
         download_name=filename,
         mimetype='application/pdf'
@@ -632,42 +1284,27 @@ def admin_panel():
     cursor.execute('SELECT COUNT(*) FROM users')
     total_users = cursor.fetchone()[0]
     
-    cursor.execute('SELECT COUNT(*) FROM scans')
+    cursor.execute(f'SELECT COUNT(*) FROM {ALL_SCAN_RESULTS}')
     total_scans = cursor.fetchone()[0]
     
-    cursor.execute('SELECT COUNT(*) FROM scans WHERE result = "defective"')
+    cursor.execute(f'SELECT COUNT(*) FROM {ALL_SCAN_RESULTS} WHERE result = "defective"')
     defective_scans = cursor.fetchone()[0]
     
-    cursor.execute('SELECT COUNT(*) FROM scans WHERE result = "non-defective"')
+    cursor.execute(f'SELECT COUNT(*) FROM {ALL_SCAN_RESULTS} WHERE result = "non-defective"')
     normal_scans = cursor.fetchone()[0]
     
-    # Get recent users
-    cursor.execute('''
-        SELECT id, username, email, created_at 
-        FROM users 
-        ORDER BY created_at DESC 
-        LIMIT 10
-    ''')
-    recent_users = cursor.fetchall()
-    
-    # Get recent scans
-    cursor.execute('''
-        SELECT s.*, u.username 
-        FROM scans s 
-        JOIN users u ON s.user_id = u.id 
-        ORDER BY s.scan_date DESC 
-        LIMIT 10
-    ''')
-    recent_scans = cursor.fetchall()
+    # Get recent users and scans; the cursors let the page load further rows
+    recent_users, users_cursor = keyset_page(cursor, USERS_QUERY, 'created_at', 'id', limit=10)
+    recent_scans, scans_cursor = keyset_page(cursor, SCANS_QUERY, 's.scan_date', 's.id', limit=10)
     
     # Get scan statistics by month
-    cursor.execute('''
+    cursor.execute(f'''
         SELECT 
             strftime('%Y-%m', scan_date) as month,
             COUNT(*) as total,
             SUM(CASE WHEN result = 'defective' THEN 1 ELSE 0 END) as defective,
             SUM(CASE WHEN result = 'non-defective' THEN 1 ELSE 0 END) as normal
-        FROM scans 
+        FROM {ALL_SCAN_RESULTS} 
         GROUP BY strftime('%Y-%m', scan_date)
         ORDER BY month DESC
         LIMIT 12
@@ -687,37 +1324,96 @@ def admin_panel():
     return render_template('admin.html', 
                          user=session['user'], 
                          stats=stats, 
-                         recent_users=recent_users,
-                         recent_scans=recent_scans,
-                         monthly_stats=monthly_stats)
+                         recent_users=[serialize_user(row) for row in recent_users],
+                         recent_scans=[serialize_scan(row) for row in recent_scans],
+                         users_cursor=users_cursor,
+                         scans_cursor=scans_cursor,
+                         monthly_stats=monthly_stats,
+                         profile_report=request_profiler.report(top=10))
 
-@app.route('/admin/users')
-def admin_users():
+# Listing queries select the keyset columns first, see keyset_page
+USERS_QUERY = 'SELECT created_at, id, username, email, role, scan_count FROM users'
+SCANS_QUERY = '''
+    SELECT s.scan_date, s.id, s.user_id, u.username, s.original_filename,
+           s.result, s.confidence, s.defect_count
+    FROM scans s
+    JOIN users u ON s.user_id = u.id
+'''
+
+def serialize_user(row):
+    return {
+        'id': row[1],
+        'username': row[2],
+        'email': row[3],
+        'created_at': row[0],
+        'role': row[4],
+        'scan_count': row[5]
+    }
+
+def serialize_scan(row):
+    return {
+        'id': row[1],
+        'user_id': row[2],
+        'username': row[3],
+        'original_filename': row[4],
+        'result': row[5],
+        'confidence': row[6],
+        'defect_count': row[7],
+        'scan_date': row[0]
+    }
+
+def admin_listing(query, sort_column, id_column, serialize, key):
+    """Serve one keyset page as JSON, or the full listing as NDJSON with ?format=ndjson"""
     if 'user' not in session or session['user'].get('username') != 'admin':
         return jsonify({'error': 'Access denied'}), 403
     
+    if request.args.get('format') == 'ndjson':
+        return stream_ndjson(f'{query} ORDER BY {sort_column} DESC, {id_column} DESC', serialize)
+    
+    after = None
+    if request.args.get('cursor'):
+        after = decode_cursor(request.args['cursor'])
+        if after is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
     conn = sqlite3.connect('medscan.db')
     cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT u.id, u.username, u.email, u.created_at, u.role,
-               COUNT(s.id) as scan_count
-        FROM users u
-        LEFT JOIN scans s ON u.id = s.user_id
-        GROUP BY u.id
-        ORDER BY u.created_at DESC
-    ''')
-    users = cursor.fetchall()
+    rows, next_cursor = keyset_page(cursor, query, sort_column, id_column, after=after, limit=page_limit())
     conn.close()
     
-    return jsonify([{
-        'id': user[0],
-        'username': user[1], 
-        'email': user[2],
-        'created_at': user[3],
-        'role': user[4],
-        'scan_count': user[5]
-    } for user in users])
+    return jsonify({key: [serialize(row) for row in rows], 'next_cursor': next_cursor})
+
+@app.route('/admin/users')
+def admin_users():
+    return admin_listing(USERS_QUERY, 'created_at', 'id', serialize_user, 'users')
+
+@app.route('/admin/scans')
+def admin_scans():
+    return admin_listing(SCANS_QUERY, 's.scan_date', 's.id', serialize_scan, 'scans')
+
+@app.route('/admin/detector_stats')
+def admin_detector_stats():
+    if 'user' not in session or session['user'].get('username') != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    if not ai_detector:
+        return jsonify({'error': 'AI model not loaded'}), 404
+    return jsonify({'cascade': ai_detector.cascade_stats(), 'config_version': ai_detector.config.version})
+
+@app.route('/admin/profiles')
+def admin_profiles():
+    if not is_admin():
+        return jsonify({'error': 'Access denied'}), 403
+    return jsonify(request_profiler.report(top=request.args.get('top', 20, type=int)))
+
+@app.route('/admin/profiles/<name>')
+def admin_profile_file(name):
+    """Download one request's collapsed stacks, e.g. for flamegraph.pl or speedscope"""
+    if not is_admin():
+        return jsonify({'error': 'Access denied'}), 403
+    path = os.path.join(app.config['PROFILE_FOLDER'], os.path.basename(name))
+    if not name.endswith('.folded') or not os.path.exists(path):
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name)
 
 @app.route('/admin/create_admin', methods=['POST'])
 def create_admin():
@@ -732,7 +1428,7 @@ def create_admin():
         return jsonify({'message': 'Admin user already exists'})
     
     # Create admin user
-    password_hash = generate_password_hash('admin123')
+    password_hash = password_hasher.hash('admin123')
     cursor.execute('''
         INSERT INTO users (username, email, password_hash, role) 
         VALUES (?, ?, ?, ?)
@@ -743,5 +1439,58 @@ def create_admin():
     
     return jsonify({'message': 'Admin user created successfully. Username: admin, Password: admin123'})
 
-if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
+@app.cli.command('backfill-previews')
+@click.option('--overwrite', is_flag=True, help='Rebuild pyramids that already exist')
+def backfill_previews(overwrite):
+    """Build analysis tensors, previews and thumbnails for existing uploads"""
+    built, skipped = backfill_pyramids(app.config['UPLOAD_FOLDER'], overwrite=overwrite)
+    print(f"Pyramids ready for {built} uploads, {skipped} could not be decoded")
+
+@app.cli.command('backfill-phashes')
+def backfill_phashes():
+    """Compute perceptual hashes for scans recorded before hashing was added"""
+    conn = sqlite3.connect('medscan.db')
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, filename FROM scans WHERE phash IS NULL')
+    updated = 0
+    for scan_id, filename in cursor.fetchall():
+        phash = analysis_hash(get_pyramid(filename))
+        if phash is not None:
+            cursor.execute('UPDATE scans SET phash = ? WHERE id = ?', (hash_to_hex(phash), scan_id))
+            updated += 1
+    conn.commit()
+    conn.close()
+    print(f"Computed perceptual hashes for {updated} scans")
+
+@app.cli.command('export-scans')
+def export_scans():
+    """Append scans recorded since the last export to the columnar export"""
+    export = ScanExport(app.config['EXPORT_FOLDER'])
+    conn = sqlite3.connect('medscan.db')
+    exported = export.append(conn)
+    conn.close()
+    manifest = export.manifest()
+    print(f"Exported {exported} scans; {manifest['rows']} rows up to scan {manifest['high_water_mark']}")
+
+@app.cli.command('archive-scans')
+@click.option('--older-than-days', type=int, default=None,
+              help='Archive scans older than this (default: ARCHIVE_AFTER_DAYS)')
+@click.option('--vacuum', is_flag=True, help='Compact the hot database afterwards')
+def archive_scans(older_than_days, vacuum):
+    """Move old scans and their uploads into monthly archive partitions"""
+    days = older_than_days if older_than_days is not None else app.config['ARCHIVE_AFTER_DAYS']
+    # scan_date is stored by SQLite's CURRENT_TIMESTAMP, i.e. UTC
+    before = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    conn = sqlite3.connect('medscan.db')
+    # Export first: the export only reads the hot table, above its high-water mark
+    ScanExport(app.config['EXPORT_FOLDER']).append(conn)
+    # Rendered reports go too; one is rebuilt from the archive if it is downloaded again
+    moved = scan_archive.archive(conn, app.config['UPLOAD_FOLDER'], before,
+                                 related_files=lambda name: list(pyramid_paths(name).values()),
+                                 on_moved=report_renderer.remove)
+    if vacuum and moved:
+        conn.execute('VACUUM')
+    conn.close()
+    for month, count in sorted(moved.items()):
+        print(f"{month}: archived {count} scans")
+    print(f"Archived {sum(moved.values())} scans older than {before}")
\ No newline at end of file
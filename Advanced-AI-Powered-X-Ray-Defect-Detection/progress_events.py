@@ -0,0 +1,170 @@
+# Analysis progress events
+# Short per-job event logs that server-sent event streams wait on without polling
+import json
+import asyncio
+import threading
+import time
+
+
+class StreamLimitError(Exception):
+    """Raised when too many progress streams are already open"""
+
+
+def format_sse(event_id, event, data):
+    """Encode one server-sent event"""
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+class _Job:
+    def __init__(self, lock):
+        self.events = []
+        self.next_id = 1
+        self.finished = False
+        self.updated = time.monotonic()
+        self.changed = threading.Condition(lock)
+        # Callbacks waking listeners that wait on an event loop instead of the condition
+        self.wakers = []
+
+
+class ProgressBroker:
+    """Keeps the recent events of each job and wakes its listeners when one is published
+
+    Jobs are created by whichever side arrives first, so a listener may
+    subscribe before the upload it watches has started. Late or reconnecting
+    listeners replay the events after their last seen id.
+    """
+
+    def __init__(self, max_streams=64, ttl=300, max_events=500):
+        self.ttl = ttl
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._streams = threading.BoundedSemaphore(max_streams)
+
+    def _job(self, key):
+        # Called with the lock held
+        job = self._jobs.get(key)
+        if job is None:
+            job = self._jobs[key] = _Job(self._lock)
+        job.updated = time.monotonic()
+        return job
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, job in self._jobs.items() if job.updated < cutoff]:
+            del self._jobs[key]
+
+    def publish(self, key, event, data):
+        """Append an event to a job's log; a 'done' event ends its streams"""
+        with self._lock:
+            self._expire()
+            job = self._job(key)
+            job.events.append((job.next_id, event, data))
+            job.next_id += 1
+            del job.events[:-self.max_events]
+            if event == 'done':
+                job.finished = True
+            job.changed.notify_all()
+            for wake in job.wakers:
+                wake()
+
+    def wait(self, key, after=0, timeout=15):
+        """Return (events with id > after, finished), blocking up to timeout for new ones"""
+        with self._lock:
+            job = self._job(key)
+            job.changed.wait_for(
+                lambda: job.finished or (job.events and job.events[-1][0] > after), timeout)
+            return [event for event in job.events if event[0] > after], job.finished
+
+    async def wait_async(self, key, after=0, timeout=15):
+        """wait() for coroutines: suspends the calling task rather than blocking a thread"""
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+
+        def wake():
+            # publish() runs on whatever thread produced the event
+            loop.call_soon_threadsafe(woken.set)
+
+        with self._lock:
+            job = self._job(key)
+            if job.finished or (job.events and job.events[-1][0] > after):
+                return [event for event in job.events if event[0] > after], job.finished
+            job.wakers.append(wake)
+        try:
+            await asyncio.wait_for(woken.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                job.wakers.remove(wake)
+        with self._lock:
+            return [event for event in job.events if event[0] > after], job.finished
+
+    def stream(self, key, after=0, lifetime=60, heartbeat=15):
+        """Return an iterable of server-sent events for a job until it is done or lifetime runs out
+
+        Each open stream takes one of max_streams slots until it is closed.
+        Streams end after lifetime seconds so idle listeners don't hold a
+        server thread; EventSource reconnects with Last-Event-ID and resumes.
+        """
+        if not self._streams.acquire(blocking=False):
+            raise StreamLimitError("Too many progress streams open")
+        return _EventStream(self, key, after, lifetime, heartbeat)
+
+    def astream(self, key, after=0, lifetime=60, heartbeat=15):
+        """stream() as an async iterable, for the ASGI front-end"""
+        if not self._streams.acquire(blocking=False):
+            raise StreamLimitError("Too many progress streams open")
+        return _AsyncEventStream(self, key, after, lifetime, heartbeat)
+
+
+class _EventStream:
+    """Response iterable that releases its stream slot when the server closes it"""
+
+    def __init__(self, broker, key, after, lifetime, heartbeat):
+        self.broker = broker
+        self.key = key
+        self.last_id = after
+        self.deadline = time.monotonic() + lifetime
+        self.heartbeat = heartbeat
+        self._released = False
+
+    def __iter__(self):
+        yield 'retry: 2000\n\n'
+        while True:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events, finished = self.broker.wait(self.key, self.last_id, min(self.heartbeat, remaining))
+            if not events and not finished:
+                yield ': keepalive\n\n'
+            for event_id, event, data in events:
+                yield format_sse(event_id, event, data)
+                self.last_id = event_id
+            if finished:
+                return
+
+    def close(self):
+        # Called once by the WSGI server, also when the client disconnects early
+        if not self._released:
+            self._released = True
+            self.broker._streams.release()
+
+
+class _AsyncEventStream(_EventStream):
+    """Async iterable over the same events; the caller closes it to release its slot"""
+
+    async def __aiter__(self):
+        yield 'retry: 2000\n\n'
+        while True:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events, finished = await self.broker.wait_async(self.key, self.last_id, min(self.heartbeat, remaining))
+            if not events and not finished:
+                yield ': keepalive\n\n'
+            for event_id, event, data in events:
+                yield format_sse(event_id, event, data)
+                self.last_id = event_id
+            if finished:
+                return
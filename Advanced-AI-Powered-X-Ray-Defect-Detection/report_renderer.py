@@ -0,0 +1,252 @@
+# PDF report rendering
+# Reports are laid out from a small precomputed payload, in worker processes, and kept on disk
+import os
+import threading
+import multiprocessing
+from io import BytesIO
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib import colors
+
+
+def report_payload(scan, username, email, processing_seconds=None, preview=None):
+    """Everything a report shows, as plain values that pickle cheaply to a worker
+
+    scan is a scans row (SELECT *). preview is the preview JPEG's path, its
+    bytes for an archived scan, or None.
+    """
+    return {
+        'scan_id': scan[0],
+        'original_filename': scan[3],
+        'result': scan[4],
+        'confidence': scan[5],
+        'defect_count': scan[6],
+        'scan_date': scan[7],
+        'username': username,
+        'email': email,
+        'processing_seconds': processing_seconds,
+        'preview': preview,
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def _table(rows):
+    table = Table(rows, colWidths=[2*inch, 3*inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    return table
+
+
+def render_report(payload, path=None):
+    """Lay out a report; writes it to path atomically and returns path, or returns the PDF bytes"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    story = []
+
+    # Custom styles
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=30,
+        textColor=colors.HexColor('#00b4d8'),
+        alignment=1  # Center alignment
+    )
+
+    header_style = ParagraphStyle(
+        'CustomHeader',
+        parent=styles['Heading2'],
+        fontSize=16,
+        spaceAfter=12,
+        textColor=colors.HexColor('#64ffda')
+    )
+
+    # Title
+    story.append(Paragraph("MedScan AI - X-Ray Analysis Report", title_style))
+    story.append(Spacer(1, 20))
+
+    # Patient Information
+    story.append(Paragraph("Patient Information", header_style))
+    story.append(_table([
+        ['Patient Name:', payload['username'] or 'N/A'],
+        ['Email:', payload['email'] or 'N/A'],
+        ['Report Date:', payload['generated_at']],
+        ['Scan ID:', str(payload['scan_id'])]
+    ]))
+    story.append(Spacer(1, 20))
+
+    # Scan Details
+    story.append(Paragraph("Scan Analysis Results", header_style))
+    seconds = payload['processing_seconds']
+    story.append(_table([
+        ['Original Filename:', payload['original_filename']],
+        ['Scan Date:', payload['scan_date']],
+        ['Analysis Result:', payload['result'].replace('-', ' ').title()],
+        ['Confidence Level:', f"{payload['confidence']}%"],
+        ['Defects Detected:', str(payload['defect_count']) if payload['defect_count'] else '0'],
+        ['AI Model Version:', 'MedScan AI v2.1'],
+        ['Processing Time:', f'{seconds:.2f} seconds' if seconds is not None else 'Not recorded']
+    ]))
+    story.append(Spacer(1, 20))
+
+    # X-ray preview, read from the pre-sized derivative rather than the original upload
+    preview = payload['preview']
+    if preview is not None:
+        story.append(Paragraph("X-Ray Image", header_style))
+        story.append(Image(BytesIO(preview) if isinstance(preview, bytes) else preview,
+                           width=4*inch, height=4*inch, kind='proportional'))
+        story.append(Spacer(1, 20))
+
+    # Analysis Summary
+    story.append(Paragraph("Analysis Summary", header_style))
+
+    # Results are stored as 'Defective' / 'Non-Defective'
+    if payload['result'].lower() == 'defective':
+        summary_text = f"""
+        <b>DEFECTIVE X-RAY DETECTED</b><br/><br/>
+        Our AI analysis has identified potential abnormalities in the uploaded X-ray image with {payload['confidence']}% confidence.
+        {payload['defect_count']} defect location(s) were detected and marked for further review.<br/><br/>
+        <b>Recommended Actions:</b><br/>
+        • Consult with a qualified radiologist for professional interpretation<br/>
+        • Consider additional imaging if recommended by healthcare provider<br/>
+        • Schedule follow-up appointment with treating physician<br/>
+        • Do not delay seeking medical attention if symptoms are present<br/><br/>
+        <b>Important Note:</b> This AI analysis is a diagnostic aid and should not replace professional medical judgment.
+        """
+    else:
+        summary_text = f"""
+        <b>NON-DEFECTIVE X-RAY</b><br/><br/>
+        Our AI analysis indicates no significant abnormalities were detected in the uploaded X-ray image
+        with {payload['confidence']}% confidence.<br/><br/>
+        <b>Recommended Actions:</b><br/>
+        • Share results with your healthcare provider during regular consultation<br/>
+        • Continue with routine medical care as advised by your doctor<br/>
+        • Keep this report for your medical records<br/><br/>
+        <b>Important Note:</b> This AI analysis is a diagnostic aid and should not replace professional medical judgment.
+        Even with normal AI results, follow-up with healthcare providers is recommended for comprehensive care.
+        """
+
+    story.append(Paragraph(summary_text, styles['Normal']))
+    story.append(Spacer(1, 20))
+
+    # Disclaimer
+    story.append(Paragraph("Medical Disclaimer", header_style))
+    disclaimer_text = """
+    <b>IMPORTANT MEDICAL DISCLAIMER:</b><br/><br/>
+    This report contains AI-generated analysis results that are intended for informational purposes only
+    and should not be considered as medical advice, diagnosis, or treatment recommendations.
+
+    The MedScan AI system is designed to assist healthcare professionals in the interpretation of medical images
+    but is not a substitute for professional medical judgment, experience, and training.
+
+    <b>Please note:</b><br/>
+    • Always consult with qualified healthcare professionals for medical advice<br/>
+    • AI analysis may have false positives or false negatives<br/>
+    • This technology is continuously improving but not perfect<br/>
+    • Emergency cases require immediate professional medical attention<br/><br/>
+
+    <b>For emergencies, contact your local emergency services immediately.</b>
+    """
+
+    story.append(Paragraph(disclaimer_text, styles['Normal']))
+    story.append(Spacer(1, 20))
+
+    # Footer
+    generated = datetime.strptime(payload['generated_at'], '%Y-%m-%d %H:%M:%S')
+    footer_text = f"""
+    <b>Generated by MedScan AI</b><br/>
+    Advanced X-Ray Analysis System<br/>
+    Report generated on {generated.strftime('%Y-%m-%d at %H:%M:%S')}<br/>
+    © 2023 MedScan AI. All rights reserved.
+    """
+    story.append(Paragraph(footer_text, styles['Normal']))
+
+    # Build PDF
+    doc.build(story)
+    if path is None:
+        return buffer.getvalue()
+
+    # Written beside the target and renamed, so a download never sees a partial file
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(buffer.getbuffer())
+    os.replace(temp_path, path)
+    return path
+
+
+class ReportRenderer:
+    """Renders report payloads to <folder>/<scan_id>.pdf on a pool of worker processes
+
+    Layout is CPU-bound pure Python, so it runs outside the web process
+    instead of holding its GIL. The folder is a cache: a missing file is
+    rendered again on demand by render_now.
+    """
+
+    def __init__(self, folder, max_workers=1):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        # Spawned rather than forked so workers don't inherit the server's threads
+        self._pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def path(self, scan_id):
+        return os.path.join(self.folder, f'{int(scan_id)}.pdf')
+
+    def submit(self, payload):
+        """Queue a report for rendering; returns the future, or None if the pool is unavailable"""
+        scan_id = payload['scan_id']
+        try:
+            future = self._pool.submit(render_report, payload, self.path(scan_id))
+        except RuntimeError as e:
+            print(f"Error queueing report for scan {scan_id}: {e}")
+            return None
+        with self._lock:
+            self._pending[scan_id] = future
+        future.add_done_callback(lambda done: self._finished(scan_id, done))
+        return future
+
+    def _finished(self, scan_id, future):
+        with self._lock:
+            if self._pending.get(scan_id) is future:
+                del self._pending[scan_id]
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error rendering report for scan {scan_id}: {future.exception()}")
+
+    def wait(self, scan_id, timeout=None):
+        """Path of a scan's rendered report, after any queued render of it finishes; None if there is none"""
+        with self._lock:
+            future = self._pending.get(scan_id)
+        if future is not None:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+        path = self.path(scan_id)
+        return path if os.path.exists(path) else None
+
+    def remove(self, scan_ids):
+        """Delete rendered reports, e.g. for scans moved to the archive; render_now rebuilds one if needed"""
+        for scan_id in scan_ids:
+            path = self.path(scan_id)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def render_now(self, payload):
+        """Render in the calling thread, e.g. for a scan whose file was never written or was removed"""
+        return render_report(payload, self.path(payload['scan_id']))
+
+    def shutdown(self):
+        self._pool.shutdown(cancel_futures=True)
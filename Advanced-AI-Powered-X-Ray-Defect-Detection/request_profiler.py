@@ -0,0 +1,166 @@
+# Request profiler
+# Opt-in stack sampling of single requests into collapsed-stack files and a rolling hot-function report
+import os
+import sys
+import time
+import random
+import threading
+from collections import Counter, deque
+from datetime import datetime
+
+
+class _Profile:
+    """Stack samples collected for one request, from its thread and any worker threads running its tasks"""
+
+    def __init__(self, thread_id, label):
+        self.threads = {thread_id}
+        self.label = label
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f'{module}:{code.co_name}'
+
+
+class RequestProfiler:
+    """Samples the stacks of profiled request threads from one background thread
+
+    The sampler thread only runs while at least one request is being
+    profiled, so with sampling off a request pays for one random() call.
+    Each finished profile is written as a collapsed-stack file (one
+    'outer;...;inner count' line per stack, the input format of
+    flamegraph.pl and speedscope) and folded into a report over the last
+    history profiles.
+    """
+
+    def __init__(self, output_folder, sample_rate=0.0, interval=0.005, history=50, max_files=200):
+        self.output_folder = output_folder
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_files = max_files
+        self._active = set()
+        self._recent = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def should_profile(self, requested=False):
+        """True if this request is requested explicitly or picked by the sample rate"""
+        return requested or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self, label):
+        """Begin sampling the calling thread"""
+        profile = _Profile(threading.get_ident(), label)
+        with self._lock:
+            self._active.add(profile)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+                self._sampler.start()
+        return profile
+
+    def run_in_profile(self, profile, func, *args):
+        """Call func(*args), sampling the calling thread into profile while it runs
+
+        For work a profiled request hands to a thread pool; profile may be
+        None when the request is not being profiled.
+        """
+        if profile is None:
+            return func(*args)
+        thread_id = threading.get_ident()
+        with self._lock:
+            profile.threads.add(thread_id)
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                profile.threads.discard(thread_id)
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = [(profile, list(profile.threads)) for profile in self._active]
+            frames = sys._current_frames()
+            for profile, thread_ids in active:
+                for thread_id in thread_ids:
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_name(frame))
+                        frame = frame.f_back
+                    if stack:
+                        profile.stacks[';'.join(reversed(stack))] += 1
+            del frames
+            time.sleep(self.interval)
+
+    def finish(self, profile):
+        """Stop sampling a request; writes its collapsed stacks and returns the file name"""
+        with self._lock:
+            self._active.discard(profile)
+        duration_ms = (time.perf_counter() - profile.started) * 1000
+        samples = sum(profile.stacks.values())
+        if not samples:
+            return None
+
+        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{profile.label}.folded"
+        try:
+            os.makedirs(self.output_folder, exist_ok=True)
+            with open(os.path.join(self.output_folder, filename), 'w') as f:
+                for stack, count in profile.stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+            self._prune_files()
+        except OSError as e:
+            print(f"Error writing profile {filename}: {e}")
+            filename = None
+
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in profile.stacks.items():
+            functions = stack.split(';')
+            self_counts[functions[-1]] += count
+            for function in set(functions):
+                total_counts[function] += count
+        with self._lock:
+            self._recent.append({
+                'file': filename,
+                'label': profile.label,
+                'duration_ms': round(duration_ms, 1),
+                'samples': samples,
+                'self': self_counts,
+                'total': total_counts
+            })
+        return filename
+
+    def _prune_files(self):
+        names = sorted(name for name in os.listdir(self.output_folder) if name.endswith('.folded'))
+        for name in names[:-self.max_files]:
+            os.remove(os.path.join(self.output_folder, name))
+
+    def report(self, top=20):
+        """Hottest functions over the recent profiles, by self samples"""
+        with self._lock:
+            recent = list(self._recent)
+        self_counts, total_counts = Counter(), Counter()
+        for entry in recent:
+            self_counts.update(entry['self'])
+            total_counts.update(entry['total'])
+        samples = sum(entry['samples'] for entry in recent)
+        return {
+            'profiles': len(recent),
+            'samples': samples,
+            'functions': [
+                {
+                    'function': function,
+                    'self_pct': round(100 * count / samples, 1),
+                    'total_pct': round(100 * total_counts[function] / samples, 1)
+                }
+                for function, count in self_counts.most_common(top)
+            ],
+            'recent': [
+                {key: entry[key] for key in ('file', 'label', 'duration_ms', 'samples')}
+                for entry in reversed(recent)
+            ]
+        }
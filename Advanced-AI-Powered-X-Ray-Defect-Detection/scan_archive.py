@@ -0,0 +1,195 @@
+# Scan archive
+# Monthly partitions of old scans: an SQLite database plus a packed, offset-indexed upload file per month
+import os
+import re
+import zlib
+import sqlite3
+from collections import Counter
+
+MONTH_PATTERN = re.compile(r'^\d{4}-\d{2}$')
+# Images that deflate shrinks by less than this fraction are stored as-is
+MIN_COMPRESSION_SAVING = 0.05
+# Scans moved per transaction, so the hot database is never locked for long
+BATCH_SIZE = 500
+
+
+class ScanArchive:
+    """Cold storage for scans older than the retention window
+
+    Each month YYYY-MM gets scans-YYYY-MM.db, holding the scan rows and a
+    files table, and uploads-YYYY-MM.pack, the month's uploads and their
+    derivatives appended back to back. files maps a name to its offset and
+    length in the pack, so reading one image is one index lookup and one
+    seek. The hot database keeps a narrow archived_scans row per scan
+    (id, user, date, result, month) for routing and per-user statistics.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def paths(self, month):
+        """Database and pack file of one month"""
+        if not MONTH_PATTERN.match(month):
+            raise ValueError(f'Invalid archive month {month!r}')
+        return (os.path.join(self.folder, f'scans-{month}.db'),
+                os.path.join(self.folder, f'uploads-{month}.pack'))
+
+    def months(self):
+        """Months that have an archive partition, oldest first"""
+        if not os.path.isdir(self.folder):
+            return []
+        return sorted(name[6:-3] for name in os.listdir(self.folder)
+                      if name.startswith('scans-') and name.endswith('.db') and MONTH_PATTERN.match(name[6:-3]))
+
+    def _connect(self, month):
+        # Read-only, so a lookup for a month that was never archived doesn't create an empty partition
+        db_path = self.paths(month)[0]
+        if not os.path.exists(db_path):
+            return None
+        return sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+
+    def fetch_scans(self, month, scan_ids):
+        """Archived scan rows by id, in the hot table's column order"""
+        if not scan_ids:
+            return {}
+        conn = self._connect(month)
+        if conn is None:
+            return {}
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT * FROM scans WHERE id IN ({", ".join("?" * len(scan_ids))})', list(scan_ids))
+        rows = {row[0]: row for row in cursor.fetchall()}
+        conn.close()
+        return rows
+
+    def read_file(self, month, name):
+        """Contents of an archived upload or derivative, or None if the month has no such file"""
+        conn = self._connect(month)
+        if conn is None:
+            return None
+        cursor = conn.cursor()
+        cursor.execute('SELECT offset, length, compressed FROM files WHERE name = ?', (name,))
+        entry = cursor.fetchone()
+        conn.close()
+        if entry is None:
+            return None
+        offset, length, compressed = entry
+        with open(self.paths(month)[1], 'rb') as pack:
+            pack.seek(offset)
+            blob = pack.read(length)
+        return zlib.decompress(blob) if compressed else blob
+
+    def archive(self, conn, upload_folder, before, related_files=lambda name: [], on_moved=lambda scan_ids: None):
+        """Move scans dated before `before` out of the hot database and upload folder
+
+        conn is a connection to the hot database; related_files(name) lists
+        the derivative file names stored beside an upload. on_moved(scan_ids)
+        is called after each batch is committed, e.g. to drop other hot
+        copies of those scans. Returns a Counter of scans moved per month.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT strftime('%Y-%m', scan_date) FROM scans WHERE scan_date < ?", (before,))
+        moved = Counter()
+        for month in sorted(row[0] for row in cursor.fetchall() if row[0]):
+            moved[month] = self._archive_month(conn, upload_folder, month, before, related_files, on_moved)
+        return moved
+
+    def _archive_month(self, conn, upload_folder, month, before, related_files, on_moved):
+        db_path, pack_path = self.paths(month)
+        conn.commit()
+        conn.execute('ATTACH DATABASE ? AS archive', (db_path,))
+        try:
+            self._ensure_schema(conn)
+            cursor = conn.cursor()
+            columns = ', '.join(self._columns(cursor, 'main'))
+            moved = 0
+            while True:
+                cursor.execute('''
+                    SELECT id, user_id, filename, scan_date, result FROM main.scans
+                    WHERE scan_date < ? AND strftime('%Y-%m', scan_date) = ?
+                    ORDER BY id LIMIT ?
+                ''', (before, month, BATCH_SIZE))
+                rows = cursor.fetchall()
+                if not rows:
+                    return moved
+
+                # Pack first: a crash before the commit below only leaves unreferenced bytes in the pack
+                names = []
+                for row in rows:
+                    names.append(row[2])
+                    names.extend(related_files(row[2]))
+                entries = self._pack(pack_path, upload_folder, names)
+
+                placeholders = ', '.join('?' * len(rows))
+                scan_ids = [row[0] for row in rows]
+                cursor.executemany('INSERT OR REPLACE INTO archive.files VALUES (?, ?, ?, ?, ?)', entries)
+                cursor.execute(f'''
+                    INSERT OR REPLACE INTO archive.scans ({columns})
+                    SELECT {columns} FROM main.scans WHERE id IN ({placeholders})
+                ''', scan_ids)
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO main.archived_scans (id, user_id, scan_date, result, month)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [(row[0], row[1], row[3], row[4], month) for row in rows])
+                cursor.execute(f'DELETE FROM main.scans WHERE id IN ({placeholders})', scan_ids)
+                # Archived scans still count towards users.scan_count, undo the delete trigger
+                for user_id, count in Counter(row[1] for row in rows).items():
+                    cursor.execute('UPDATE users SET scan_count = scan_count + ? WHERE id = ?', (count, user_id))
+                conn.commit()
+
+                # Only remove hot files once the archive copy is committed
+                for name, *_ in entries:
+                    path = os.path.join(upload_folder, name)
+                    if os.path.exists(path):
+                        os.remove(path)
+                on_moved(scan_ids)
+                moved += len(rows)
+        finally:
+            conn.rollback()
+            conn.execute('DETACH DATABASE archive')
+
+    def _columns(self, cursor, schema):
+        cursor.execute(f'PRAGMA {schema}.table_info(scans)')
+        return [row[1] for row in cursor.fetchall()]
+
+    def _ensure_schema(self, conn):
+        cursor = conn.cursor()
+        cursor.execute('CREATE TABLE IF NOT EXISTS archive.scans AS SELECT * FROM main.scans WHERE 0')
+        # Hot columns added since the partition was created
+        existing = set(self._columns(cursor, 'archive'))
+        cursor.execute('PRAGMA main.table_info(scans)')
+        for _, name, column_type, *_ in cursor.fetchall():
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE archive.scans ADD COLUMN {name} {column_type}')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_archive_scans_id ON scans (id)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive.files (
+                name TEXT PRIMARY KEY,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                compressed INTEGER NOT NULL
+            )
+        ''')
+        conn.commit()
+
+    def _pack(self, pack_path, upload_folder, names):
+        """Append files to a month's pack; returns (name, offset, length, size, compressed) entries"""
+        entries = []
+        with open(pack_path, 'ab') as pack:
+            offset = pack.seek(0, os.SEEK_END)
+            for name in names:
+                try:
+                    with open(os.path.join(upload_folder, name), 'rb') as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    continue
+                packed = zlib.compress(data, 6)
+                compressed = len(packed) <= len(data) * (1 - MIN_COMPRESSION_SAVING)
+                blob = packed if compressed else data
+                pack.write(blob)
+                entries.append((name, offset, len(blob), len(data), int(compressed)))
+                offset += len(blob)
+            pack.flush()
+            os.fsync(pack.fileno())
+        return entries
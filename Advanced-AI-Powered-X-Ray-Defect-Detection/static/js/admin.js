@@ -0,0 +1,217 @@
+// Page data rendered by the server into #admin-data
+const adminData = JSON.parse(document.getElementById('admin-data').textContent);
+
+// Initialize particles
+particlesJS("particles-js", {
+    particles: {
+        number: { value: 30, density: { enable: true, value_area: 800 } },
+        color: { value: "#00b4d8" },
+        shape: { type: "circle" },
+        opacity: { value: 0.1, random: true },
+        size: { value: 2, random: true },
+        line_linked: {
+            enable: true,
+            distance: 150,
+            color: "#64ffda",
+            opacity: 0.05,
+            width: 1
+        },
+        move: {
+            enable: true,
+            speed: 1,
+            direction: "none",
+            random: true,
+            straight: false,
+            out_mode: "out",
+            bounce: false
+        }
+    },
+    interactivity: {
+        detect_on: "canvas",
+        events: {
+            onhover: { enable: true, mode: "grab" },
+            onclick: { enable: true, mode: "push" },
+            resize: true
+        },
+        modes: {
+            grab: { distance: 140, line_linked: { opacity: 0.2 } },
+            push: { particles_nb: 1 }
+        }
+    },
+    retina_detect: true
+});
+
+// Initialize charts
+const resultsCtx = document.getElementById('resultsChart').getContext('2d');
+const trendsCtx = document.getElementById('trendsChart').getContext('2d');
+
+// Results pie chart
+new Chart(resultsCtx, {
+    type: 'doughnut',
+    data: {
+        labels: ['Normal Scans', 'Defective Scans'],
+        datasets: [{
+            data: [adminData.normalScans, adminData.defectiveScans],
+            backgroundColor: ['#4caf50', '#f44336'],
+            borderWidth: 2,
+            borderColor: '#0a192f'
+        }]
+    },
+    options: {
+        responsive: true,
+        plugins: {
+            legend: {
+                labels: {
+                    color: '#ccd6f6'
+                }
+            }
+        }
+    }
+});
+
+// Monthly trends chart
+const monthlyData = adminData.monthlyStats;
+const months = monthlyData.map(item => item[0]);
+const totalScans = monthlyData.map(item => item[1]);
+const defectiveScans = monthlyData.map(item => item[2]);
+
+new Chart(trendsCtx, {
+    type: 'line',
+    data: {
+        labels: months.reverse(),
+        datasets: [{
+            label: 'Total Scans',
+            data: totalScans.reverse(),
+            borderColor: '#00b4d8',
+            backgroundColor: 'rgba(0, 180, 216, 0.1)',
+            tension: 0.4
+        }, {
+            label: 'Defective Scans',
+            data: defectiveScans.reverse(),
+            borderColor: '#f44336',
+            backgroundColor: 'rgba(244, 67, 54, 0.1)',
+            tension: 0.4
+        }]
+    },
+    options: {
+        responsive: true,
+        scales: {
+            y: {
+                ticks: {
+                    color: '#ccd6f6'
+                },
+                grid: {
+                    color: 'rgba(100, 255, 218, 0.1)'
+                }
+            },
+            x: {
+                ticks: {
+                    color: '#ccd6f6'
+                },
+                grid: {
+                    color: 'rgba(100, 255, 218, 0.1)'
+                }
+            }
+        },
+        plugins: {
+            legend: {
+                labels: {
+                    color: '#ccd6f6'
+                }
+            }
+        }
+    }
+});
+
+// Admin functions
+function refreshData() {
+    window.location.reload();
+}
+
+function badgeCell(className, text) {
+    const cell = document.createElement('td');
+    const badge = document.createElement('span');
+    badge.className = className;
+    badge.textContent = text;
+    cell.appendChild(badge);
+    return cell;
+}
+
+function textCell(text) {
+    const cell = document.createElement('td');
+    cell.textContent = text;
+    return cell;
+}
+
+function buildRow(key, item) {
+    const row = document.createElement('tr');
+    const date = (key === 'users' ? item.created_at : item.scan_date) || '';
+    if (key === 'users') {
+        const role = item.role || 'user';
+        row.append(textCell(item.username), textCell(item.email),
+                   badgeCell('role-badge ' + role, role), textCell(date.split(' ')[0] || 'N/A'));
+    } else {
+        const label = item.result.replace('-', ' ').replace(/\b\w/g, c => c.toUpperCase());
+        row.append(textCell(item.username), badgeCell('result-badge ' + item.result, label),
+                   textCell(item.confidence + '%'), textCell(date.split(' ')[0] || 'N/A'));
+    }
+    return row;
+}
+
+// Fetch the next keyset page and append it to the table
+async function loadMore(button) {
+    button.disabled = true;
+    try {
+        const params = new URLSearchParams({ limit: 10, cursor: button.dataset.cursor });
+        const response = await fetch(`${button.dataset.endpoint}?${params}`);
+        if (!response.ok) throw new Error('Request failed');
+        const page = await response.json();
+        const body = document.getElementById(button.dataset.target);
+        page[button.dataset.key].forEach(item => body.appendChild(buildRow(button.dataset.key, item)));
+        if (page.next_cursor) {
+            button.dataset.cursor = page.next_cursor;
+        } else {
+            button.remove();
+        }
+    } catch (error) {
+        alert('Failed to load more rows');
+    } finally {
+        button.disabled = false;
+    }
+}
+
+function exportAnalytics() {
+    alert('Analytics export functionality will be implemented soon!');
+}
+
+function clearOldData() {
+    if (confirm('Are you sure you want to clear old data? This action cannot be undone.')) {
+        alert('Clear old data functionality will be implemented soon!');
+    }
+}
+
+// Theme toggle functionality
+const themeToggle = document.getElementById('themeToggle');
+const themeIcon = document.getElementById('themeIcon');
+const body = document.body;
+
+// Load saved theme or default to dark
+const savedTheme = localStorage.getItem('theme') || 'dark';
+setTheme(savedTheme);
+
+themeToggle.addEventListener('click', function() {
+    const currentTheme = body.getAttribute('data-theme') || 'dark';
+    const newTheme = currentTheme === 'dark' ? 'light' : 'dark';
+    setTheme(newTheme);
+    localStorage.setItem('theme', newTheme);
+});
+
+function setTheme(theme) {
+    if (theme === 'light') {
+        body.setAttribute('data-theme', 'light');
+        themeIcon.className = 'fas fa-moon';
+    } else {
+        body.removeAttribute('data-theme');
+        themeIcon.className = 'fas fa-sun';
+    }
+}
@@ -0,0 +1,83 @@
+// Initialize particles
+particlesJS("particles-js", {
+    particles: {
+        number: { value: 50, density: { enable: true, value_area: 800 } },
+        color: { value: "#00b4d8" },
+        shape: { type: "circle" },
+        opacity: { value: 0.1, random: true },
+        size: { value: 2, random: true },
+        line_linked: {
+            enable: true,
+            distance: 150,
+            color: "#64ffda",
+            opacity: 0.05,
+            width: 1
+        },
+        move: {
+            enable: true,
+            speed: 1,
+            direction: "none",
+            random: true,
+            straight: false,
+            out_mode: "out",
+            bounce: false
+        }
+    },
+    interactivity: {
+        detect_on: "canvas",
+        events: {
+            onhover: { enable: true, mode: "grab" },
+            onclick: { enable: true, mode: "push" },
+            resize: true
+        },
+        modes: {
+            grab: { distance: 140, line_linked: { opacity: 0.2 } },
+            push: { particles_nb: 1 }
+        }
+    },
+    retina_detect: true
+});
+
+function exportReports() {
+    // Get all scan IDs and generate a comprehensive report
+    const scanRows = document.querySelectorAll('.scans-table tbody tr');
+    if (scanRows.length === 0) {
+        alert('No scans available to export.');
+        return;
+    }
+
+    // For now, redirect to the first scan's report
+    // In future, could implement bulk export
+    const firstReportLink = document.querySelector('a[href*="generate_report"]');
+    if (firstReportLink) {
+        window.open(firstReportLink.href, '_blank');
+    } else {
+        alert('No reports available to export.');
+    }
+}
+
+// Theme toggle functionality
+const themeToggle = document.getElementById('themeToggle');
+const themeIcon = document.getElementById('themeIcon');
+const body = document.body;
+
+// Load saved theme or default to dark
+const savedTheme = localStorage.getItem('theme') || 'dark';
+setTheme(savedTheme);
+
+themeToggle.addEventListener('click', function() {
+    const currentTheme = body.getAttribute('data-theme') || 'dark';
+    const newTheme = currentTheme === 'dark' ? 'light' : 'dark';
+    setTheme(newTheme);
+    localStorage.setItem('theme', newTheme);
+});
+
+function setTheme(theme) {
+    if (theme === 'light') {
+        body.setAttribute('data-theme', 'light');
+        themeIcon.className = 'fas fa-moon';
+    } else {
+        body.removeAttribute('data-theme');
+        themeIcon.className = 'fas fa-sun';
+    }
+}
@@ -117,21 +117,32 @@ function showAnalysisResult(data) {
     );
 }
 
+// Object URL of the local file shown until the server preview is ready
+let localPreviewUrl = null;
+
+function showPreview(src) {
+    if (localPreviewUrl && src !== localPreviewUrl) {
+        URL.revokeObjectURL(localPreviewUrl);
+        localPreviewUrl = null;
+    }
+    xrayImage.src = src;
+    xrayImage.style.display = 'block';
+    document.querySelector('.placeholder-text').style.display = 'none';
+}
+
 // Handle file selection
 fileInput.addEventListener('change', async function(e) {
     if (this.files && this.files[0]) {
-        const reader = new FileReader();
-
-        reader.onload = function(e) {
-            xrayImage.src = e.target.result;
-            xrayImage.style.display = 'block';
-            document.querySelector('.placeholder-text').style.display = 'none';
-        };
-
-        reader.readAsDataURL(this.files[0]);
+        // Show the file directly instead of base64-encoding it into a data URL
+        localPreviewUrl = URL.createObjectURL(this.files[0]);
+        showPreview(localPreviewUrl);
 
-        // Send to backend for real analysis
-        await analyzeWithBackend(this.files[0]);
+        // Send to backend for real analysis; several files go up as one batch
+        if (this.files.length > 1) {
+            await analyzeBatchWithBackend(Array.from(this.files));
+        } else {
+            await analyzeWithBackend(this.files[0]);
+        }
     }
 });
 
@@ -159,7 +170,37 @@ dropZone.addEventListener('drop', function(e) {
     }
 });
 
+// Stage labels for server-sent progress events
+const PROGRESS_LABELS = {
+    received: 'Upload received',
+    decoded: 'Image decoded',
+    features: 'Features extracted',
+    scored: 'Result scored',
+    saved: 'Scan saved'
+};
+
+function newJobId() {
+    return crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Listen for a job's progress events; ready resolves once connected (or failed) so the upload can start
+function watchProgress(jobId, onProgress) {
+    const source = new EventSource(`/analyze/progress/${jobId}`);
+    source.addEventListener('progress', e => onProgress(JSON.parse(e.data)));
+    source.addEventListener('done', () => source.close());
+    const ready = new Promise(resolve => {
+        source.addEventListener('open', resolve, { once: true });
+        source.addEventListener('error', resolve, { once: true });
+        setTimeout(resolve, 1000);
+    });
+    return { source, ready };
+}
+
 async function analyzeWithBackend(file) {
+    const jobId = newJobId();
+    const progress = watchProgress(jobId, event => {
+        confidence.textContent = `${PROGRESS_LABELS[event.stage] || event.stage}...`;
+    });
     try {
         // Clear previous markers
         defectOverlay.innerHTML = '';
@@ -171,7 +212,8 @@ async function analyzeWithBackend(file) {
         const formData = new FormData();
         formData.append('file', file);
 
-        const response = await fetch('/analyze', {
+        await progress.ready;
+        const response = await fetch(`/analyze?job=${jobId}`, {
             method: 'POST',
             body: formData
         });
@@ -180,6 +222,10 @@ async function analyzeWithBackend(file) {
 
         const data = await response.json();
         globalThis.latestAnalysisResult = data;
+        // Swap to the downsized server preview generated at ingest
+        if (data.preview_url) {
+            showPreview(data.preview_url);
+        }
         // Hide result until button is clicked
         resultValue.textContent = 'Click "Analysis Result" to view';
         resultValue.className = 'result-value';
@@ -190,6 +236,90 @@ async function analyzeWithBackend(file) {
         resultValue.textContent = 'Analysis error';
         resultValue.className = 'result-value defective';
         confidence.textContent = 'Please try again with a different image';
+    } finally {
+        progress.source.close();
+    }
+}
+
+// Read a newline-delimited JSON response, calling onMessage for each line as it arrives
+async function readNdjson(response, onMessage) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onMessage(JSON.parse(line)));
+        if (done) break;
+    }
+    if (buffer.trim()) onMessage(JSON.parse(buffer));
+}
+
+async function analyzeBatchWithBackend(files) {
+    const jobId = newJobId();
+    let completed = 0;
+    const progress = watchProgress(jobId, event => {
+        const file = files[event.index];
+        const label = PROGRESS_LABELS[event.stage] || event.stage;
+        confidence.textContent = file
+            ? `${completed} of ${files.length} complete - ${file.name}: ${label}`
+            : `${completed} of ${files.length} complete - ${label}`;
+    });
+    try {
+        defectOverlay.innerHTML = '';
+
+        resultValue.textContent = `Analyzing ${files.length} X-rays...`;
+        resultValue.className = 'result-value';
+        confidence.textContent = `0 of ${files.length} complete`;
+
+        const formData = new FormData();
+        files.forEach(file => formData.append('files', file));
+
+        await progress.ready;
+        const response = await fetch(`/analyze/batch?job=${jobId}`, {
+            method: 'POST',
+            body: formData
+        });
+
+        if (!response.ok) throw new Error('Analysis failed');
+
+        const results = [];
+        let failed = 0;
+        let summary = null;
+        await readNdjson(response, message => {
+            if (message.type === 'result' || message.type === 'error') {
+                if (message.type === 'result') results.push(message);
+                else failed += 1;
+                completed = results.length + failed;
+                confidence.textContent = `${completed} of ${files.length} complete`;
+            } else if (message.type === 'summary') {
+                summary = message;
+            }
+        });
+
+        results.sort((a, b) => a.index - b.index);
+        globalThis.latestBatchResults = results;
+        globalThis.latestAnalysisResult = results[0] || null;
+
+        const firstScan = summary && summary.scans && summary.scans.find(scan => scan.index === 0);
+        if (firstScan && firstScan.preview_url) {
+            showPreview(firstScan.preview_url);
+        }
+
+        resultValue.textContent = summary
+            ? `${summary.defective} of ${summary.total} defective` + (summary.failed ? `, ${summary.failed} failed` : '')
+            : 'Batch incomplete';
+        resultValue.className = 'result-value';
+        confidence.textContent = 'Click "Analysis Result" to view the first X-ray';
+
+    } catch (err) {
+        resultValue.textContent = 'Analysis error';
+        resultValue.className = 'result-value defective';
+        confidence.textContent = 'Please try again with different images';
+    } finally {
+        progress.source.close();
     }
 }
 
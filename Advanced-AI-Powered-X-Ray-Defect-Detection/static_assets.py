@@ -0,0 +1,138 @@
+# Static asset layer
+# Content-hash fingerprinted URLs, precompressed variants and cached template fragments
+import os
+import gzip
+import hashlib
+import mimetypes
+import threading
+from collections import namedtuple
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# Below this size the encoding headers cost about as much as they save
+MIN_COMPRESS_BYTES = 512
+
+Asset = namedtuple('Asset', ['path', 'url_path', 'etag', 'mimetype', 'variants'])
+
+
+def _fingerprinted(path, digest):
+    base, ext = os.path.splitext(path)
+    return f'{base}.{digest}{ext}'
+
+
+class AssetManifest:
+    """Fingerprints and precompresses every file under a static folder
+
+    Files are read once; each gets a URL containing the first 12 hex digits
+    of its SHA-256, so the URL changes whenever the content does and
+    responses can be cached forever. gzip and (when the brotli package is
+    installed) brotli variants are built up front and kept in memory.
+    With auto_reload, changed files are picked up on the next url() call.
+    """
+
+    def __init__(self, folder, url_prefix='/assets', auto_reload=False):
+        self.folder = folder
+        self.url_prefix = url_prefix.rstrip('/')
+        self.auto_reload = auto_reload
+        self._lock = threading.Lock()
+        self._assets = {}
+        self._by_url_path = {}
+        self._mtimes = {}
+        self.version = ''
+        self.refresh()
+
+    def _scan(self):
+        mtimes = {}
+        for root, dirs, files in os.walk(self.folder):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            for name in files:
+                if not name.startswith('.'):
+                    full_path = os.path.join(root, name)
+                    path = os.path.relpath(full_path, self.folder).replace(os.sep, '/')
+                    mtimes[path] = os.stat(full_path).st_mtime_ns
+        return mtimes
+
+    def _build(self, path):
+        with open(os.path.join(self.folder, path), 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        variants = {'identity': content}
+        if len(content) >= MIN_COMPRESS_BYTES and mimetype.startswith(COMPRESSIBLE_TYPES):
+            variants['gzip'] = gzip.compress(content, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants['br'] = brotli.compress(content, quality=11)
+        return Asset(path, _fingerprinted(path, digest), digest, mimetype, variants)
+
+    def refresh(self):
+        """Rebuild entries for files added or changed since the last scan"""
+        mtimes = self._scan()
+        with self._lock:
+            if mtimes == self._mtimes:
+                return False
+            assets = {path: asset for path, asset in self._assets.items()
+                      if path in mtimes and mtimes[path] == self._mtimes.get(path)}
+            for path in mtimes:
+                if path not in assets:
+                    assets[path] = self._build(path)
+            self._assets = assets
+            self._by_url_path = {asset.url_path: asset for asset in assets.values()}
+            self._mtimes = mtimes
+            self.version = hashlib.sha256(
+                ''.join(sorted(asset.etag for asset in assets.values())).encode('ascii')).hexdigest()[:12]
+            return True
+
+    def url(self, path):
+        """Fingerprinted URL for a file under the static folder"""
+        if self.auto_reload:
+            self.refresh()
+        asset = self._assets.get(path)
+        if asset is None:
+            raise KeyError(f'Unknown static asset {path!r}')
+        return f'{self.url_prefix}/{asset.url_path}'
+
+    def lookup(self, url_path):
+        """Asset served at a fingerprinted path, or None for unknown or outdated fingerprints"""
+        return self._by_url_path.get(url_path)
+
+    def total_bytes(self, encoding='identity'):
+        """Size of all assets in the given encoding, falling back to identity"""
+        return sum(len(asset.variants.get(encoding, asset.variants['identity']))
+                   for asset in self._assets.values())
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja tag {% cache 'name' %}...{% endcache %} rendering a fragment once per process
+
+    Only wrap markup that is the same for every visitor. The key includes
+    the template name and the asset manifest version, so fragments that
+    embed asset URLs are re-rendered when assets change.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache={}, fragment_cache_enabled=True, fragment_cache_version='')
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression(), nodes.Const(parser.name)]
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_cached', args), [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, name, template_name, caller):
+        environment = self.environment
+        if not environment.fragment_cache_enabled:
+            return caller()
+        key = (template_name, name, environment.fragment_cache_version)
+        fragment = environment.fragment_cache.get(key)
+        if fragment is None:
+            fragment = environment.fragment_cache[key] = caller()
+        return fragment
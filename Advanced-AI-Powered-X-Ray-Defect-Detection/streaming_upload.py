@@ -0,0 +1,237 @@
+# Streaming upload receiver
+# Parses multipart bodies incrementally so files go to disk chunk by chunk and
+# bad uploads are rejected before the whole body has arrived
+import os
+import hashlib
+import tempfile
+from collections import namedtuple
+from datetime import datetime
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, File, Field, Data, Epilogue, NeedData
+from werkzeug.utils import secure_filename
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 132  # DICOM files carry 'DICM' after a 128-byte preamble
+
+# Formats each allowed extension must actually contain
+EXTENSION_FORMATS = {
+    'png': 'png',
+    'jpg': 'jpeg',
+    'jpeg': 'jpeg',
+    'dcm': 'dicom',
+    'dicom': 'dicom'
+}
+
+UploadedFile = namedtuple('UploadedFile', ['field', 'original_filename', 'filename', 'path', 'size', 'sha256', 'format'])
+
+
+class UploadRejected(Exception):
+    """Raised to abort an upload; carries the HTTP status to respond with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def sniff_format(head):
+    """Identify an image format from its leading bytes"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[128:132] == b'DICM':
+        return 'dicom'
+    return None
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def _final_path(upload_folder, original_filename):
+    """Timestamped name for a finished upload, made unique within the folder"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
+    base, ext = os.path.splitext(secure_filename(original_filename))
+    filename = f'{timestamp}{base}{ext}'
+    counter = 1
+    while os.path.exists(os.path.join(upload_folder, filename)):
+        filename = f'{timestamp}{base}_{counter}{ext}'
+        counter += 1
+    return filename, os.path.join(upload_folder, filename)
+
+
+class _FileWriter:
+    """Writes one file part to a temporary file while hashing and sniffing it"""
+
+    def __init__(self, field, original_filename, upload_folder, max_file_bytes):
+        self.field = field
+        self.original_filename = original_filename
+        self.upload_folder = upload_folder
+        self.max_file_bytes = max_file_bytes
+        self.expected_format = EXTENSION_FORMATS[_extension(original_filename)]
+        self.sha256 = hashlib.sha256()
+        self.head = b''
+        self.format = None
+        self.size = 0
+        fd, self.temp_path = tempfile.mkstemp(dir=upload_folder, prefix='.incoming-', suffix='.part')
+        self.handle = os.fdopen(fd, 'wb')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_file_bytes:
+            raise UploadRejected(f'{self.original_filename} exceeds the maximum file size', 413)
+
+        if self.format is None:
+            self.head += data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES or self.head[:3] == b'\xff\xd8\xff' or self.head[:8] == b'\x89PNG\r\n\x1a\n':
+                self._check_format()
+
+        self.sha256.update(data)
+        self.handle.write(data)
+
+    def _check_format(self):
+        self.format = sniff_format(self.head)
+        if self.format != self.expected_format:
+            raise UploadRejected(f'{self.original_filename} is not a valid {self.expected_format.upper()} file', 415)
+
+    def finish(self):
+        self.handle.close()
+        if self.format is None:
+            # Short file: never reached the sniff length
+            self._check_format()
+        filename, path = _final_path(self.upload_folder, self.original_filename)
+        os.replace(self.temp_path, path)
+        return UploadedFile(self.field, self.original_filename, filename, path,
+                            self.size, self.sha256.hexdigest(), self.format)
+
+    def discard(self):
+        self.handle.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class MultipartReceiver:
+    """Parses a multipart body pushed to it chunk by chunk, writing file parts to disk
+
+    feed() returns the files each chunk completed, so callers can pull the
+    body from a blocking stream (iter_uploads) or from ASGI receive events
+    alike. Raises UploadRejected as soon as a limit is exceeded, a filename
+    has a disallowed extension or the leading bytes don't match the
+    extension. on_chunk(byte_count) is called for every chunk, e.g. to
+    charge quotas.
+    """
+
+    def __init__(self, content_type, upload_folder, max_request_bytes, max_file_bytes=None,
+                 allowed_extensions=EXTENSION_FORMATS, fields=('file',), max_files=1, on_chunk=None):
+        mimetype, options = parse_options_header(content_type or '')
+        boundary = options.get('boundary')
+        if mimetype != 'multipart/form-data' or not boundary:
+            raise UploadRejected('Expected a multipart/form-data upload')
+
+        # The decoder applies this limit to its unparsed buffer, which holds one slice of a chunk
+        # plus whatever it kept back from the last one while looking for a boundary
+        self.decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=CHUNK_SIZE + 64 * 1024)
+        self.upload_folder = upload_folder
+        self.max_request_bytes = max_request_bytes
+        self.max_file_bytes = max_file_bytes or max_request_bytes
+        self.allowed_extensions = allowed_extensions
+        self.fields = fields
+        self.max_files = max_files
+        self.on_chunk = on_chunk
+        self.writer = None
+        self.received = 0
+        self.files = 0
+        self.complete = False
+
+    def feed(self, chunk):
+        """Process the next chunk of the body, b'' at its end; returns the files it completed
+
+        Files already returned belong to the caller, who removes them if a
+        later chunk is rejected.
+        """
+        self.received += len(chunk)
+        if self.received > self.max_request_bytes:
+            raise UploadRejected('Upload exceeds the maximum request size', 413)
+        if chunk and self.on_chunk:
+            self.on_chunk(len(chunk))
+        completed = []
+        try:
+            if chunk:
+                # Fed in slices, so the decoder's buffer stays within its limit however large
+                # the pieces the server hands over (ASGI body messages have no fixed size)
+                view = memoryview(chunk)
+                for start in range(0, len(view), CHUNK_SIZE):
+                    event = self._decode(view[start:start + CHUNK_SIZE], completed)
+            else:
+                event = self._decode(None, completed)
+
+            if isinstance(event, Epilogue):
+                self.complete = True
+            elif not chunk:
+                raise UploadRejected('Upload ended before the request body was complete')
+        except Exception:
+            # Files finished by this chunk were never handed to the caller, so nobody else can remove them
+            for upload in completed:
+                if os.path.exists(upload.path):
+                    os.remove(upload.path)
+            raise
+        return completed
+
+    def _decode(self, data, completed):
+        """Pass data (None at the end of the body) to the decoder and handle the events it produces"""
+        try:
+            self.decoder.receive_data(data)
+            return self._parse_events(completed)
+        except (ValueError, RequestEntityTooLarge) as e:
+            # The decoder's errors for a malformed body: ValueError e.g. for a part without a
+            # Content-Disposition header, its buffer limit when the boundary never turns up
+            raise UploadRejected('Malformed multipart body', 400) from e
+
+    def _parse_events(self, completed):
+        """Handle the decoder's pending events, appending finished files; returns the last event"""
+        event = self.decoder.next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, File):
+                self.writer = None
+                if event.name in self.fields:
+                    if not event.filename:
+                        raise UploadRejected('No selected file')
+                    extension = _extension(event.filename)
+                    if extension not in self.allowed_extensions or extension not in EXTENSION_FORMATS:
+                        raise UploadRejected('Invalid file type')
+                    self.files += 1
+                    if self.files > self.max_files:
+                        raise UploadRejected(f'At most {self.max_files} file(s) per request', 413)
+                    self.writer = _FileWriter(event.name, event.filename, self.upload_folder, self.max_file_bytes)
+            elif isinstance(event, Field):
+                self.writer = None
+            elif isinstance(event, Data) and self.writer is not None:
+                self.writer.write(event.data)
+                if not event.more_data:
+                    completed.append(self.writer.finish())
+                    self.writer = None
+            event = self.decoder.next_event()
+        return event
+
+    def finish(self):
+        """Check the finished body contained a file"""
+        if self.files == 0:
+            raise UploadRejected('No file part')
+
+    def discard(self):
+        """Remove a partly written file after an error or disconnect"""
+        if self.writer is not None:
+            self.writer.discard()
+            self.writer = None
+
+
+def iter_uploads(stream, receiver):
+    """Feed a blocking stream to a MultipartReceiver, yielding each file as soon as it is on disk"""
+    try:
+        while not receiver.complete:
+            yield from receiver.feed(stream.read(CHUNK_SIZE))
+    finally:
+        receiver.discard()
+    receiver.finish()